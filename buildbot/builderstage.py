@@ -20,6 +20,7 @@ except ImportError:
 from chromite.buildbot import cbuildbot_config
 from chromite.buildbot import cbuildbot_results as results_lib
 from chromite.buildbot import portage_utilities
+from chromite.lib import cgroups
 from chromite.lib import cros_build_lib
 
 
@@ -262,11 +263,15 @@ class BuilderStage(object):
     result = results_lib.Results.SUCCESS
     description = None
 
+    # Measure the resources used by the stage in its own cgroup.
+    meter = cgroups.ResourceMeter(self.name)
+
     sys.stdout.flush()
     sys.stderr.flush()
     self._Begin()
     try:
-      self._PerformStage()
+      with meter:
+        self._PerformStage()
     except SystemExit as e:
       if e.code != 0:
         result, description = self._HandleStageException(e)
@@ -282,7 +287,7 @@ class BuilderStage(object):
     finally:
       elapsed_time = time.time() - start_time
       results_lib.Results.Record(self.name, result, description,
-                                 time=elapsed_time)
+                                 time=elapsed_time, usage=meter.usage)
       self._Finish()
       sys.stdout.flush()
       sys.stderr.flush()
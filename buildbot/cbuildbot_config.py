@@ -441,6 +441,21 @@ _settings = dict(
 )
 
 
+def _CopyConfig(value):
+  """Return a deep copy of a config, or of a value in it.
+
+  Configs only hold dicts, lists, tuples and immutable scalars, so this is
+  equivalent to copy.deepcopy, but avoids its bookkeeping for every value.
+  """
+  if isinstance(value, dict):
+    return type(value)((k, _CopyConfig(v)) for k, v in value.iteritems())
+  elif isinstance(value, list):
+    return [_CopyConfig(x) for x in value]
+  elif isinstance(value, tuple):
+    return tuple(_CopyConfig(x) for x in value)
+  return value
+
+
 class _config(dict):
   """Dictionary of explicit configuration settings for a cbuildbot config
 
@@ -460,13 +475,14 @@ class _config(dict):
     Returns:
       A new _config instance.
     """
-    new_config = copy.deepcopy(self)
+    # Merge shallowly, and copy the result just once.
+    new_config = _config(self)
     for update_config in inherits:
       new_config.update(update_config)
 
     new_config.update(overrides)
 
-    return copy.deepcopy(new_config)
+    return _CopyConfig(new_config)
 
   def add_config(self, name, *inherits, **overrides):
     """Derive and add the config to cbuildbots usable config targets
@@ -6,6 +6,7 @@
 
 """Unittests for config.  Needs to be run inside of chroot for mox."""
 
+import copy
 import json
 import os
 import re
@@ -418,5 +419,51 @@ class FindFullTest(cros_test_lib.TestCase):
     self._CheckCanonicalConfig('lumpy', 'release')
 
 
+class ConfigCopyTest(cros_test_lib.TestCase):
+  """Test that configs are copied exactly like copy.deepcopy would."""
+
+  def _AssertSameCopy(self, value, expected):
+    """Check that |value| equals |expected| and has the same types."""
+    self.assertEqual(type(value), type(expected))
+    if isinstance(expected, dict):
+      self.assertEqual(sorted(value.keys()), sorted(expected.keys()))
+      for key in expected:
+        self._AssertSameCopy(value[key], expected[key])
+    elif isinstance(expected, (list, tuple)):
+      self.assertEqual(len(value), len(expected))
+      for x, y in zip(value, expected):
+        self._AssertSameCopy(x, y)
+    else:
+      self.assertEqual(value, expected)
+
+  def _AssertNothingShared(self, value, original):
+    """Check that |value| shares no mutable objects with |original|."""
+    if isinstance(original, (dict, list)):
+      self.assertFalse(value is original)
+    if isinstance(original, dict):
+      for key in original:
+        self._AssertNothingShared(value[key], original[key])
+    elif isinstance(original, (list, tuple)):
+      for x, y in zip(value, original):
+        self._AssertNothingShared(x, y)
+
+  def testCopyConfig(self):
+    """Verify that _CopyConfig matches copy.deepcopy for every config."""
+    for config in cbuildbot_config.config.itervalues():
+      new_config = cbuildbot_config._CopyConfig(config)
+      self._AssertSameCopy(new_config, copy.deepcopy(config))
+      self._AssertNothingShared(new_config, config)
+
+  def testDerive(self):
+    """Verify that derive matches deriving with copy.deepcopy."""
+    for config in cbuildbot_config.config.itervalues():
+      expected = copy.deepcopy(cbuildbot_config._default)
+      expected.update(config)
+      expected.update(name='derived')
+      self._AssertSameCopy(
+          cbuildbot_config._default.derive(config, name='derived'),
+          copy.deepcopy(expected))
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
@@ -132,6 +132,9 @@ class _Results(object):
     # names to previous records.
     self._previous = {}
 
+    # The cgroups.ResourceUsage of the stages that were measured, by name.
+    self._usage = {}
+
   def Clear(self):
     """Clear existing stage results."""
     self.__init__()
@@ -167,7 +170,7 @@ class _Results(object):
 
     return False
 
-  def Record(self, name, result, description=None, time=0):
+  def Record(self, name, result, description=None, time=0, usage=None):
     """Store off an additional stage result.
 
        Args:
@@ -178,8 +181,12 @@ class _Results(object):
              The exception the stage errored with.
          description:
            The textual backtrace of the exception, or None
+         time: How long the stage took, in seconds.
+         usage: The cgroups.ResourceUsage of the stage, or None.
     """
     self._results_log.append((name, result, description, time))
+    if usage is not None:
+      self._usage[name] = usage
 
   def UpdateResult(self, name, result, description=None):
     """Updates a stage result with a different result.
@@ -206,6 +213,14 @@ class _Results(object):
     """
     return self._results_log
 
+  def GetUsage(self, name):
+    """Fetch the resource usage of a stage.
+
+       Returns:
+         The cgroups.ResourceUsage of the stage, or None if it wasn't measured.
+    """
+    return self._usage.get(name)
+
   def GetPrevious(self):
     """Fetch stage results.
 
@@ -248,6 +263,23 @@ class _Results(object):
       if result not in (self.SUCCESS, self.FORGIVEN):
         yield RecordedTraceback(name, result, description)
 
+  @staticmethod
+  def _FormatUsage(usage):
+    """Describe a cgroups.ResourceUsage in a line."""
+    def _MiB(size):
+      return '%.1f MiB' % (size / 1024.0 / 1024.0)
+
+    fields = []
+    if usage.cpu_seconds is not None:
+      fields.append('cpu %.1fs' % usage.cpu_seconds)
+    if usage.memory_peak is not None:
+      fields.append('peak memory %s' % _MiB(usage.memory_peak))
+    if usage.read_bytes is not None:
+      fields.append('read %s' % _MiB(usage.read_bytes))
+    if usage.write_bytes is not None:
+      fields.append('written %s' % _MiB(usage.write_bytes))
+    return ', '.join(fields)
+
   def Report(self, out, archive_urls=None, current_version=None):
     """Generate a user friendly text display of the results data."""
     results = self._results_log
@@ -290,6 +322,8 @@ class _Results(object):
           details = ' with %s' % type(result).__name__
 
       out.write('%s %s %s (%s)%s\n' % (edge, status, name, timestr, details))
+      if name in self._usage:
+        out.write('%s   %s\n' % (edge, self._FormatUsage(self._usage[name])))
 
     out.write(line)
 
@@ -26,6 +26,7 @@ from chromite.buildbot import lkgm_manager
 from chromite.buildbot import manifest_version
 from chromite.buildbot import portage_utilities
 from chromite.buildbot import repository
+from chromite.buildbot import status_channel
 from chromite.buildbot import trybot_patch_pool
 from chromite.buildbot import validation_pool
 from chromite.lib import commandline
@@ -578,7 +579,14 @@ class ManifestVersionedSyncStage(SyncStage):
             force=self._force,
             branch=self._target_manifest_branch,
             dry_run=dry_run,
-            master=self._build_config['master'])
+            master=self._build_config['master'],
+            status_channel=self._GetStatusChannel())
+
+  def _GetStatusChannel(self):
+    """Returns the status channel requested with --status-channel, if any."""
+    if self._options.status_channel:
+      return status_channel.GetStatusChannel(self._options.status_channel)
+    return None
 
   def GetNextManifest(self):
     """Uses the initialized manifest manager to get the next manifest."""
@@ -643,7 +651,8 @@ class LKGMCandidateSyncStage(ManifestVersionedSyncStage):
         force=self._force,
         branch=self._target_manifest_branch,
         dry_run=self._options.debug,
-        master=self._build_config['master'])
+        master=self._build_config['master'],
+        status_channel=self._GetStatusChannel())
 
   def Initialize(self):
     """Override: Creates an LKGMManager rather than a ManifestManager."""
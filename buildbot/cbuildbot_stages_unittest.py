@@ -25,6 +25,7 @@ from chromite.buildbot import lkgm_manager
 from chromite.buildbot import manifest_version
 from chromite.buildbot import repository
 from chromite.buildbot import portage_utilities
+from chromite.lib import cgroups
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
 from chromite.lib import gs_unittest
@@ -1546,6 +1547,33 @@ class BuildStagesResultsTest(cros_test_lib.TestCase):
       self.assertEqual(expectedLines[i], actualLines[i])
     self.assertEqual(len(expectedLines), len(actualLines))
 
+  def testStagesReportUsage(self):
+    """Tests resource usage in the stages report."""
+
+    results_lib.Results.Clear()
+    usage = cgroups.ResourceUsage(61.5, 512 * 1024 * 1024, 3 * 1024 * 1024,
+                                  None)
+    results_lib.Results.Record('Build', results_lib.Results.SUCCESS, time=2,
+                               usage=usage)
+    results_lib.Results.Record('Test', results_lib.Results.SUCCESS, time=3)
+    self.assertEqual(results_lib.Results.GetUsage('Build'), usage)
+    self.assertEqual(results_lib.Results.GetUsage('Test'), None)
+
+    results = StringIO.StringIO()
+    results_lib.Results.Report(results)
+
+    expectedResults = (
+        "************************************************************\n"
+        "** Stage Results\n"
+        "************************************************************\n"
+        "** PASS Build (0:00:02)\n"
+        "**   cpu 61.5s, peak memory 512.0 MiB, read 3.0 MiB\n"
+        "************************************************************\n"
+        "** PASS Test (0:00:03)\n"
+        "************************************************************\n"
+    )
+    self.assertEqual(results.getvalue(), expectedResults)
+
   def testStagesReportReleaseTag(self):
     """Tests Release Tag entry in stages report."""
 
@@ -17,6 +17,7 @@ from xml.dom import minidom
 from chromite.buildbot import cbuildbot_config
 from chromite.buildbot import constants
 from chromite.buildbot import manifest_version
+from chromite.buildbot import status_channel as channel_lib
 from chromite.lib import cros_build_lib
 from chromite.lib import git
 
@@ -113,6 +114,8 @@ class LKGMManager(manifest_version.BuildSpecsManager):
   MAX_TIMEOUT_SECONDS = 300
   # Polling timeout for checking git repo for other build statuses.
   SLEEP_TIMEOUT = constants.SLEEP_TIMEOUT
+  # Upper bound on the polling timeout when backing off from SLEEP_TIMEOUT.
+  MAX_SLEEP_TIMEOUT = 4 * constants.SLEEP_TIMEOUT
 
   # Sub-directories for LKGM and Chrome LKGM's.
   LKGM_SUBDIR = 'LKGM-candidates'
@@ -123,7 +126,8 @@ class LKGMManager(manifest_version.BuildSpecsManager):
   LKGM_PATH = 'LKGM/lkgm.xml'
 
   def __init__(self, source_repo, manifest_repo, build_name, build_type,
-               incr_type, force, branch, dry_run=True, master=False):
+               incr_type, force, branch, dry_run=True, master=False,
+               status_channel=None):
     """Initialize an LKGM Manager.
 
     Args:
@@ -133,7 +137,8 @@ class LKGMManager(manifest_version.BuildSpecsManager):
     super(LKGMManager, self).__init__(
         source_repo=source_repo, manifest_repo=manifest_repo,
         build_name=build_name, incr_type=incr_type, force=force,
-        branch=branch, dry_run=dry_run, master=master)
+        branch=branch, dry_run=dry_run, master=master,
+        status_channel=status_channel)
 
     self.lkgm_path = os.path.join(self.manifest_dir, self.LKGM_PATH)
     self.compare_versions_fn = _LKGMCandidateInfo.VersionCompare
@@ -148,8 +153,18 @@ class LKGMManager(manifest_version.BuildSpecsManager):
       assert cbuildbot_config.IsPFQType(self.build_type)
       self.rel_working_dir = self.LKGM_SUBDIR
 
-  def _RunLambdaWithTimeout(self, function_to_run, use_long_timeout=False):
-    """Runs function_to_run until it returns a value or timeout is reached."""
+  def _RunLambdaWithTimeout(self, function_to_run, use_long_timeout=False,
+                            sleep_timeout_fn=None, sleep_fn=None):
+    """Runs function_to_run until it returns a value or timeout is reached.
+
+    Args:
+      function_to_run: Function to call until it returns a true value.
+      use_long_timeout: Wait for up to the long timeout for this build type.
+      sleep_timeout_fn: Optional function returning how long to sleep before
+        the next attempt.  Defaults to a constant SLEEP_TIMEOUT.
+      sleep_fn: Optional function called with the sleep timeout to wait
+        between attempts.  Defaults to time.sleep.
+    """
     function_success = False
     start_time = time.time()
     max_timeout = self.MAX_TIMEOUT_SECONDS
@@ -165,7 +180,9 @@ class LKGMManager(manifest_version.BuildSpecsManager):
       if function_success:
         break
       else:
-        time.sleep(self.SLEEP_TIMEOUT)
+        sleep_timeout = (sleep_timeout_fn() if sleep_timeout_fn
+                         else self.SLEEP_TIMEOUT)
+        (sleep_fn or time.sleep)(sleep_timeout)
 
     return function_success
 
@@ -375,24 +392,36 @@ class LKGMManager(manifest_version.BuildSpecsManager):
     """Returns a build-names->status dictionary of build statuses."""
     builders_completed = set()
     builder_statuses = {}
+    status_cache = {}
+    sleep_timeout = [self.SLEEP_TIMEOUT]
 
     def _CheckStatusOfBuildersArray():
       """Helper function that iterates through current statuses."""
-      for b in builders_array:
-        cached_status = builder_statuses.get(b)
-        if not cached_status or not cached_status.Completed():
-          logging.debug("Checking for builder %s's status", b)
-          builder_status = self.GetBuildStatus(b, self.current_version)
-          builder_statuses[b] = builder_status
-          if builder_status is None:
-            logging.warn('No status found for builder %s.', b)
-          elif builder_status.Passed():
-            builders_completed.add(b)
-            logging.info('Builder %s completed with status passed', b)
-          elif builder_status.Failed():
-            builders_completed.add(b)
-            logging.info('Builder %s completed with status failed', b)
-
+      pending = [b for b in builders_array if b not in builders_completed]
+      logging.debug('Checking status of builders %r', pending)
+      new_statuses = self.GetBuildStatuses(pending, self.current_version,
+                                           cache=status_cache)
+
+      # Back off while nothing changes, and poll eagerly again once it does.
+      changed = False
+      for b in pending:
+        builder_status = new_statuses[b]
+        if builder_status is not builder_statuses.get(b):
+          changed = True
+        builder_statuses[b] = builder_status
+        if builder_status is None:
+          logging.warn('No status found for builder %s.', b)
+        elif builder_status.Passed():
+          builders_completed.add(b)
+          logging.info('Builder %s completed with status passed', b)
+        elif builder_status.Failed():
+          builders_completed.add(b)
+          logging.info('Builder %s completed with status failed', b)
+
+      if changed:
+        sleep_timeout[0] = self.SLEEP_TIMEOUT
+      else:
+        sleep_timeout[0] = min(sleep_timeout[0] * 2, self.MAX_SLEEP_TIMEOUT)
 
       if len(builders_completed) < len(builders_array):
         logging.info('Still waiting for the following builds to complete: %r',
@@ -401,9 +430,27 @@ class LKGMManager(manifest_version.BuildSpecsManager):
       else:
         return 'Builds completed.'
 
-    # Check for build completion until all builders report in.
-    builds_succeeded = self._RunLambdaWithTimeout(_CheckStatusOfBuildersArray,
-                                                  use_long_timeout=True)
+    def _WaitForStatusChannel(timeout):
+      """Sleeps until a pending builder publishes a status or |timeout|."""
+      pending = [b for b in builders_array if b not in builders_completed]
+      try:
+        updates = self.status_channel.Wait(pending, self.current_version,
+                                           timeout)
+      except channel_lib.StatusChannelError as e:
+        logging.warning('Falling back to polling: %s', e)
+        time.sleep(timeout)
+      else:
+        if updates:
+          logging.debug('Status channel reported updates for %r',
+                        sorted(updates))
+
+    # Check for build completion until all builders report in.  If we have a
+    # status channel, block on it between checks so we wake up as soon as a
+    # builder publishes; Google Storage stays the source of truth.
+    builds_succeeded = self._RunLambdaWithTimeout(
+        _CheckStatusOfBuildersArray, use_long_timeout=True,
+        sleep_timeout_fn=lambda: sleep_timeout[0],
+        sleep_fn=_WaitForStatusChannel if self.status_channel else None)
     if not builds_succeeded:
       logging.error('Not all builds finished before MAX_TIMEOUT reached.')
 
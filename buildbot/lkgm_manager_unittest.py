@@ -19,6 +19,7 @@ if __name__ == '__main__':
 from chromite.buildbot import lkgm_manager
 from chromite.buildbot import manifest_version
 from chromite.buildbot import repository
+from chromite.buildbot import status_channel
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
 from chromite.lib import git
@@ -346,16 +347,19 @@ class LKGMManagerTest(cros_test_lib.MoxTempDirTestCase):
 
     Args:
       builders: List of builders to get status for.
-      status_runs: List of expected (builder, status) tuples.
+      status_runs: List of dictionaries of expected statuses, one per poll.
     """
-    self.mox.StubOutWithMock(lkgm_manager.LKGMManager, 'GetBuildStatus')
-    for builder, status in status_runs:
-      # GetBuildStatus returns None if the builder has not even started yet
+    self.mox.StubOutWithMock(self.manager, 'GetBuildStatuses')
+    for run in status_runs:
+      # GetBuildStatuses returns None if the builder has not even started yet
       # (e.g. because the builder is down.)
-      if status is not None:
-        status = manifest_version.BuilderStatus(status, None)
-      lkgm_manager.LKGMManager.GetBuildStatus(
-          builder, mox.IgnoreArg()).AndReturn(status)
+      statuses = {}
+      for builder, status in run.iteritems():
+        if status is not None:
+          status = manifest_version.BuilderStatus(status, None)
+        statuses[builder] = status
+      self.manager.GetBuildStatuses(
+          sorted(run), mox.IgnoreArg(), cache=mox.IsA(dict)).AndReturn(statuses)
 
     self.mox.ReplayAll()
     statuses = self.manager.GetBuildersStatus(builders)
@@ -364,20 +368,68 @@ class LKGMManagerTest(cros_test_lib.MoxTempDirTestCase):
 
   def testGetBuildersStatusBothFinished(self):
     """Tests GetBuilderStatus where both builds have finished."""
-    status_runs = [('build1', 'fail'), ('build2', 'pass')]
+    status_runs = [{'build1': 'fail', 'build2': 'pass'}]
     statuses = self._GetBuildersStatus(['build1', 'build2'], status_runs)
     self.assertTrue(statuses['build1'].Failed())
     self.assertTrue(statuses['build2'].Passed())
 
   def testGetBuildersStatusLoop(self):
     """Tests GetBuilderStatus where builds are inflight."""
-    status_runs = [('build1', 'inflight'), ('build2', None),
-                   ('build1', 'fail'), ('build2', 'inflight'),
-                   ('build2', 'pass')]
+    status_runs = [{'build1': 'inflight', 'build2': None},
+                   {'build1': 'fail', 'build2': 'inflight'},
+                   {'build2': 'pass'}]
     statuses = self._GetBuildersStatus(['build1', 'build2'], status_runs)
     self.assertTrue(statuses['build1'].Failed())
     self.assertTrue(statuses['build2'].Passed())
 
+  def testGetBuildersStatusBackoff(self):
+    """Tests that GetBuilderStatus backs off while no status changes."""
+    self.manager.SLEEP_TIMEOUT = 1
+    self.manager.MAX_SLEEP_TIMEOUT = 4
+    self.mox.StubOutWithMock(lkgm_manager.time, 'sleep')
+    inflight = manifest_version.BuilderStatus('inflight', None)
+    passed = manifest_version.BuilderStatus('pass', None)
+    self.mox.StubOutWithMock(self.manager, 'GetBuildStatuses')
+    for status, sleep in [(None, 2), (None, 4), (inflight, 1), (inflight, 2),
+                          (inflight, 4), (inflight, 4)]:
+      self.manager.GetBuildStatuses(
+          ['build1'], mox.IgnoreArg(), cache=mox.IsA(dict)).AndReturn(
+              {'build1': status})
+      lkgm_manager.time.sleep(sleep)
+    self.manager.GetBuildStatuses(
+        ['build1'], mox.IgnoreArg(), cache=mox.IsA(dict)).AndReturn(
+            {'build1': passed})
+    self.mox.ReplayAll()
+    statuses = self.manager.GetBuildersStatus(['build1'])
+    self.mox.VerifyAll()
+    self.assertTrue(statuses['build1'].Passed())
+
+  def testGetBuildersStatusStatusChannel(self):
+    """Tests that GetBuilderStatus blocks on the status channel if given."""
+    self.manager.status_channel = self.mox.CreateMock(
+        status_channel.StatusChannel)
+    self.mox.StubOutWithMock(lkgm_manager.time, 'sleep')
+    self.mox.StubOutWithMock(self.manager, 'GetBuildStatuses')
+    inflight = manifest_version.BuilderStatus('inflight', None)
+    passed = manifest_version.BuilderStatus('pass', None)
+    for status in (None, inflight, passed):
+      self.manager.GetBuildStatuses(
+          ['build1'], mox.IgnoreArg(), cache=mox.IsA(dict)).AndReturn(
+              {'build1': status})
+      if status is None:
+        self.manager.status_channel.Wait(
+            ['build1'], mox.IgnoreArg(), 0).AndReturn({})
+      elif status is inflight:
+        # If the channel is down, we fall back to sleeping.
+        self.manager.status_channel.Wait(
+            ['build1'], mox.IgnoreArg(), 0).AndRaise(
+                status_channel.StatusChannelError('down'))
+        lkgm_manager.time.sleep(0)
+    self.mox.ReplayAll()
+    statuses = self.manager.GetBuildersStatus(['build1'])
+    self.mox.VerifyAll()
+    self.assertTrue(statuses['build1'].Passed())
+
   def testGenerateBlameListSinceLKGM(self):
     """Tests that we can generate a blamelist from two commit messages.
 
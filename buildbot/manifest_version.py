@@ -7,6 +7,7 @@ A library to generate and store the manifests for cros builders to use.
 """
 
 import cPickle
+import cStringIO
 import fnmatch
 import logging
 import os
@@ -26,6 +27,9 @@ BUILD_STATUS_URL = '%s/builder-status' % MANIFEST_VERSIONS_URL
 PUSH_BRANCH = 'temp_auto_checkin_branch'
 NUM_RETRIES = 20
 
+# Matches an object line in `gsutil ls -l` output: size, mtime and url.
+_GS_LS_LONG_RE = re.compile(r'^\s*(\d+)\s+(\S+)\s+(gs://\S+)\s*$')
+
 
 class VersionUpdateException(Exception):
   """Exception gets thrown for failing to update the version file"""
@@ -356,7 +360,7 @@ class BuildSpecsManager(object):
   """A Class to manage buildspecs and their states."""
 
   def __init__(self, source_repo, manifest_repo, build_name, incr_type, force,
-               branch, dry_run=True, master=False):
+               branch, dry_run=True, master=False, status_channel=None):
     """Initializes a build specs manager.
     Args:
       source_repo: Repository object for the source code.
@@ -367,6 +371,8 @@ class BuildSpecsManager(object):
       branch: Branch this builder is running on.
       dry_run: Whether we actually commit changes we make or not.
       master: Whether we are the master builder.
+      status_channel: Optional status_channel.StatusChannel that statuses are
+        published to in addition to Google Storage.
     """
     self.cros_source = source_repo
     buildroot = source_repo.directory
@@ -382,6 +388,7 @@ class BuildSpecsManager(object):
     self.branch = branch
     self.dry_run = dry_run
     self.master = master
+    self.status_channel = status_channel
 
     # Directories and specifications are set once we load the specs.
     self.all_specs_dir = None
@@ -538,6 +545,87 @@ class BuildSpecsManager(object):
       raise
     return BuilderStatus(**cPickle.loads(result.output))
 
+  @staticmethod
+  def _ListBuildStatuses(version, retries=3):
+    """Returns a builder->stamp dictionary of uploaded statuses for |version|.
+
+    The stamp is the (size, mtime) pair reported by `gsutil ls -l`, and changes
+    whenever a builder uploads a new status.
+
+    Args:
+      version: Version string.
+      retries: Number of retries for listing the statuses.
+    """
+    url = BuildSpecsManager._GetStatusUrl('', version)
+    cmd = [gs.GSUTIL_BIN, 'ls', '-l', url]
+    try:
+      result = cros_build_lib.RunCommandWithRetries(
+          retries, cmd, redirect_stdout=True, redirect_stderr=True,
+          debug_level=logging.DEBUG)
+    except cros_build_lib.RunCommandError as ex:
+      # No builder has uploaded a status for this version yet.
+      if ex.result.error and ('matched no objects' in ex.result.error or
+                              ex.result.error.startswith('InvalidUriError:')):
+        return {}
+      raise
+
+    stamps = {}
+    for line in result.output.splitlines():
+      m = _GS_LS_LONG_RE.match(line)
+      if m:
+        size, mtime, obj_url = m.groups()
+        stamps[obj_url[len(url):]] = (int(size), mtime)
+    return stamps
+
+  @staticmethod
+  def GetBuildStatuses(builders, version, cache=None, retries=3):
+    """Returns a builder->BuilderStatus dictionary for the given builders.
+
+    Unlike calling GetBuildStatus once per builder, this lists all uploaded
+    statuses with one command and downloads the ones we need with a second.
+
+    Args:
+      builders: List of builders to look at.
+      version: Version string.
+      cache: Optional dictionary mapping builders to (stamp, status) tuples
+        from a previous call.  Statuses whose stamp is unchanged are reused
+        rather than downloaded again, and the cache is updated in place.
+      retries: Number of retries for each gsutil command.
+
+    Returns:
+      A dictionary mapping each builder to its BuilderStatus, or None if the
+      builder has not uploaded a status yet.
+    """
+    if cache is None:
+      cache = {}
+    stamps = BuildSpecsManager._ListBuildStatuses(version, retries=retries)
+
+    statuses = {}
+    fetch = []
+    for builder in builders:
+      stamp = stamps.get(builder)
+      if stamp is None:
+        statuses[builder] = None
+      elif builder in cache and cache[builder][0] == stamp:
+        statuses[builder] = cache[builder][1]
+      else:
+        fetch.append(builder)
+
+    if fetch:
+      urls = [BuildSpecsManager._GetStatusUrl(b, version) for b in fetch]
+      result = cros_build_lib.RunCommandWithRetries(
+          retries, [gs.GSUTIL_BIN, 'cat'] + urls, redirect_stdout=True,
+          redirect_stderr=True, debug_level=logging.DEBUG)
+      # gsutil cat concatenates the objects in order; pickles are
+      # self-delimiting so we can load them back one at a time.
+      unpickler = cPickle.Unpickler(cStringIO.StringIO(result.output))
+      for builder in fetch:
+        status = BuilderStatus(**unpickler.load())
+        cache[builder] = (stamps[builder], status)
+        statuses[builder] = status
+
+    return statuses
+
   def GetLatestPassingSpec(self):
     """Get the last spec file that passed in the current branch."""
     version_info = self.GetCurrentVersionInfo()
@@ -657,6 +745,9 @@ class BuildSpecsManager(object):
       # TODO(davidjames): Use chromite.lib.gs here.
       cros_build_lib.RunCommandWithRetries(
           3, cmd, redirect_stdout=True, redirect_stderr=True, input=data)
+      if self.status_channel:
+        self.status_channel.TryPublish(self.build_name, version, status,
+                                       message=message)
 
   def UploadStatus(self, success, message=None):
     """Uploads the status of the build for the current build spec.
@@ -6,6 +6,8 @@
 
 """Unittests for manifest_version. Needs to be run inside of chroot for mox."""
 
+import cPickle
+import mox
 import os
 import sys
 import tempfile
@@ -258,5 +260,73 @@ class BuildSpecsManagerTest(cros_test_lib.MoxTempDirTestCase):
     print self.manager.UpdateStatus('pass')
 
 
+class GetBuildStatusesTest(cros_test_lib.MoxTestCase):
+  """Tests for BuildSpecsManager.GetBuildStatuses."""
+
+  VERSION = '1.2.3-rc4'
+
+  def setUp(self):
+    self.mox.StubOutWithMock(cros_build_lib, 'RunCommandWithRetries')
+    self.url = '%s/%s/' % (manifest_version.BUILD_STATUS_URL, self.VERSION)
+
+  def _ExpectList(self, stamps):
+    """Expect a `gsutil ls -l` returning |stamps|, a builder->size dict."""
+    lines = ['%10d  2013-01-0%dT00:00:00  %s%s' % (size, size, self.url, b)
+             for b, size in sorted(stamps.iteritems())]
+    lines.append('TOTAL: %d objects, 0 bytes (0.0 B)' % len(stamps))
+    cros_build_lib.RunCommandWithRetries(
+        3, [mox.IgnoreArg(), 'ls', '-l', self.url],
+        redirect_stdout=True, redirect_stderr=True,
+        debug_level=mox.IgnoreArg()).AndReturn(
+            cros_build_lib.CommandResult(output='\n'.join(lines) + '\n'))
+
+  def _ExpectCat(self, statuses):
+    """Expect a `gsutil cat` of the given (builder, status) pairs."""
+    urls = [self.url + b for b, _ in statuses]
+    output = ''.join(cPickle.dumps(dict(status=s, message=None))
+                     for _, s in statuses)
+    cros_build_lib.RunCommandWithRetries(
+        3, [mox.IgnoreArg(), 'cat'] + urls,
+        redirect_stdout=True, redirect_stderr=True,
+        debug_level=mox.IgnoreArg()).AndReturn(
+            cros_build_lib.CommandResult(output=output))
+
+  def testNoStatuses(self):
+    """Tests that missing statuses are reported as None."""
+    result = cros_build_lib.CommandResult(
+        error='CommandException: One or more URIs matched no objects.')
+    cros_build_lib.RunCommandWithRetries(
+        3, mox.In('ls'), redirect_stdout=True, redirect_stderr=True,
+        debug_level=mox.IgnoreArg()).AndRaise(
+            cros_build_lib.RunCommandError('failed', result))
+    self.mox.ReplayAll()
+    statuses = manifest_version.BuildSpecsManager.GetBuildStatuses(
+        ['build1', 'build2'], self.VERSION)
+    self.mox.VerifyAll()
+    self.assertEqual(statuses, {'build1': None, 'build2': None})
+
+  def testConditionalFetch(self):
+    """Tests that only new or changed statuses are downloaded."""
+    self._ExpectList({'build1': 1, 'build2': 1})
+    self._ExpectCat([('build1', 'inflight'), ('build2', 'inflight')])
+    self._ExpectList({'build1': 1, 'build2': 2, 'build3': 1})
+    self._ExpectCat([('build2', 'pass')])
+    self.mox.ReplayAll()
+
+    cache = {}
+    builders = ['build1', 'build2']
+    first = manifest_version.BuildSpecsManager.GetBuildStatuses(
+        builders, self.VERSION, cache=cache)
+    second = manifest_version.BuildSpecsManager.GetBuildStatuses(
+        builders, self.VERSION, cache=cache)
+    self.mox.VerifyAll()
+
+    self.assertTrue(first['build1'].Inflight())
+    self.assertTrue(first['build2'].Inflight())
+    self.assertTrue(second['build1'] is first['build1'])
+    self.assertTrue(second['build2'].Passed())
+    self.assertEqual(sorted(cache), builders)
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
@@ -8,14 +8,19 @@ import collections
 import filecmp
 import fileinput
 import glob
+import hashlib
+import json
 import logging
 import multiprocessing
 import os
 import re
 import shutil
+import stat
 import sys
 
 from chromite.buildbot import constants
+from chromite.lib import bash_vars
+from chromite.lib import commandline
 from chromite.lib import cros_build_lib
 from chromite.lib import gerrit
 from chromite.lib import git
@@ -49,6 +54,10 @@ _pvr_re = re.compile('^(?P<pv>%s-%s)$' % (_pkg, _ver), re.VERBOSE)
 # This regex matches blank lines, commented lines, and the EAPI line.
 _blank_or_eapi_re = re.compile(r'^\s*(?:#|EAPI=|$)')
 
+# This regex matches a KEYWORDS assignment, capturing its (possibly quoted)
+# value but not any commands that follow it on the same line.
+_keywords_re = re.compile(r'''^KEYWORDS=(?:"([^"]*)|'([^']*)|([^\s;]*))''')
+
 
 def _ListOverlays(board=None, buildroot=constants.SOURCE_ROOT):
   """Return the list of overlays to use for a given buildbot.
@@ -160,6 +169,9 @@ class EBuild(object):
   _PACKAGE_VERSION_PATTERN = re.compile(
     r'.*-(([0-9][0-9a-z_.]*)(-r[0-9]+)?)[.]ebuild')
   _WORKON_COMMIT_PATTERN = re.compile(r'^CROS_WORKON_COMMIT="(.*)"$')
+  # Shared by all ebuilds, so that the source repositories of all of them can
+  # be looked up at once.
+  _git_info = git.GitRepoInfo()
 
   @classmethod
   def _Print(cls, message):
@@ -251,8 +263,14 @@ class EBuild(object):
     cros_build_lib.RunCommand(git_commit_cmd, cwd=overlay,
                               print_cmd=cls.VERBOSE)
 
-  def __init__(self, path):
-    """Sets up data about an ebuild from its path."""
+  def __init__(self, path, metadata=None):
+    """Sets up data about an ebuild from its path.
+
+    Args:
+      path: The path of the ebuild.
+      metadata: The metadata of the ebuild, as returned by ReadEBuildMetadata,
+        if it is already known.  Otherwise the ebuild is read.
+    """
     self._overlay, self._category, self._pkgname, filename = path.rsplit('/', 3)
     m = self._PACKAGE_VERSION_PATTERN.match(filename)
     if not m:
@@ -275,7 +293,16 @@ class EBuild(object):
     self.is_workon = False
     self.is_stable = False
     self.is_blacklisted = False
-    self._ReadEBuild(path)
+    if metadata is None:
+      self._ReadEBuild(path)
+    else:
+      self._SetMetadata(metadata)
+
+  def _SetMetadata(self, metadata):
+    """Set `is_workon`, `is_stable` and `is_blacklisted` from |metadata|."""
+    self.is_workon = metadata['is_workon']
+    self.is_stable = metadata['is_stable']
+    self.is_blacklisted = metadata['is_blacklisted']
 
   def _ReadEBuild(self, path):
     """Determine the settings of `is_workon` and `is_stable`.
@@ -287,28 +314,19 @@ class EBuild(object):
     This function is separate from __init__() to allow unit tests to
     stub it out.
     """
-    for line in fileinput.input(path):
-      if line.startswith('inherit ') and 'cros-workon' in line:
-        self.is_workon = True
-      elif line.startswith('KEYWORDS='):
-        for keyword in line.split('=', 1)[1].strip("\"'").split():
-          if not keyword.startswith('~') and keyword != '-*':
-            self.is_stable = True
-      elif line.startswith('CROS_WORKON_BLACKLIST='):
-        self.is_blacklisted = True
-    fileinput.close()
+    self._SetMetadata(ReadEBuildMetadata(path))
 
   def GetGitProjectName(self, path):
     """Read the project variable from a git repository at given path."""
+    project = self._git_info.GetProjectName(path, ('cros', 'cros-internal'))
+    if project is not None:
+      return project
     cmd = ('git config --get remote.cros.projectname || '
            'git config --get remote.cros-internal.projectname')
     return self._RunCommand(cmd, cwd=path, shell=True).rstrip()
 
-  def GetSourcePath(self, srcroot):
-    """Get the project and path for this ebuild.
-
-    The path is guaranteed to exist, be a directory, and be absolute.
-    """
+  def _ReadSourcePath(self, srcroot):
+    """Get the projects and paths for this ebuild, without checking them."""
     workon_vars = (
         'CROS_WORKON_LOCALNAME',
         'CROS_WORKON_PROJECT',
@@ -349,7 +367,14 @@ class EBuild(object):
 
     subdir_paths = [os.path.realpath(os.path.join(srcroot, dir_, l, s))
                     for l, s in zip(localnames, subdirs)]
+    return projects, subdir_paths
+
+  def GetSourcePath(self, srcroot):
+    """Get the project and path for this ebuild.
 
+    The path is guaranteed to exist, be a directory, and be absolute.
+    """
+    projects, subdir_paths = self._ReadSourcePath(srcroot)
     for subdir_path, project in zip(subdir_paths, projects):
       if not os.path.isdir(subdir_path):
         cros_build_lib.Die('Source repository %s '
@@ -364,9 +389,31 @@ class EBuild(object):
                                                         project))
     return projects, subdir_paths
 
+  @classmethod
+  def PrefetchSourceInfo(cls, ebuilds, srcroot):
+    """Look up the source repositories of |ebuilds| all at once.
+
+    This saves running git for each repository when the ebuilds are revved.
+    Problems with the ebuilds are left to be reported then.
+
+    Args:
+      ebuilds: The EBuild objects that are about to be revved.
+      srcroot: full path to the 'src' subdirectory in the source repository.
+    """
+    srcdirs = []
+    for ebuild in ebuilds:
+      try:
+        # pylint: disable=W0212
+        srcdirs.extend(ebuild._ReadSourcePath(srcroot)[1])
+      except EbuildFormatIncorrectException:
+        pass
+    cls._git_info.Prefetch([d for d in srcdirs if os.path.isdir(d)])
+
   def GetCommitId(self, srcdir):
     """Get the commit id for this ebuild."""
-    output = self._RunCommand(['git', 'rev-parse', 'HEAD'], cwd=srcdir)
+    output = self._git_info.GetHead(srcdir)
+    if output is None:
+      output = self._RunCommand(['git', 'rev-parse', 'HEAD'], cwd=srcdir)
     if not output:
       cros_build_lib.Die('Cannot determine HEAD commit for %s' % srcdir)
     return output.rstrip()
@@ -377,7 +424,10 @@ class EBuild(object):
     Unlike the commit hash, the SHA1 of the source tree is unaffected by the
     history of the repository, or by commit messages.
     """
-    output = self._RunCommand(['git', 'log', '-1', '--format=%T'], cwd=srcdir)
+    output = self._git_info.GetTree(srcdir)
+    if output is None:
+      output = self._RunCommand(['git', 'log', '-1', '--format=%T'],
+                                cwd=srcdir)
     if not output:
       cros_build_lib.Die('Cannot determine HEAD tree hash for %s' % srcdir)
     return output.rstrip()
@@ -577,6 +627,191 @@ class EBuild(object):
                             'to match remote repository.', overlay=overlay)
 
 
+def ReadEBuildMetadata(path):
+  """Read the metadata that EBuild and EBuildIndex need out of an ebuild.
+
+  Args:
+    path: The path of the ebuild.
+
+  Returns:
+    A dictionary with the following keys:
+      is_workon: Whether the ebuild inherits from the 'cros-workon' eclass.
+      is_stable: Whether there's a keyword without a '~' in KEYWORDS.
+      is_blacklisted: Whether the ebuild sets CROS_WORKON_BLACKLIST.
+      keywords: The list of KEYWORDS.
+      projects: The unparsed values of all CROS_WORKON_PROJECT lines.
+  """
+  metadata = {
+      'is_workon': False,
+      'is_stable': False,
+      'is_blacklisted': False,
+      'keywords': [],
+      'projects': [],
+  }
+  for line in fileinput.input(path):
+    if line.startswith('inherit ') and 'cros-workon' in line:
+      metadata['is_workon'] = True
+    elif line.startswith('KEYWORDS='):
+      m = _keywords_re.match(line)
+      keywords = ''.join(group or '' for group in m.groups()).split()
+      for keyword in keywords:
+        if not keyword.startswith('~') and keyword != '-*':
+          metadata['is_stable'] = True
+      metadata['keywords'] = keywords
+    elif line.startswith('CROS_WORKON_BLACKLIST='):
+      metadata['is_blacklisted'] = True
+
+    if line.startswith('CROS_WORKON_PROJECT='):
+      metadata['projects'].append(line.rstrip('\n').partition('=')[2])
+  fileinput.close()
+  return metadata
+
+
+def _GetEBuildIndexPath(overlay):
+  """Get the default location of the ebuild index for |overlay|."""
+  key = hashlib.md5(os.path.realpath(overlay)).hexdigest()
+  return os.path.join(commandline.GetCacheDir(), 'ebuild_index',
+                      '%s.json' % key)
+
+
+class EBuildIndex(object):
+  """Persistent index of the metadata of the ebuilds in an overlay.
+
+  The index maps the path of each ebuild, relative to the overlay, to its
+  mtime, size and the metadata returned by ReadEBuildMetadata.  Refreshing
+  the index only needs to stat the files in the overlay, so repeated scans
+  only pay for reading the ebuilds that changed.
+  """
+
+  VERSION = 2
+
+  def __init__(self, overlay, path=None):
+    """Initialize the index, loading any existing entries from |path|.
+
+    Args:
+      overlay: The overlay to index.
+      path: The on-disk location of the index.  Defaults to a file in the
+        cache directory of the checkout.
+    """
+    self.overlay = overlay
+    self.path = _GetEBuildIndexPath(overlay) if path is None else path
+    self._ebuilds = {}
+    self._dirty = False
+    if os.path.exists(self.path):
+      try:
+        index = json.loads(osutils.ReadFile(self.path))
+      except ValueError:
+        cros_build_lib.Warning('Ignoring corrupt ebuild index %s', self.path)
+      else:
+        if (isinstance(index, dict) and
+            index.get('version') == self.VERSION and
+            index.get('overlay') == os.path.realpath(overlay)):
+          self._ebuilds = index['ebuilds']
+
+  def _RelPath(self, path):
+    """Return |path| relative to the overlay."""
+    return os.path.relpath(os.path.join(self.overlay, path), self.overlay)
+
+  def _GetFilter(self, subdirectories):
+    """Return a function that checks if a path is in |subdirectories|."""
+    if subdirectories is None:
+      return lambda relpath: True
+    prefixes = tuple(self._RelPath(subdir) + os.sep
+                     for subdir in subdirectories)
+    if os.curdir + os.sep in prefixes:
+      return lambda relpath: True
+    return lambda relpath: relpath.startswith(prefixes)
+
+  def Refresh(self, subdirectories=None):
+    """Bring the index up to date with the ebuilds in the overlay.
+
+    Args:
+      subdirectories: If set, only refresh these subdirectories of the
+        overlay.  Subdirectories that do not exist are ignored.
+    """
+    tops = [os.curdir] if subdirectories is None else subdirectories
+    seen = set()
+    for top in tops:
+      for dirpath, dirs, files in os.walk(os.path.join(self.overlay, top)):
+        # Skip .git and friends, which never contain ebuilds.
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        reldir = None
+        for name in files:
+          if not name.endswith('.ebuild'):
+            continue
+          path = os.path.join(dirpath, name)
+          try:
+            st = os.lstat(path)
+          except OSError:
+            continue
+          if stat.S_ISLNK(st.st_mode):
+            continue
+          if reldir is None:
+            reldir = self._RelPath(dirpath)
+          relpath = name if reldir == os.curdir else os.path.join(reldir, name)
+          seen.add(relpath)
+          entry = self._ebuilds.get(relpath)
+          if (entry is None or entry[0] != st.st_mtime or
+              entry[1] != st.st_size):
+            self._ebuilds[relpath] = (st.st_mtime, st.st_size,
+                                      ReadEBuildMetadata(path))
+            self._dirty = True
+
+    in_subdirectories = self._GetFilter(subdirectories)
+    for relpath in self._ebuilds.keys():
+      if relpath not in seen and in_subdirectories(relpath):
+        del self._ebuilds[relpath]
+        self._dirty = True
+
+  def Save(self):
+    """Atomically write the index back to disk, if it changed."""
+    if not self._dirty:
+      return
+    index = {
+        'version': self.VERSION,
+        'overlay': os.path.realpath(self.overlay),
+        'ebuilds': self._ebuilds,
+    }
+    try:
+      osutils.WriteFile(self.path, json.dumps(index), atomic=True,
+                        makedirs=True)
+    except EnvironmentError as e:
+      cros_build_lib.Warning('Could not save ebuild index %s: %s',
+                             self.path, e)
+    else:
+      self._dirty = False
+
+  def GetMetadata(self, path):
+    """Return the metadata of the ebuild at |path|, or None.
+
+    Args:
+      path: The path of the ebuild, absolute or relative to the overlay.
+    """
+    entry = self._ebuilds.get(path) or self._ebuilds.get(self._RelPath(path))
+    return entry[2] if entry else None
+
+  def ListEBuilds(self, subdirectories=None):
+    """Return the sorted paths of the ebuilds, relative to the overlay.
+
+    Args:
+      subdirectories: If set, only list ebuilds in these subdirectories.
+    """
+    return sorted(filter(self._GetFilter(subdirectories), self._ebuilds))
+
+
+def GetEBuildIndex(overlay, subdirectories=None):
+  """Return an up to date EBuildIndex for |overlay|.
+
+  Args:
+    overlay: The overlay to index.
+    subdirectories: If set, only refresh these subdirectories of the overlay.
+  """
+  index = EBuildIndex(overlay)
+  index.Refresh(subdirectories)
+  index.Save()
+  return index
+
+
 def BestEBuild(ebuilds):
   """Returns the newest EBuild from a list of EBuild objects."""
   from portage.versions import vercmp
@@ -587,7 +822,7 @@ def BestEBuild(ebuilds):
   return winner
 
 
-def _FindUprevCandidates(files):
+def _FindUprevCandidates(files, index=None):
   """Return the uprev candidate ebuild from a specified list of files.
 
   Usually an uprev candidate is a the stable ebuild in a cros_workon
@@ -598,13 +833,14 @@ def _FindUprevCandidates(files):
 
   Args:
     files: List of files in a package directory.
+    index: An EBuildIndex to get the metadata of the ebuilds from.
   """
   stable_ebuilds = []
   unstable_ebuilds = []
   for path in files:
     if not path.endswith('.ebuild') or os.path.islink(path):
       continue
-    ebuild = EBuild(path)
+    ebuild = EBuild(path, index.GetMetadata(path) if index else None)
     if not ebuild.is_workon or ebuild.is_blacklisted:
       continue
     if ebuild.is_stable:
@@ -662,10 +898,15 @@ def BuildEBuildDictionary(overlays, use_all, packages):
     True, this argument is ignored, and should be None.
   """
   for overlay in overlays:
-    for package_dir, _dirs, files in os.walk(overlay):
+    index = GetEBuildIndex(overlay)
+    package_dirs = collections.defaultdict(list)
+    for relpath in index.ListEBuilds():
+      package_dirs[os.path.dirname(relpath)].append(
+          os.path.join(overlay, relpath))
+
+    for _package_dir, paths in sorted(package_dirs.iteritems()):
       # Add stable ebuilds to overlays[overlay].
-      paths = [os.path.join(package_dir, path) for path in files]
-      ebuild = _FindUprevCandidates(paths)
+      ebuild = _FindUprevCandidates(paths, index)
 
       # If the --all option isn't used, we only want to update packages that
       # are in packages.
@@ -704,9 +945,17 @@ def RegenCache(overlay):
 
 def ParseBashArray(value):
   """Parse a valid bash array into python list."""
+  sep = ','
+  try:
+    variables = bash_vars.Evaluate('ARR=%s' % value, os.environ)
+    arr = bash_vars.GetValue(variables, 'ARR')
+    if arr is not None:
+      return sep.join(arr if isinstance(arr, list) else [arr]).split(sep)
+  except bash_vars.UnsupportedSyntax:
+    pass
+
   # The syntax for bash arrays is nontrivial, so let's use bash to do the
   # heavy lifting for us.
-  sep = ','
   # Because %s may contain bash comments (#), put a clever newline in the way.
   cmd = 'ARR=%s\nIFS=%s; echo -n "${ARR[*]}"' % (value, sep)
   return cros_build_lib.RunCommandCaptureOutput(
@@ -725,15 +974,12 @@ def GetWorkonProjectMap(overlay, subdirectories):
     given overlay under the given subdirectories.
   """
   # Search ebuilds for project names, ignoring non-existent directories.
-  cmd = ['grep', '^CROS_WORKON_PROJECT=', '--include', '*-9999.ebuild',
-         '-Hsr'] + list(subdirectories)
-  result = cros_build_lib.RunCommandCaptureOutput(
-      cmd, cwd=overlay, error_code_ok=True, print_cmd=False)
-  for grep_line in result.output.splitlines():
-    filename, _, line = grep_line.partition(':')
-    value = line.partition('=')[2]
-    projects = ParseBashArray(value)
-    yield filename, projects
+  subdirectories = list(subdirectories)
+  index = GetEBuildIndex(overlay, subdirectories)
+  for filename in index.ListEBuilds(subdirectories):
+    if filename.endswith('-9999.ebuild'):
+      for value in index.GetMetadata(filename)['projects']:
+        yield filename, ParseBashArray(value)
 
 
 def SplitEbuildPath(path):
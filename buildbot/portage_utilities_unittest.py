@@ -7,14 +7,18 @@
 """Unit tests for portage_utilities.py."""
 
 import fileinput
+import glob
+import mock
 import mox
 import os
+import shutil
 import sys
 
 import constants
 if __name__ == '__main__':
   sys.path.insert(0, constants.SOURCE_ROOT)
 
+from chromite.lib import bash_vars
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
 from chromite.lib import osutils
@@ -123,6 +127,24 @@ class EBuildTest(cros_test_lib.MoxTestCase):
       self.assertEquals(fake_ebuild.is_stable, stable)
       self.mox.UnsetStubs()
 
+  def testReadKeywords(self):
+    """Test that only the value of KEYWORDS is read from its line."""
+    datasets = (
+        ('KEYWORDS="~*" ; SLOT="0"\n', ['~*'], False),
+        ("KEYWORDS='* -arm' # comment\n", ['*', '-arm'], True),
+        ('KEYWORDS=~amd64;SLOT=0\n', ['~amd64'], False),
+        ('KEYWORDS=""\n', [], False),
+    )
+    for line, keywords, stable in datasets:
+      self.mox.StubOutWithMock(fileinput, 'input')
+      fileinput.input('test.ebuild').AndReturn([line])
+      self.mox.ReplayAll()
+      metadata = portage_utilities.ReadEBuildMetadata('test.ebuild')
+      self.mox.VerifyAll()
+      self.assertEquals(metadata['keywords'], keywords)
+      self.assertEquals(metadata['is_stable'], stable)
+      self.mox.UnsetStubs()
+
   def testEBuildBlacklisted(self):
     """Test blacklisted ebuild"""
     fake_ebuild_path = '/path/to/test_package/test_package-9999.ebuild'
@@ -200,6 +222,88 @@ CROS_WORKON_SUBDIR=%s
     self.assertEquals(subdir, fake_path)
 
 
+class WorkonVariablesTest(cros_test_lib.MockTempDirTestCase):
+  """Compare parsing the ebuilds of a test overlay with and without bash."""
+
+  OVERLAY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'testdata', 'portage_utilities_unittest', 'overlay')
+  WORKON_VARS = ('CROS_WORKON_LOCALNAME', 'CROS_WORKON_PROJECT',
+                 'CROS_WORKON_SUBDIR')
+  ENV = {
+      'CROS_WORKON_LOCALNAME': 'package',
+      'CROS_WORKON_PROJECT': 'package',
+      'CROS_WORKON_SUBDIR': '',
+  }
+  # Ebuilds that set the workon variables with more than plain assignments.
+  NEEDS_BASH = ('chromeos-chrome', 'cros-devutils', 'libchromeos', 'mesa')
+
+  def setUp(self):
+    self.PatchObject(portage_utilities, '_GetEBuildIndexPath',
+                     return_value=os.path.join(self.tempdir, 'index.json'))
+    self.ebuilds = sorted(glob.glob(os.path.join(self.OVERLAY, '*', '*',
+                                                 '*.ebuild')))
+    self.assertTrue(self.ebuilds)
+
+  def _SourceEnvironment(self, ebuild_path, use_bash, **kwargs):
+    """Run SourceEnvironment, and count the commands it runs."""
+    def _Evaluate(*args):
+      if use_bash:
+        raise bash_vars.UnsupportedSyntax()
+      return evaluate(*args)
+    evaluate = osutils._EvaluateEnvironment
+    with mock.patch.object(osutils, '_EvaluateEnvironment',
+                           side_effect=_Evaluate):
+      with mock.patch.object(cros_build_lib, 'RunCommand',
+                             side_effect=cros_build_lib.RunCommand) as rc:
+        env = osutils.SourceEnvironment(ebuild_path, self.WORKON_VARS,
+                                        **kwargs)
+    return env, rc.call_count
+
+  def testSourceEnvironment(self):
+    """Test that the ebuilds evaluate like they do in bash."""
+    for ebuild_path in self.ebuilds:
+      for kwargs in ({'env': self.ENV}, {'env': self.ENV, 'ifs': ' '},
+                     {'env': None}, {'env': True}):
+        expected, _ = self._SourceEnvironment(ebuild_path, True, **kwargs)
+        env, spawns = self._SourceEnvironment(ebuild_path, False, **kwargs)
+        self.assertEqual(env, expected, '%s: %r' % (ebuild_path, kwargs))
+        needs_bash = os.path.basename(os.path.dirname(ebuild_path))
+        self.assertEqual(spawns, int(needs_bash in self.NEEDS_BASH),
+                         ebuild_path)
+
+  def testParseBashArray(self):
+    """Test that ParseBashArray parses values like bash does."""
+    values = [line.partition('=')[2]
+              for line in fileinput.input(self.ebuilds)
+              if line.startswith('CROS_WORKON_PROJECT=')]
+    values += ['("a" "b") # comment', "('a,b' c)", '"$HOME"', '()',
+               '(~/foo)', '$(echo foo)', 'foo bar', '"a\\"b"']
+    for value in values:
+      try:
+        with mock.patch.object(bash_vars, 'Evaluate',
+                               side_effect=bash_vars.UnsupportedSyntax):
+          expected = portage_utilities.ParseBashArray(value)
+      except cros_build_lib.RunCommandError:
+        expected = None
+      try:
+        result = portage_utilities.ParseBashArray(value)
+      except cros_build_lib.RunCommandError:
+        result = None
+      self.assertEqual(result, expected, value)
+
+  def testGetWorkonProjectMap(self):
+    """Test that no commands are run to find the workon projects."""
+    with mock.patch.object(cros_build_lib, 'RunCommand',
+                           side_effect=cros_build_lib.RunCommand) as rc:
+      projects = dict(portage_utilities.GetWorkonProjectMap(
+          self.OVERLAY, ['chromeos-base', 'sys-kernel']))
+    self.assertEqual(rc.call_count, 0)
+    self.assertEqual(
+        projects['chromeos-base/platform2/platform2-9999.ebuild'],
+        ['chromiumos/platform/common-mk', 'chromiumos/platform/libchromeos',
+         'chromiumos/platform/metrics', 'chromiumos/platform/shill'])
+
+
 class StubEBuild(portage_utilities.EBuild):
   def __init__(self, path):
     super(StubEBuild, self).__init__(path)
@@ -499,41 +603,136 @@ class FindOverlaysTest(cros_test_lib.MoxTestCase):
                      self.overlays[self.FAKE][self.PUBLIC])
 
 
-class BuildEBuildDictionaryTest(cros_test_lib.MoxTestCase):
+class BuildEBuildDictionaryTest(cros_test_lib.MoxTempDirTestCase):
 
   def setUp(self):
-    self.mox.StubOutWithMock(os, 'walk')
     self.mox.StubOutWithMock(cros_build_lib, 'RunCommand')
+    self.mox.StubOutWithMock(portage_utilities, '_GetEBuildIndexPath')
     self.package = 'chromeos-base/test_package'
-    self.root = '/overlay/chromeos-base/test_package'
+    self.overlay = os.path.join(self.tempdir, 'overlay')
+    self.root = os.path.join(self.overlay, self.package)
     self.package_path = self.root + '/test_package-0.0.1.ebuild'
-    paths = [[self.root, [], []]]
-    os.walk("/overlay").AndReturn(paths)
+    osutils.WriteFile(self.package_path, '', makedirs=True)
+    portage_utilities._GetEBuildIndexPath(self.overlay).AndReturn(
+        os.path.join(self.tempdir, 'index.json'))
     self.mox.StubOutWithMock(portage_utilities, '_FindUprevCandidates')
 
-
   def testWantedPackage(self):
-    overlays = {"/overlay": []}
+    overlays = {self.overlay: []}
     package = _Package(self.package)
-    portage_utilities._FindUprevCandidates([]).AndReturn(package)
+    portage_utilities._FindUprevCandidates(
+        [self.package_path],
+        mox.IsA(portage_utilities.EBuildIndex)).AndReturn(package)
     self.mox.ReplayAll()
     portage_utilities.BuildEBuildDictionary(
         overlays, False, [self.package])
     self.mox.VerifyAll()
     self.assertEquals(len(overlays), 1)
-    self.assertEquals(overlays["/overlay"], [package])
+    self.assertEquals(overlays[self.overlay], [package])
 
   def testUnwantedPackage(self):
-    overlays = {"/overlay": []}
+    overlays = {self.overlay: []}
     package = _Package(self.package)
-    portage_utilities._FindUprevCandidates([]).AndReturn(package)
+    portage_utilities._FindUprevCandidates(
+        [self.package_path],
+        mox.IsA(portage_utilities.EBuildIndex)).AndReturn(package)
     self.mox.ReplayAll()
     portage_utilities.BuildEBuildDictionary(overlays, False, [])
     self.assertEquals(len(overlays), 1)
-    self.assertEquals(overlays["/overlay"], [])
+    self.assertEquals(overlays[self.overlay], [])
     self.mox.VerifyAll()
 
 
+class EBuildIndexTest(cros_test_lib.MockTempDirTestCase):
+  """Tests for the persistent index of the ebuilds in an overlay."""
+
+  def setUp(self):
+    self.overlay = os.path.join(self.tempdir, 'overlay')
+    shutil.copytree(WorkonVariablesTest.OVERLAY, self.overlay)
+    self.index_path = os.path.join(self.tempdir, 'index.json')
+    self.PatchObject(portage_utilities, '_GetEBuildIndexPath',
+                     return_value=self.index_path)
+    self.read = self.PatchObject(
+        portage_utilities, 'ReadEBuildMetadata',
+        side_effect=portage_utilities.ReadEBuildMetadata)
+    self.ebuilds = sorted(
+        os.path.relpath(path, self.overlay)
+        for path in glob.glob(os.path.join(self.overlay, '*/*/*.ebuild')))
+
+  def _Refresh(self, subdirectories=None):
+    """Refresh the index, and return it and the number of ebuilds read."""
+    self.read.reset_mock()
+    index = portage_utilities.GetEBuildIndex(self.overlay, subdirectories)
+    return index, self.read.call_count
+
+  def testMetadata(self):
+    """Test the metadata read from an ebuild."""
+    index, _ = self._Refresh()
+    self.assertEquals(index.ListEBuilds(), self.ebuilds)
+    metadata = index.GetMetadata(
+        'chromeos-base/chromeos-factory/chromeos-factory-9999.ebuild')
+    self.assertEquals(metadata, index.GetMetadata(os.path.join(
+        self.overlay,
+        'chromeos-base/chromeos-factory/chromeos-factory-9999.ebuild')))
+    self.assertTrue(metadata['is_workon'])
+    self.assertFalse(metadata['is_stable'])
+    self.assertFalse(metadata['is_blacklisted'])
+    self.assertEquals(metadata['keywords'], ['~*'])
+    self.assertEquals(metadata['projects'], [
+        '("chromiumos/platform/factory" "chromiumos/platform/factory-utils")'])
+
+  def testTrailingStatement(self):
+    """Test an ebuild with another assignment after KEYWORDS."""
+    index, _ = self._Refresh()
+    metadata = index.GetMetadata('chromeos-base/shill/shill-9999.ebuild')
+    self.assertEquals(metadata['keywords'], ['~*'])
+    self.assertFalse(metadata['is_stable'])
+
+  def testIncrementalRefresh(self):
+    """Test that only changed ebuilds are read again."""
+    _, reads = self._Refresh()
+    self.assertEquals(reads, len(self.ebuilds))
+    _, reads = self._Refresh()
+    self.assertEquals(reads, 0)
+
+    shill = 'chromeos-base/shill/shill-9999.ebuild'
+    osutils.WriteFile(os.path.join(self.overlay, shill),
+                      'inherit cros-workon\nKEYWORDS="*"\n')
+    new = 'chromeos-base/shill/shill-0.0.1-r1.ebuild'
+    os.symlink('shill-9999.ebuild', os.path.join(self.overlay, new))
+    os.unlink(os.path.join(self.overlay, 'media-libs/mesa/mesa-9999.ebuild'))
+    index, reads = self._Refresh()
+    self.assertEquals(reads, 1)
+    self.assertTrue(index.GetMetadata(shill)['is_stable'])
+    self.assertEquals(index.GetMetadata(new), None)
+    self.assertEquals(len(index.ListEBuilds()), len(self.ebuilds) - 1)
+
+  def testSubdirectories(self):
+    """Test refreshing and listing only part of the overlay."""
+    subdirs = ['chromeos-base/shill', 'sys-kernel', 'missing']
+    index, reads = self._Refresh(subdirs)
+    self.assertEquals(reads, 3)
+    self.assertEquals(index.ListEBuilds(subdirs), [
+        'chromeos-base/shill/shill-9999.ebuild',
+        'sys-kernel/chromeos-kernel-next/chromeos-kernel-next-9999.ebuild',
+        'sys-kernel/chromeos-kernel/chromeos-kernel-9999.ebuild'])
+
+    # Entries outside the refreshed subdirectories are kept.
+    _, reads = self._Refresh()
+    self.assertEquals(reads, len(self.ebuilds) - 3)
+    shutil.rmtree(os.path.join(self.overlay, 'sys-kernel'))
+    index, reads = self._Refresh(['sys-kernel'])
+    self.assertEquals(reads, 0)
+    self.assertEquals(len(index.ListEBuilds()), len(self.ebuilds) - 2)
+
+  def testCorruptIndex(self):
+    """Test that unusable indexes are ignored."""
+    for content in ('garbage', '[]', '{"version": 0}'):
+      osutils.WriteFile(self.index_path, content)
+      _, reads = self._Refresh()
+      self.assertEquals(reads, len(self.ebuilds))
+
+
 class ProjectMappingTest(cros_test_lib.TestCase):
 
   def testSplitEbuildPath(self):
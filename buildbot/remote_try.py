@@ -6,6 +6,7 @@
 
 import constants
 import getpass
+import hashlib
 import json
 import os
 import shutil
@@ -20,6 +21,8 @@ from chromite.buildbot import repository
 from chromite.buildbot import manifest_version
 from chromite.lib import cros_build_lib
 from chromite.lib import git
+from chromite.lib import locking
+from chromite.lib import osutils
 
 
 class ChromiteUpgradeNeeded(Exception):
@@ -105,22 +108,42 @@ class RemoteTryJob(object):
         'version' : self.TRYJOB_FORMAT_VERSION,
         }
 
-  def _Submit(self, testjob, dryrun):
-    """Internal submission function.  See Submit() for arg description."""
-    # TODO(rcui): convert to shallow clone when that's available.
-    current_time = str(int(time.time()))
-    repository.CloneGitRepo(self.tryjob_repo, self.ssh_url)
-    version_path = os.path.join(self.tryjob_repo,
-                                self.TRYJOB_FORMAT_FILE)
-    with open(version_path, 'r') as f:
-      try:
-        val = int(f.read().strip())
-      except ValueError:
-        raise ChromiteUpgradeNeeded()
-      if val > self.TRYJOB_FORMAT_VERSION:
-        raise ChromiteUpgradeNeeded(val)
+  def _SyncTryjobRepo(self, testjob):
+    """Bring the tryjob repo up to date, and check out a branch to push from.
 
-    ref_base = os.path.join('refs/tryjobs', self.user, current_time)
+    The repo only fetches the branch being pushed to, one commit deep, and is
+    reused across submissions, so only new jobs need to be downloaded.
+    """
+    remote_branch = 'test' if testjob else 'master'
+    tracking_ref = 'refs/remotes/origin/%s' % remote_branch
+    if not os.path.isdir(os.path.join(self.tryjob_repo, '.git')):
+      git.RunGit(self.tryjob_repo, ['init', '--quiet'])
+      git.RunGit(self.tryjob_repo, ['remote', 'add', 'origin', self.ssh_url])
+    git.RunGit(self.tryjob_repo, ['config', 'remote.origin.url', self.ssh_url])
+    # Retries of the push fetch the remote again; keep them on this branch.
+    git.RunGit(self.tryjob_repo,
+               ['config', 'remote.origin.fetch',
+                '+refs/heads/%s:%s' % (remote_branch, tracking_ref)])
+    cros_build_lib.RetryCommand(
+        git.RunGit, constants.SYNC_RETRIES, self.tryjob_repo,
+        ['fetch', '--depth=1', 'origin'], sleep=5, retry_on=(128,))
+
+    # Drop anything left behind by an earlier, failed submission.
+    push_branch = manifest_version.PUSH_BRANCH
+    git.RunGit(self.tryjob_repo, ['checkout', '--quiet', '--force', '-B',
+                                  push_branch, '-t', tracking_ref])
+    git.RunGit(self.tryjob_repo, ['clean', '-d', '-x', '--force', '--quiet'])
+    return push_branch
+
+  def _UploadPatches(self, ref_base, dryrun):
+    """Upload the local patches, with one push per project.
+
+    Args:
+      ref_base: The remote ref to push the patches under.
+      dryrun: Do the git pushes with --dry-run.
+    """
+    pushes = []
+    refspecs = {}
     for patch in self.local_patches:
       # Isolate the name; if it's a tag or a remote, let through.
       # Else if it's a branch, get the full branch name minus refs/heads.
@@ -129,7 +152,11 @@ class RemoteTryJob(object):
 
       self.manifest.AssertProjectIsPushable(patch.project)
       data = self.manifest.projects[patch.project]
-      patch.Upload(data['push_url'], ref_final, dryrun=dryrun)
+      key = (patch.project_url, data['push_url'])
+      if key not in refspecs:
+        pushes.append(key)
+        refspecs[key] = []
+      refspecs[key].append(patch.GetUploadRefspec(ref_final))
 
       # TODO(rcui): Pass in the remote instead of tag. http://crosbug.com/33937.
       tag = constants.EXTERNAL_PATCH_TAG
@@ -140,10 +167,28 @@ class RemoteTryJob(object):
                              % (patch.project, local_branch, ref_final,
                                 patch.tracking_branch, tag))
 
-    push_branch = manifest_version.PUSH_BRANCH
-    remote_branch = ('origin', 'refs/remotes/origin/test') if testjob else None
-    git.CreatePushBranch(push_branch, self.tryjob_repo, sync=False,
-                         remote_push_branch=remote_branch)
+    for project_url, push_url in pushes:
+      cmd = ['push', push_url] + refspecs[(project_url, push_url)]
+      if dryrun:
+        cmd.append('--dry-run')
+      git.RunGit(project_url, cmd)
+
+  def _Submit(self, testjob, dryrun):
+    """Internal submission function.  See Submit() for arg description."""
+    current_time = str(int(time.time()))
+    push_branch = self._SyncTryjobRepo(testjob)
+    version_path = os.path.join(self.tryjob_repo,
+                                self.TRYJOB_FORMAT_FILE)
+    with open(version_path, 'r') as f:
+      try:
+        val = int(f.read().strip())
+      except ValueError:
+        raise ChromiteUpgradeNeeded()
+      if val > self.TRYJOB_FORMAT_VERSION:
+        raise ChromiteUpgradeNeeded(val)
+
+    ref_base = os.path.join('refs/tryjobs', self.user, current_time)
+    self._UploadPatches(ref_base, dryrun)
 
     file_name = '%s.%s' % (self.user,
                            current_time)
@@ -175,26 +220,49 @@ class RemoteTryJob(object):
           'submission requests by users.  Please try again.')
       raise
 
+  def _GetCachedRepoPath(self):
+    """Get the path of the tryjob repo in the cache, or None if no cache."""
+    cache_dir = getattr(self.options, 'cache_dir', None)
+    if cache_dir is None:
+      return None
+    return os.path.join(cache_dir, 'tryjobs',
+                        hashlib.md5(self.ssh_url).hexdigest())
+
   def Submit(self, workdir=None, testjob=False, dryrun=False):
     """Submit the tryjob through Git.
 
     Args:
-      workdir: The directory to clone tryjob repo into.  If you pass this
+      workdir: The directory to keep the tryjob repo in.  If you pass this
                in, you are responsible for deleting the directory.  Used for
-               testing.
+               testing.  Defaults to a repo in the cache directory, which is
+               reused by later submissions.
       testjob: Submit job to the test branch of the tryjob repo.  The tryjob
                will be ignored by production master.
       dryrun: Setting to true will run everything except the final submit step.
     """
+    tempdir = None
+    shared = False
     self.tryjob_repo = workdir
     if self.tryjob_repo is None:
-      self.tryjob_repo = tempfile.mkdtemp()
+      self.tryjob_repo = self._GetCachedRepoPath()
+      shared = self.tryjob_repo is not None
+    if self.tryjob_repo is None:
+      tempdir = tempfile.mkdtemp()
+      self.tryjob_repo = os.path.join(tempdir, 'tryjobs')
+    osutils.SafeMakedirs(self.tryjob_repo)
 
     try:
-      self._Submit(testjob, dryrun)
+      if shared:
+        # Other submissions may be using the same cached repo.
+        with locking.FileLock('%s.lock' % self.tryjob_repo,
+                              description='tryjob repo lock') as lock:
+          lock.write_lock()
+          self._Submit(testjob, dryrun)
+      else:
+        self._Submit(testjob, dryrun)
     finally:
-      if workdir is None:
-        shutil.rmtree(self.tryjob_repo)
+      if tempdir is not None:
+        shutil.rmtree(tempdir)
 
   def GetTrybotConsoleLink(self):
     """Get link to the console for the user."""
@@ -16,6 +16,7 @@ sys.path.insert(0, constants.SOURCE_ROOT)
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
 from chromite.lib import git
+from chromite.lib import osutils
 from chromite.buildbot import remote_try
 from chromite.buildbot import repository
 from chromite.scripts import cbuildbot
@@ -180,6 +181,60 @@ class RemoteTryTests(cros_test_lib.MoxTempDirTestCase):
         cwd=self.checkout_dir).output.strip()
     self.assertEqual(remote_url, self.int_mirror)
 
+  def testCachedTryJobRepo(self):
+    """Verify the tryjob repo is reused and cleaned between submissions."""
+    self.mox.StubOutWithMock(repository, 'IsARepoRoot')
+    repository.IsARepoRoot(mox.IgnoreArg()).AndReturn(False)
+    self.mox.ReplayAll()
+    job = self._CreateJob()
+
+    self._SubmitJob(self.checkout_dir, job)
+    git_dir = os.stat(os.path.join(self.checkout_dir, '.git'))
+    stray_file = os.path.join(self.checkout_dir, 'stray')
+    osutils.WriteFile(stray_file, 'left behind')
+    time.sleep(1)
+    self._SubmitJob(self.checkout_dir, job)
+    self.assertEqual(os.stat(os.path.join(self.checkout_dir, '.git')).st_ino,
+                     git_dir.st_ino)
+    self.assertFalse(os.path.exists(stray_file))
+
+  def testUploadPatches(self):
+    """Verify local patches are pushed with one push per project."""
+    class FakePatch(object):
+      def __init__(self, project, sha1):
+        self.project = project
+        self.project_url = '/checkout/%s' % project
+        self.ref = 'refs/heads/mybranch'
+        self.sha1 = sha1
+        self.tracking_branch = 'master'
+      def GetUploadRefspec(self, remote_ref):
+        return '%s:%s' % (self.sha1, remote_ref)
+
+    self.mox.StubOutWithMock(repository, 'IsARepoRoot')
+    repository.IsARepoRoot(mox.IgnoreArg()).AndReturn(False)
+    self.mox.StubOutWithMock(git, 'GetProjectUserEmail')
+    git.GetProjectUserEmail(mox.IgnoreArg()).AndReturn('user@example.com')
+    self.mox.StubOutWithMock(git, 'RunGit')
+    git.RunGit('/checkout/a', ['push', 'a_url', '1:base/mybranch/1',
+                               '3:base/mybranch/3', '--dry-run'])
+    git.RunGit('/checkout/b', ['push', 'b_url', '2:base/mybranch/2',
+                               '--dry-run'])
+    self.mox.ReplayAll()
+
+    job = self._CreateJob(mirror=False)
+    job.manifest = self.mox.CreateMock(git.ManifestCheckout)
+    job.manifest.projects = {
+        'a': {'push_url': 'a_url', 'remote': constants.EXTERNAL_REMOTE},
+        'b': {'push_url': 'b_url', 'remote': constants.INTERNAL_REMOTE},
+    }
+    job.manifest.AssertProjectIsPushable = lambda project: None
+    job.local_patches = [FakePatch('a', '1'), FakePatch('b', '2'),
+                         FakePatch('a', '3')]
+    job._UploadPatches('base', dryrun=True)
+    self.mox.VerifyAll()
+    self.assertTrue('--remote-patches=b:mybranch:base/mybranch/2:master:%s'
+                    % constants.INTERNAL_PATCH_TAG in job.extra_args)
+
   def testBareTryJob(self):
     """Verify submitting a tryjob from just a chromite checkout works."""
     self.mox.StubOutWithMock(repository, 'IsARepoRoot')
@@ -0,0 +1,164 @@
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Push notification channels for builder statuses.
+
+Slaves publish their statuses to a channel in addition to Google Storage, and
+masters block on the channel between status checks so that they notice a
+finished slave within seconds rather than at the next poll.  Google Storage
+remains the source of truth; the channel only tells the master when to look.
+"""
+
+import json
+import logging
+import os
+import time
+import urllib
+import urllib2
+
+from chromite.lib import osutils
+
+
+class StatusChannelError(Exception):
+  """Raised when a status channel cannot be reached."""
+
+
+class StatusChannel(object):
+  """Interface for publishing and waiting on builder statuses."""
+
+  def Publish(self, builder, version, status, message=None):
+    """Publishes the status of |builder| for |version|.
+
+    Args:
+      builder: Builder name.
+      version: Version string.
+      status: One of the manifest_version.BuilderStatus status strings.
+      message: Optional message accompanying the status.
+    """
+    raise NotImplementedError()
+
+  def TryPublish(self, builder, version, status, message=None):
+    """Like Publish, but logs a warning rather than raising on failure."""
+    try:
+      self.Publish(builder, version, status, message=message)
+    except StatusChannelError as e:
+      logging.warning('Failed to publish status of %s to status channel: %s',
+                      builder, e)
+
+  def Wait(self, builders, version, timeout):
+    """Blocks until one of |builders| publishes a new status for |version|.
+
+    Args:
+      builders: List of builder names to wait on.
+      version: Version string.
+      timeout: Maximum number of seconds to wait.
+
+    Returns:
+      A dictionary mapping builders to (status, message) tuples for those
+      builders whose status changed; empty if |timeout| expired first.
+    """
+    raise NotImplementedError()
+
+
+class FileStatusChannel(StatusChannel):
+  """Status channel backed by a directory shared by masters and slaves."""
+
+  # How often to check the directory for new statuses.
+  POLL_INTERVAL = 1
+
+  def __init__(self, directory):
+    self.directory = directory
+    self._seen = {}
+
+  def _GetPath(self, builder, version):
+    return os.path.join(self.directory, version, builder)
+
+  def _Read(self, builder, version):
+    """Returns the (mtime, status, message) published for |builder|."""
+    path = self._GetPath(builder, version)
+    try:
+      mtime = os.stat(path).st_mtime
+      data = json.loads(osutils.ReadFile(path))
+    except (IOError, OSError, ValueError):
+      return None
+    return mtime, data['status'], data.get('message')
+
+  def Publish(self, builder, version, status, message=None):
+    data = json.dumps(dict(status=status, message=message))
+    try:
+      osutils.WriteFile(self._GetPath(builder, version), data, atomic=True,
+                        makedirs=True)
+    except (IOError, OSError) as e:
+      raise StatusChannelError(str(e))
+
+  def Wait(self, builders, version, timeout):
+    deadline = time.time() + timeout
+    while True:
+      changed = {}
+      for builder in builders:
+        entry = self._Read(builder, version)
+        if entry is not None and self._seen.get((builder, version)) != entry:
+          self._seen[(builder, version)] = entry
+          changed[builder] = entry[1:]
+      remaining = deadline - time.time()
+      if changed or remaining <= 0:
+        return changed
+      time.sleep(min(self.POLL_INTERVAL, remaining))
+
+
+class HTTPStatusChannel(StatusChannel):
+  """Status channel backed by a lightweight HTTP status service.
+
+  Statuses are PUT as JSON to <url>/<version>/<builder>.  Waiting is a long
+  poll: GET <url>/<version>?builders=a,b&timeout=N&since=S blocks until one
+  of the builders publishes after the server's sequence number S, and returns
+  a JSON object with the changed 'statuses' and the new 'seq' number.
+  """
+
+  # Extra time allowed for the service to answer a long poll.
+  HTTP_SLACK = 10
+
+  def __init__(self, url):
+    self.url = url.rstrip('/')
+    self._seq = {}
+
+  def _Open(self, request, timeout):
+    try:
+      return urllib2.urlopen(request, timeout=timeout).read()
+    except (urllib2.URLError, IOError) as e:
+      raise StatusChannelError('%s: %s' % (request.get_full_url(), e))
+
+  def Publish(self, builder, version, status, message=None):
+    url = '/'.join((self.url, urllib.quote(version), urllib.quote(builder)))
+    request = urllib2.Request(url, json.dumps(dict(status=status,
+                                                   message=message)),
+                              {'Content-Type': 'application/json'})
+    request.get_method = lambda: 'PUT'
+    self._Open(request, self.HTTP_SLACK)
+
+  def Wait(self, builders, version, timeout):
+    query = urllib.urlencode(dict(builders=','.join(builders),
+                                  timeout=int(timeout),
+                                  since=self._seq.get(version, 0)))
+    url = '%s/%s?%s' % (self.url, urllib.quote(version), query)
+    body = self._Open(urllib2.Request(url), timeout + self.HTTP_SLACK)
+    try:
+      data = json.loads(body)
+      self._seq[version] = data['seq']
+      return dict((b, (s['status'], s.get('message')))
+                  for b, s in data['statuses'].iteritems())
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+      raise StatusChannelError('Bad response from %s: %s' % (url, e))
+
+
+def GetStatusChannel(spec):
+  """Returns the status channel described by |spec|.
+
+  Args:
+    spec: An http:// or https:// url of a status service, or the path to a
+      directory shared between the builders.
+  """
+  if spec.startswith(('http://', 'https://')):
+    return HTTPStatusChannel(spec)
+  return FileStatusChannel(spec)
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for status_channel.py."""
+
+import BaseHTTPServer
+import json
+import sys
+import threading
+import urlparse
+
+import constants
+if __name__ == '__main__':
+  sys.path.insert(0, constants.SOURCE_ROOT)
+
+from chromite.buildbot import status_channel
+from chromite.lib import cros_test_lib
+
+# pylint: disable=W0212,R0904
+
+
+class FileStatusChannelTest(cros_test_lib.TempDirTestCase):
+  """Tests for FileStatusChannel."""
+
+  def setUp(self):
+    self.publisher = status_channel.FileStatusChannel(self.tempdir)
+    self.channel = status_channel.FileStatusChannel(self.tempdir)
+    self.channel.POLL_INTERVAL = 0.01
+
+  def testWaitTimeout(self):
+    """Tests that Wait returns nothing if no status is published."""
+    self.assertEqual(self.channel.Wait(['build1'], '1.2.3', 0.05), {})
+
+  def testWaitReportsChanges(self):
+    """Tests that Wait only reports statuses it has not seen yet."""
+    self.publisher.Publish('build1', '1.2.3', 'inflight')
+    self.assertEqual(self.channel.Wait(['build1', 'build2'], '1.2.3', 0.05),
+                     {'build1': ('inflight', None)})
+    self.assertEqual(self.channel.Wait(['build1', 'build2'], '1.2.3', 0.05),
+                     {})
+    self.publisher.Publish('build2', '1.2.3', 'fail', message='oops')
+    self.assertEqual(self.channel.Wait(['build1', 'build2'], '1.2.3', 0.05),
+                     {'build2': ('fail', 'oops')})
+
+  def testPublishError(self):
+    """Tests that TryPublish swallows errors."""
+    channel = status_channel.FileStatusChannel('/dev/null/channel')
+    self.assertRaises(status_channel.StatusChannelError, channel.Publish,
+                      'build1', '1.2.3', 'pass')
+    channel.TryPublish('build1', '1.2.3', 'pass')
+
+
+class _StatusHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Minimal stand-in for the status service."""
+
+  def log_message(self, *args):
+    pass
+
+  def do_PUT(self):
+    _, version, builder = self.path.split('/')
+    data = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+    self.server.statuses[(version, builder)] = data
+    self.send_response(200)
+    self.end_headers()
+
+  def do_GET(self):
+    url = urlparse.urlparse(self.path)
+    version = url.path.strip('/')
+    builders = urlparse.parse_qs(url.query)['builders'][0].split(',')
+    statuses = dict((b, self.server.statuses[(version, b)]) for b in builders
+                    if (version, b) in self.server.statuses)
+    body = json.dumps(dict(statuses=statuses, seq=len(self.server.statuses)))
+    self.send_response(200)
+    self.end_headers()
+    self.wfile.write(body)
+
+
+class HTTPStatusChannelTest(cros_test_lib.TestCase):
+  """Tests for HTTPStatusChannel against a local stand-in service."""
+
+  def setUp(self):
+    self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _StatusHandler)
+    self.server.statuses = {}
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+    self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def testPublishAndWait(self):
+    """Tests that published statuses are returned by Wait."""
+    channel = status_channel.GetStatusChannel(self.url)
+    self.assertTrue(isinstance(channel, status_channel.HTTPStatusChannel))
+    channel.Publish('build1', '1.2.3', 'pass', message='done')
+    self.assertEqual(channel.Wait(['build1', 'build2'], '1.2.3', 1),
+                     {'build1': ('pass', 'done')})
+    self.assertEqual(channel._seq['1.2.3'], 1)
+
+  def testUnreachable(self):
+    """Tests that connection errors are raised as StatusChannelError."""
+    self.server.shutdown()
+    self.server.server_close()
+    channel = status_channel.HTTPStatusChannel(self.url)
+    self.assertRaises(status_channel.StatusChannelError, channel.Wait,
+                      ['build1'], '1.2.3', 0)
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
@@ -17,7 +17,7 @@ from chromite.lib import cros_build_lib
 
 
 # Max amount of data we're hold in the buffer at a given time.
-_BUFSIZE = 1024
+_BUFSIZE = 64 * 1024
 
 # Custom signal handlers so we can catch the exception and handle
 # it.
@@ -38,7 +38,7 @@ def _output(line, output_files, complain):
   """Print line to output_files.
 
   Args:
-    line: Line to print.
+    line: Line (or block of lines) to print.
     output_files: List of files to print to.
     complain: Print a warning if we get EAGAIN errors. Only one error
               is printed per line.
@@ -67,10 +67,39 @@ def _output(line, output_files, complain):
         _output(warning, output_files, False)
 
 
+def _read(fd):
+  """Read up to _BUFSIZE bytes from |fd|, retrying on EINTR."""
+  while True:
+    try:
+      return os.read(fd, _BUFSIZE)
+    except OSError as ex:
+      if ex.errno != errno.EINTR:
+        raise
+
+
 def _tee(input_file, output_files, complain):
-  """Read lines from input_file and write to output_files."""
-  for line in iter(lambda: input_file.readline(_BUFSIZE), ''):
-    _output(line, output_files, complain)
+  """Read lines from input_file and write to output_files.
+
+  Input is read in blocks of up to _BUFSIZE bytes and each block is written
+  to the outputs with a single write, rather than a read and write per line.
+  A trailing partial line is held back while more input is already waiting,
+  so lines are not split across writes unless they are longer than _BUFSIZE
+  or the writer pauses mid-line.
+  """
+  fd = input_file.fileno()
+  pending = ''
+  for data in iter(lambda: _read(fd), ''):
+    data = pending + data
+    pending = ''
+    end = data.rfind('\n') + 1
+    if (end < len(data) and len(data) - end < _BUFSIZE and
+        select.select([fd], [], [], 0)[0]):
+      data, pending = data[:end], data[end:]
+    if data:
+      _output(data, output_files, complain)
+
+  if pending:
+    _output(pending, output_files, complain)
 
 
 class _TeeProcess(multiprocessing.Process):
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for tee.py."""
+
+import os
+import sys
+import threading
+
+import constants
+if __name__ == '__main__':
+  sys.path.insert(0, constants.SOURCE_ROOT)
+
+from chromite.buildbot import tee
+from chromite.lib import cros_test_lib
+from chromite.lib import osutils
+
+# pylint: disable=W0212,R0904
+
+
+class TeeTest(cros_test_lib.MockTempDirTestCase):
+  """Tests for the tee data path."""
+
+  def _RunTee(self, chunks, background=False):
+    """Feed |chunks| through tee._tee and return what was written.
+
+    Args:
+      chunks: List of strings to write to tee's input pipe.
+      background: Write the chunks from a separate thread while tee runs,
+        rather than before it starts.  Needed if they do not fit in the pipe.
+
+    Returns:
+      A tuple of the contents of the output file and the list of blocks that
+      were passed to tee._output.
+    """
+    blocks = []
+    real_output = tee._output
+    def _Output(line, output_files, complain):
+      blocks.append(line)
+      real_output(line, output_files, complain)
+    self.PatchObject(tee, '_output', side_effect=_Output)
+
+    read_fd, write_fd = os.pipe()
+    def _Writer():
+      for chunk in chunks:
+        os.write(write_fd, chunk)
+      os.close(write_fd)
+    writer = threading.Thread(target=_Writer)
+    writer.start()
+    if not background:
+      writer.join()
+
+    path = os.path.join(self.tempdir, 'out')
+    with open(path, 'w', 0) as output:
+      with os.fdopen(read_fd, 'r', 0) as input_file:
+        tee._tee(input_file, [output], False)
+    writer.join()
+    return osutils.ReadFile(path), blocks
+
+  def testCopiesEverything(self):
+    """Test that all data is copied, in order, in large blocks."""
+    lines = ['line %d of the log\n' % i for i in xrange(20000)]
+    data, blocks = self._RunTee([''.join(lines), 'no newline'],
+                                background=True)
+    self.assertEqual(data, ''.join(lines) + 'no newline')
+    self.assertTrue(len(blocks) < len(lines) / 100)
+    self.assertTrue(max(len(b) for b in blocks) < 2 * tee._BUFSIZE)
+
+  def testKeepsLinesWhole(self):
+    """Test that lines split across reads are output whole."""
+    self.PatchObject(tee, '_BUFSIZE', 32)
+    lines = ['line %d\n' % i for i in xrange(100)]
+    data, blocks = self._RunTee(lines)
+    self.assertEqual(data, ''.join(lines))
+    for block in blocks:
+      self.assertTrue(block.endswith('\n'))
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
@@ -5,17 +5,30 @@
 """This package contains all valid cros commands and their unittests.
 
 All commands can be either imported directly or looked up using this module.
-This modules contains a dictionary called commands mapping
-command names -> command classes e.g. image->cros_image.ImageCommand.
+Commands are registered in _COMMAND_MODULES below so that cros can list them
+without importing anything, and only import the module of the command that is
+actually run.  ListCommands returns a dictionary mapping command names ->
+command classes e.g. image->cros_image.ImageCommand.
 """
 
 import glob
 import imp
 import os
+import sys
 
 from chromite import cros
 
 
+# Maps each command name to the cros_* module in this package declaring it.
+# Keep this in sync with the CommandDecorator calls in those modules.
+_COMMAND_MODULES = {
+    'build': 'cros_build',
+    'chrome-sdk': 'cros_chrome_sdk',
+    'image': 'cros_image',
+    'lint': 'cros_lint',
+}
+
+
 def _FindModules(subdir_path):
   """Returns a list of all the relevant python modules in |sub_dir_path|"""
   # We only load cros_[!unittest] modules.
@@ -27,6 +40,14 @@ def _FindModules(subdir_path):
   return modules
 
 
+def _LoadModule(mod_name):
+  """Imports the module |mod_name| from this package, unless already loaded."""
+  if mod_name in sys.modules:
+    return
+  subdir_path = os.path.dirname(__file__)
+  imp.load_module(mod_name, *imp.find_module(mod_name, [subdir_path]))
+
+
 def _ImportCommands():
   """Directly imports all cros_[!unittest] python modules.
 
@@ -37,15 +58,35 @@ def _ImportCommands():
   subdir_path = os.path.dirname(__file__)
   for file_path in _FindModules(subdir_path):
     file_name = os.path.basename(file_path)
-    mod_name = os.path.splitext(file_name)[0]
-    imp.load_module(mod_name, *imp.find_module(mod_name, [subdir_path]))
+    _LoadModule(os.path.splitext(file_name)[0])
 
 
-def ListCommands():
-  """Return a dictionary mapping command names to classes."""
+def ListCommandNames():
+  """Return a sorted list of command names, without importing any commands."""
+  return sorted(_COMMAND_MODULES)
+
+
+def ImportCommand(name):
+  """Import the module declaring command |name| and return its class.
+
+  Args:
+    name: Name of the command, as returned by ListCommandNames.
+
+  Returns:
+    The CrosCommand subclass implementing the command.
+  """
   # pylint: disable=W0212
-  return cros._commands.copy()
+  if name not in cros._commands:
+    _LoadModule(_COMMAND_MODULES[name])
+  return cros._commands[name]
 
 
-_ImportCommands()
+def ListCommands():
+  """Return a dictionary mapping command names to classes.
 
+  This imports every command module; prefer ImportCommand when only one
+  command is needed.
+  """
+  _ImportCommands()
+  # pylint: disable=W0212
+  return cros._commands.copy()
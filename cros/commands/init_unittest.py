@@ -18,6 +18,7 @@ from chromite.lib import commandline
 from chromite.lib import cros_build_lib_unittest
 from chromite.lib import cros_test_lib
 from chromite.lib import partial_mock
+from chromite import cros
 from chromite.cros import commands
 
 
@@ -81,6 +82,25 @@ class CommandTest(cros_test_lib.MoxTestCase):
     commands._ImportCommands()
     self.mox.VerifyAll()
 
+  def testCommandModules(self):
+    """Tests that the registry matches the commands the modules declare."""
+    all_commands = commands.ListCommands()
+    self.assertEqual(sorted(all_commands), commands.ListCommandNames())
+    for name, mod_name in commands._COMMAND_MODULES.iteritems():
+      self.assertEqual(all_commands[name].__module__, mod_name)
+
+  def testImportCommand(self):
+    """Tests that ImportCommand only loads the module of that command."""
+    self.mox.stubs.Set(cros, '_commands', {})
+    self.mox.StubOutWithMock(commands, '_LoadModule')
+    commands._LoadModule('cros_image').WithSideEffects(
+        lambda _: cros._commands.update(image=cros.CrosCommand))
+
+    self.mox.ReplayAll()
+    self.assertEqual(commands.ImportCommand('image'), cros.CrosCommand)
+    self.assertEqual(commands.ImportCommand('image'), cros.CrosCommand)
+    self.mox.VerifyAll()
+
 
 if __name__ == '__main__':
   cros_test_lib.main()
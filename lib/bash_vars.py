@@ -0,0 +1,566 @@
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Evaluate the variable assignments in simple bash scripts without bash.
+
+Ebuilds and portage environment files are sourced by bash just to read a few
+variables out of them, at the cost of a process per file.  This module handles
+the restricted subset of bash those variables are set with: top level
+assignments of literal and quoted strings, arrays and simple variable
+references, plus function definitions, `inherit` and `declare`/`export`,
+which have no effect on the values.
+
+Anything else raises UnsupportedSyntax, so that callers can fall back to
+running bash.  The evaluator is deliberately conservative: whenever a value
+cannot be computed exactly, it is treated as unknown, and asking for an
+unknown value raises UnsupportedSyntax too.
+"""
+
+import re
+
+
+class UnsupportedSyntax(Exception):
+  """Raised for bash constructs that the evaluator does not handle."""
+
+
+_NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+_ASSIGN_RE = re.compile(r'([A-Za-z_][A-Za-z0-9_]*)(\+?)=')
+_SPECIAL_PARAMS = '0123456789@*#?$!-'
+_METACHARS = ' \t\n;&|()<>'
+_OPERATORS = ('&&', '||', ';;', '<<<', '<<-', '<<', '>>', '<&', '>&', '<>',
+              '>|', '&', '|', ';', '(', ')', '<', '>')
+# Commands that may appear at the top level without affecting any variables.
+_IGNORED_COMMANDS = ('inherit',)
+# Builtins that set variables, and the options of theirs that are supported.
+_DECLARE_COMMANDS = ('declare', 'export', 'typeset')
+_DECLARE_OPTIONS = ('-a', '-x', '-ax', '-xa', '--')
+# Variables that bash sets itself; their values are not known here.
+_BASH_VARIABLES = frozenset((
+    'BASH', 'BASHOPTS', 'BASHPID', 'BASH_ALIASES', 'BASH_ARGC', 'BASH_ARGV',
+    'BASH_ARGV0', 'BASH_CMDS', 'BASH_COMMAND', 'BASH_EXECUTION_STRING',
+    'BASH_LINENO', 'BASH_LOADABLES_PATH', 'BASH_SOURCE', 'BASH_SUBSHELL',
+    'BASH_VERSINFO', 'BASH_VERSION', 'COMP_WORDBREAKS', 'DIRSTACK',
+    'EPOCHREALTIME', 'EPOCHSECONDS', 'EUID', 'FUNCNAME', 'GROUPS', 'HISTCMD',
+    'HOSTNAME', 'HOSTTYPE', 'IFS', 'LINENO', 'MACHTYPE', 'OLDPWD', 'OPTARG',
+    'OPTERR', 'OPTIND', 'OSTYPE', 'PATH', 'PIPESTATUS', 'PPID', 'PS4', 'PWD',
+    'RANDOM', 'REPLY', 'SECONDS', 'SHELL', 'SHELLOPTS', 'SHLVL', 'SRANDOM',
+    'TERM', 'UID', '_',
+))
+# Environment variables that change how bash starts up or parses scripts.
+_BASH_STARTUP_VARIABLES = ('BASH_ENV', 'BASHOPTS', 'POSIXLY_CORRECT',
+                           'SHELLOPTS')
+
+# Kinds of word parts.
+_TEXT = 'text'
+_PATTERN = 'pattern'
+_VAR = 'var'
+_UNKNOWN = 'unknown'
+_EXEC = 'exec'
+
+# Marker for variables whose value could not be computed.
+_UNKNOWN_VALUE = object()
+
+
+class _Word(object):
+  """A shell word, as a list of (kind, value, quoted) parts.
+
+  Parts are literal _TEXT, unquoted _PATTERN characters that are subject to
+  globbing, tilde or brace expansion, references to a single _VAR, _UNKNOWN
+  expansions without side effects, and _EXEC for command substitutions.
+  |raw| is the source text of the word.
+  """
+
+  def __init__(self):
+    self.parts = []
+    self.raw = ''
+    self.quoted = False
+
+  def Add(self, kind, value, quoted):
+    self.parts.append((kind, value, quoted))
+    self.quoted = self.quoted or quoted
+
+  @property
+  def literal(self):
+    """The text of the word if it is a single unquoted literal, else None."""
+    if self.quoted or any(kind not in (_TEXT, _PATTERN)
+                          for kind, _, _ in self.parts):
+      return None
+    return ''.join(value for _, value, _ in self.parts)
+
+  def HasExec(self):
+    return any(kind == _EXEC for kind, _, _ in self.parts)
+
+
+class _Lexer(object):
+  """Splits bash source into words, operators and newlines.
+
+  Yields ('word', _Word), ('array', (name, append, [_Word])), ('op', str) and
+  ('newline', None) tokens.  Here documents are skipped.
+  """
+
+  def __init__(self, text):
+    self.text = text
+    self.pos = 0
+    self.heredocs = []
+
+  def _Peek(self, offset=0):
+    pos = self.pos + offset
+    return self.text[pos] if pos < len(self.text) else ''
+
+  def Tokens(self):
+    while True:
+      c = self._Peek()
+      if not c:
+        if self.heredocs:
+          raise UnsupportedSyntax('unterminated here document')
+        return
+      elif c in ' \t':
+        self.pos += 1
+      elif c == '\\' and self._Peek(1) == '\n':
+        self.pos += 2
+      elif c == '#':
+        end = self.text.find('\n', self.pos)
+        self.pos = len(self.text) if end == -1 else end
+      elif c == '\n':
+        self.pos += 1
+        self._SkipHeredocs()
+        yield 'newline', None
+      elif c in _METACHARS:
+        op = self._ReadOperator()
+        if op in ('<<', '<<-'):
+          self._ReadHeredocDelimiter(op == '<<-')
+        yield 'op', op
+      else:
+        word = self._ReadWord()
+        m = _ASSIGN_RE.match(word.raw)
+        if m and m.end() == len(word.raw) and self._Peek() == '(':
+          self.pos += 1
+          yield 'array', (m.group(1), bool(m.group(2)), self._ReadArray())
+        else:
+          yield 'word', word
+
+  def _ReadOperator(self):
+    for op in _OPERATORS:
+      if self.text.startswith(op, self.pos):
+        self.pos += len(op)
+        return op
+    raise UnsupportedSyntax('unexpected %r' % self._Peek())
+
+  def _ReadHeredocDelimiter(self, strip_tabs):
+    while self._Peek() in ' \t':
+      self.pos += 1
+    word = self._ReadWord()
+    delimiter = ''.join(value for _, value, _ in word.parts)
+    if not delimiter or any(kind != _TEXT for kind, _, _ in word.parts):
+      raise UnsupportedSyntax('unsupported here document delimiter')
+    self.heredocs.append((delimiter, strip_tabs))
+
+  def _SkipHeredocs(self):
+    for delimiter, strip_tabs in self.heredocs:
+      while True:
+        if self.pos >= len(self.text):
+          raise UnsupportedSyntax('unterminated here document')
+        end = self.text.find('\n', self.pos)
+        end = len(self.text) if end == -1 else end
+        line = self.text[self.pos:end]
+        self.pos = end + 1
+        if (line.lstrip('\t') if strip_tabs else line) == delimiter:
+          break
+    self.heredocs = []
+
+  def _ReadArray(self):
+    """Read the elements of an array assignment, up to the closing paren."""
+    elements = []
+    while True:
+      c = self._Peek()
+      if not c:
+        raise UnsupportedSyntax('unterminated array')
+      elif c in ' \t\n':
+        self.pos += 1
+      elif c == '\\' and self._Peek(1) == '\n':
+        self.pos += 2
+      elif c == '#':
+        while self._Peek() not in ('', '\n'):
+          self.pos += 1
+      elif c == ')':
+        self.pos += 1
+        return elements
+      elif c in _METACHARS:
+        raise UnsupportedSyntax('unexpected %r in array' % c)
+      else:
+        elements.append(self._ReadWord())
+
+  def _ReadWord(self):
+    word = _Word()
+    start = self.pos
+    literal = []
+
+    def Flush(quoted=False):
+      if literal:
+        word.Add(_TEXT, ''.join(literal), quoted)
+        del literal[:]
+
+    while True:
+      c = self._Peek()
+      if not c or c in _METACHARS:
+        break
+      elif c == '\\':
+        nxt = self._Peek(1)
+        self.pos += 2
+        if nxt == '\n':
+          continue
+        Flush()
+        word.Add(_TEXT, nxt, True)
+      elif c == "'":
+        end = self.text.find("'", self.pos + 1)
+        if end == -1:
+          raise UnsupportedSyntax('unterminated single quote')
+        Flush()
+        word.Add(_TEXT, self.text[self.pos + 1:end], True)
+        self.pos = end + 1
+      elif c == '"':
+        Flush()
+        self.pos += 1
+        self._ReadDoubleQuoted(word)
+      elif c == '$' or c == '`':
+        Flush()
+        self._ReadExpansion(word, False)
+      else:
+        if c in '*?[~{':
+          Flush()
+          word.Add(_PATTERN, c, False)
+        else:
+          literal.append(c)
+        self.pos += 1
+    Flush()
+    word.raw = self.text[start:self.pos]
+    return word
+
+  def _ReadDoubleQuoted(self, word):
+    literal = []
+    while True:
+      c = self._Peek()
+      if not c:
+        raise UnsupportedSyntax('unterminated double quote')
+      elif c == '"':
+        self.pos += 1
+        break
+      elif c == '\\':
+        nxt = self._Peek(1)
+        self.pos += 2
+        if nxt == '\n':
+          continue
+        literal.append(nxt if nxt in '$`"\\' else c + nxt)
+      elif c == '$' or c == '`':
+        if literal:
+          word.Add(_TEXT, ''.join(literal), True)
+          literal = []
+        self._ReadExpansion(word, True)
+      else:
+        literal.append(c)
+        self.pos += 1
+    # Record even empty strings, so that "" counts as a quoted word.
+    word.Add(_TEXT, ''.join(literal), True)
+
+  def _ReadExpansion(self, word, quoted):
+    """Read an expansion starting with $ or a backquote."""
+    c = self._Peek()
+    if c == '`':
+      end = self.pos + 1
+      while end < len(self.text) and self.text[end] != '`':
+        end += 2 if self.text[end] == '\\' else 1
+      if end >= len(self.text):
+        raise UnsupportedSyntax('unterminated backquote')
+      self.pos = end + 1
+      word.Add(_EXEC, None, quoted)
+      return
+
+    nxt = self._Peek(1)
+    if nxt == '(':
+      self.pos += 2
+      self._SkipCommandSubstitution()
+      word.Add(_EXEC, None, quoted)
+    elif nxt == '[':
+      # The obsolete $[...] form of arithmetic expansion.
+      end = self.pos + 2
+      depth = 1
+      while depth:
+        if end >= len(self.text):
+          raise UnsupportedSyntax('unterminated $[')
+        depth += {'[': 1, ']': -1}.get(self.text[end], 0)
+        end += 1
+      self.pos = end
+      word.Add(_EXEC, None, quoted)
+    elif nxt == '{':
+      self.pos += 2
+      content = self._ReadBraced()
+      if _NAME_RE.match(content):
+        word.Add(_VAR, content, quoted)
+      elif '$(' in content or '`' in content:
+        word.Add(_EXEC, None, quoted)
+      else:
+        m = re.match(r'!?#?([A-Za-z_][A-Za-z0-9_]*|[%s])(\[[^]]*\])?(.*)$'
+                     % re.escape(_SPECIAL_PARAMS), content, re.S)
+        if not m:
+          raise UnsupportedSyntax('bad substitution ${%s}' % content)
+        # Assigning defaults and erroring out on unset values have side
+        # effects; other operators only transform the value.
+        if m.group(3).lstrip(':')[:1] in ('=', '?'):
+          word.Add(_EXEC, None, quoted)
+        else:
+          word.Add(_UNKNOWN, content, quoted)
+    elif nxt and (nxt.isalpha() or nxt == '_'):
+      m = re.compile(r'[A-Za-z_][A-Za-z0-9_]*').match(self.text, self.pos + 1)
+      self.pos = m.end()
+      word.Add(_VAR, m.group(0), quoted)
+    elif nxt and nxt in _SPECIAL_PARAMS:
+      self.pos += 2
+      word.Add(_UNKNOWN, nxt, quoted)
+    elif nxt in ("'", '"'):
+      # $'...' and $"..." quoting.
+      raise UnsupportedSyntax('unsupported quoting $%s' % nxt)
+    else:
+      self.pos += 1
+      word.Add(_TEXT, '$', quoted)
+
+  def _ReadBraced(self):
+    """Read the contents of ${...}, up to the matching brace."""
+    start = self.pos
+    depth = 1
+    while True:
+      c = self._Peek()
+      if not c:
+        raise UnsupportedSyntax('unterminated ${')
+      elif c == '\\':
+        self.pos += 2
+        continue
+      elif c == "'":
+        end = self.text.find("'", self.pos + 1)
+        if end == -1:
+          raise UnsupportedSyntax('unterminated single quote')
+        self.pos = end
+      elif c == '"':
+        self.pos += 1
+        self._ReadDoubleQuoted(_Word())
+        continue
+      elif c == '{':
+        depth += 1
+      elif c == '}':
+        depth -= 1
+        if not depth:
+          self.pos += 1
+          return self.text[start:self.pos - 1]
+      self.pos += 1
+
+  def _SkipCommandSubstitution(self):
+    """Skip the rest of a $(...) or $((...)), up to the matching paren."""
+    depth = 1
+    for kind, value in self.Tokens():
+      if kind == 'word' and value.literal in ('case', 'esac'):
+        # Case patterns have unbalanced parens.
+        raise UnsupportedSyntax('case in command substitution')
+      elif kind == 'op' and value == '(':
+        depth += 1
+      elif kind == 'op' and value == ')':
+        depth -= 1
+        if not depth:
+          return
+    raise UnsupportedSyntax('unterminated command substitution')
+
+
+class _Evaluator(object):
+  """Runs the top level assignments of a script."""
+
+  def __init__(self, env):
+    self.variables = dict(env)
+    # The names of the variables that are arrays, even if their value is
+    # unknown.
+    self.arrays = set()
+
+  def _Expand(self, word, split):
+    """Return the value of |word|, or _UNKNOWN_VALUE.
+
+    Arguments:
+      word: The _Word to expand.
+      split: Whether the word is subject to word splitting and globbing, as
+        array elements are, but values of scalar assignments are not.
+    """
+    value = []
+    for kind, part, quoted in word.parts:
+      if kind == _EXEC:
+        raise UnsupportedSyntax('command substitution')
+      elif kind == _UNKNOWN or (split and not quoted and kind != _TEXT):
+        return _UNKNOWN_VALUE
+      elif kind == _PATTERN and part == '~':
+        # Assignments are still subject to tilde expansion.
+        return _UNKNOWN_VALUE
+      elif kind == _VAR:
+        if part in _BASH_VARIABLES:
+          return _UNKNOWN_VALUE
+        # Unset variables expand to nothing.
+        var = self.variables.get(part, '')
+        if var is _UNKNOWN_VALUE:
+          return _UNKNOWN_VALUE
+        elif isinstance(var, list):
+          var = var[0] if var else ''
+        value.append(var)
+      else:
+        value.append(part)
+    return ''.join(value)
+
+  def _Assign(self, name, append, value, array=False):
+    if append:
+      raise UnsupportedSyntax('appending to %s' % name)
+    elif name in _BASH_VARIABLES:
+      raise UnsupportedSyntax('assigning to %s' % name)
+    if array:
+      self.arrays.add(name)
+    elif name in self.arrays:
+      # Assigning a string to an array only replaces its first element.
+      old = self.variables[name]
+      if value is _UNKNOWN_VALUE or old is _UNKNOWN_VALUE:
+        value = _UNKNOWN_VALUE
+      else:
+        value = [value] + old[1:]
+    self.variables[name] = value
+
+  def _AssignArray(self, name, append, elements):
+    values = [self._Expand(element, True) for element in elements]
+    if _UNKNOWN_VALUE in values:
+      values = _UNKNOWN_VALUE
+    self._Assign(name, append, values, array=True)
+
+  def _AssignWord(self, word):
+    m = _ASSIGN_RE.match(word.raw)
+    if not m or word.parts[0][2]:
+      return False
+    # Drop the NAME= prefix, which is always in the first literal part.
+    kind, text, quoted = word.parts[0]
+    rest = _Word()
+    rest.parts = [(kind, text[m.end():], quoted)] + word.parts[1:]
+    self._Assign(m.group(1), m.group(2), self._Expand(rest, False))
+    return True
+
+  def RunCommand(self, command):
+    """Run a simple command: a list of word and array tokens."""
+    for kind, value in command:
+      if kind == 'word' and value.HasExec():
+        raise UnsupportedSyntax('command substitution')
+
+    kind, first = command[0]
+    if kind == 'word' and first.literal in _IGNORED_COMMANDS:
+      return
+    elif kind == 'word' and first.literal in _DECLARE_COMMANDS:
+      for kind, value in command[1:]:
+        if kind == 'array':
+          self._AssignArray(*value)
+        elif value.literal in _DECLARE_OPTIONS:
+          continue
+        elif not self._AssignWord(value):
+          if not _NAME_RE.match(value.raw):
+            raise UnsupportedSyntax('unsupported argument %s' % value.raw)
+      return
+
+    for kind, value in command:
+      if kind == 'array':
+        self._AssignArray(*value)
+      elif not self._AssignWord(value):
+        raise UnsupportedSyntax('unsupported command %s' % value.raw)
+
+
+def _SkipFunction(tokens, pos):
+  """Skip a function definition in |tokens|.
+
+  Arguments:
+    tokens: The list of tokens of the script.
+    pos: The index of the token just after the function name.
+
+  Returns:
+    The index of the token after the function body.
+  """
+  if tokens[pos:pos + 2] == [('op', '('), ('op', ')')]:
+    pos += 2
+  while pos < len(tokens) and tokens[pos][0] == 'newline':
+    pos += 1
+
+  depth = 0
+  for pos in xrange(pos, len(tokens)):
+    kind, value = tokens[pos]
+    if kind != 'word':
+      if not depth:
+        break
+    elif value.literal == '{':
+      depth += 1
+    elif value.literal == '}' and depth:
+      depth -= 1
+      if not depth:
+        return pos + 1
+    elif not depth:
+      break
+  raise UnsupportedSyntax('unsupported function body')
+
+
+def Evaluate(text, env=None):
+  """Evaluate the top level assignments in the bash script |text|.
+
+  Arguments:
+    text: The contents of the script.
+    env: Dictionary of the environment bash would be run with.  Variables
+      that are neither set by |text| nor in |env| are taken to be unset.
+
+  Returns:
+    A dictionary mapping each variable set by |text| or |env| to its value: a
+    string, a list for arrays, or an opaque marker for values that could not
+    be computed.  Use GetValue to read them.
+
+  Raises:
+    UnsupportedSyntax if |text| uses anything beyond simple assignments.
+  """
+  env = env or {}
+  for name in _BASH_STARTUP_VARIABLES:
+    if name in env:
+      raise UnsupportedSyntax('%s is set in the environment' % name)
+  evaluator = _Evaluator(env)
+  tokens = list(_Lexer(text).Tokens())
+  command = []
+  pos = 0
+  while pos < len(tokens):
+    kind, value = tokens[pos]
+    pos += 1
+    if kind == 'newline' or (kind == 'op' and value == ';'):
+      if command:
+        evaluator.RunCommand(command)
+        command = []
+    elif kind == 'op' and value == '(' and len(command) == 1:
+      kind, name = command[0]
+      if kind != 'word' or not _NAME_RE.match(name.raw):
+        raise UnsupportedSyntax('unsupported subshell')
+      pos = _SkipFunction(tokens, pos - 1)
+      command = []
+    elif kind == 'word' and not command and value.literal == 'function':
+      if pos >= len(tokens) or tokens[pos][0] != 'word':
+        raise UnsupportedSyntax('unsupported function definition')
+      pos = _SkipFunction(tokens, pos + 1)
+    elif kind == 'op':
+      raise UnsupportedSyntax('unsupported operator %s' % value)
+    else:
+      command.append((kind, value))
+  if command:
+    evaluator.RunCommand(command)
+  return evaluator.variables
+
+
+def GetValue(variables, name):
+  """Return the value of |name| from the result of Evaluate.
+
+  Returns:
+    The value as a string or list, or None if the variable is not set.
+
+  Raises:
+    UnsupportedSyntax if the value could not be computed.
+  """
+  value = variables.get(name)
+  if value is _UNKNOWN_VALUE or name in _BASH_VARIABLES:
+    raise UnsupportedSyntax('unknown value for %s' % name)
+  return value
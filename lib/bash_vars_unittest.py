@@ -0,0 +1,116 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for bash_vars.py."""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite.lib import bash_vars
+from chromite.lib import cros_build_lib
+from chromite.lib import cros_test_lib
+
+
+class EvaluateTest(cros_test_lib.TestCase):
+  """Tests for Evaluate, checked against bash itself."""
+
+  ENV = {'HOME': '/home/user', 'EMPTY': ''}
+
+  def _Bash(self, text, names):
+    """Return the values of |names| after running |text| in bash."""
+    script = [text, 'IFS=,']
+    for name in names:
+      script.append('[[ "${%(var)s+set}" == "set" ]] && '
+                    'echo "%(var)s $(declare -p %(var)s | cut -c9-10) '
+                    '${%(var)s[*]}"' % {'var': name})
+    result = cros_build_lib.RunCommand(
+        ['bash', '-c', '\n'.join(script) + '\nexit 0'], env=self.ENV,
+        redirect_stdout=True, redirect_stderr=True, print_cmd=False)
+    values = {}
+    for line in result.output.splitlines():
+      name, flags, value = line.split(' ', 2)
+      values[name] = value.split(',') if 'a' in flags else value
+    return values
+
+  def _Evaluate(self, text, names):
+    variables = bash_vars.Evaluate(text, self.ENV)
+    values = dict((name, bash_vars.GetValue(variables, name))
+                  for name in names)
+    # Like bash, treat empty arrays as unset.
+    return dict((k, v) for k, v in values.iteritems() if v)
+
+  def assertSameAsBash(self, text, **expected):
+    names = sorted(expected)
+    values = self._Evaluate(text, names)
+    self.assertEqual(values, self._Bash(text, names))
+    for name, value in expected.iteritems():
+      self.assertEqual(values.get(name), value, name)
+
+  def assertUnsupported(self, text, name='A'):
+    def _Evaluate():
+      return bash_vars.GetValue(bash_vars.Evaluate(text, self.ENV), name)
+    self.assertRaises(bash_vars.UnsupportedSyntax, _Evaluate)
+
+  def testQuoting(self):
+    """Test plain, quoted and escaped assignments."""
+    self.assertSameAsBash(
+        'A=plain B="double $HOME ${EMPTY}x \\$ \\n" C=\'single $HOME\'\n'
+        'D=mixed"  "\'quotes\'\\  E=#not-a-comment\n'
+        'F=$HOME/a$G:"$A"',
+        A='plain', B='double /home/user x $ \\n', C='single $HOME',
+        D='mixed  quotes ', E='#not-a-comment', F='/home/user/a:plain')
+
+  def testArrays(self):
+    """Test array assignments, comments and continuations."""
+    self.assertSameAsBash(
+        'A=(\n  one # first\n  "two words" \\\n  \'three\'"$HOME"\n)\n'
+        'B=() C=("") D=${A}',
+        A=['one', 'two words', 'three/home/user'], C=[''], D='one', B=None)
+
+  def testStringToArray(self):
+    """Test that assigning a string to an array only replaces element 0."""
+    self.assertSameAsBash(
+        'A=(1 2); A=3\nB=(1 2)\nexport B=3\nC=(1 2)\ndeclare C=3\n'
+        'D=(); D=4',
+        A=['3', '2'], B=['3', '2'], C=['3', '2'], D=['4'])
+    self.assertUnsupported('A=(1 $HOME/*); A=3')
+
+  def testIgnoredCommands(self):
+    """Test that functions, inherit and declare do not get in the way."""
+    self.assertSameAsBash(
+        'inherit eutils\ndeclare -x A="a" ; export B\n'
+        'src_unpack() {\n  A=inside\n  cat <<-EOF\n\t}\n\tEOF\n}\n'
+        'function src_compile\n{\n  [[ $(f) ]] && { B=inside; }\n}\n'
+        'typeset -a C=(c)',
+        A='a', C=['c'], B=None)
+
+  def testUnknownValues(self):
+    """Test that values only bash can compute are rejected when used."""
+    for text in ('A=${B:-x}', 'A=~/x', 'A=(*.ebuild)', 'A=({a,b})',
+                 'A=$PWD', 'A=($HOME)', 'A=$1'):
+      self.assertUnsupported(text)
+    # Unknown values are fine as long as nobody asks for them.
+    self.assertEqual(bash_vars.Evaluate('A=$PWD B=b')['B'], 'b')
+
+  def testUnsupportedSyntax(self):
+    """Test that anything but assignments is rejected."""
+    for text in ('A=$(echo a)', 'A=`echo a`', 'A=$[1+2]', 'A="$[1 + 2]"',
+                 'A=${B:=x}', 'A=a echo',
+                 'if true; then A=a; fi', 'A=a && B=b', 'A+=a',
+                 'A=$\'a\'', 'cat <<EOF\nA=a', 'declare -i A=1+1',
+                 'f() {\n  echo $(case a in a) b;; esac)\n}', 'PWD=/'):
+      self.assertUnsupported(text)
+
+  def testStartupEnvironment(self):
+    """Test that environments that change how bash runs are rejected."""
+    self.assertRaises(bash_vars.UnsupportedSyntax, bash_vars.Evaluate, 'A=a',
+                      {'BASH_ENV': '/etc/profile'})
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
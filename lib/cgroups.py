@@ -4,13 +4,17 @@
 
 """A class for managing the Linux cgroup subsystem."""
 
+import collections
 import contextlib
 import errno
 import os
+import re
+import select
 import signal
 import time
 
 from chromite.lib import cros_build_lib
+from chromite.lib import inotify
 from chromite.lib import locking
 from chromite.lib import osutils
 from chromite.lib import signals
@@ -41,6 +45,22 @@ from chromite.lib import sudo
 # cros/cros_sdk/552/
 # and it's children would be accessible in 552/tasks, or
 # would create their own namespace w/in and assign themselves to it.
+#
+# The hierarchy above lives in the cpuset hierarchy.  It is mirrored, group
+# for group, into the hierarchies of the accounting subsystems (cpuacct,
+# memory and blkio) so that the resource usage of each group can be read,
+# into the freezer hierarchy so that groups can be frozen while they're
+# killed, and into the unified (cgroup2) hierarchy if there is one, whose
+# cgroup.events tell when a group becomes empty.  Only the hierarchies we
+# mounted ourselves (MOUNT_ROOT/cros-<subsystem>) are used, unless
+# Cgroup.SHARE_HIERARCHIES_ENV is set.  We never mount the unified hierarchy,
+# so it is only used when that is set.
+
+
+# The resources used by the processes in a group; see Cgroup.GetUsage.
+ResourceUsage = collections.namedtuple(
+    'ResourceUsage', ['cpu_seconds', 'memory_peak', 'read_bytes',
+                      'write_bytes'])
 
 
 class _GroupWasRemoved(Exception):
@@ -58,6 +78,22 @@ def _FileContains(filename, strings):
   return all(s in contents for s in strings)
 
 
+def _GetCgroupMounts():
+  """Return a dict mapping each mounted cgroup subsystem to its mount points.
+
+  The mount points of the unified hierarchy, if any, are stored as 'cgroup2'.
+  """
+  mounts = {}
+  for line in osutils.ReadFile('/proc/mounts').splitlines():
+    _, mnt, fstype, opts = line.split()[:4]
+    if fstype == 'cgroup':
+      for opt in opts.split(','):
+        mounts.setdefault(opt, []).append(mnt)
+    elif fstype == 'cgroup2':
+      mounts.setdefault('cgroup2', []).append(mnt)
+  return mounts
+
+
 def MemoizedSingleCall(functor):
   """Decorator for simple functor targets, caching the results
 
@@ -126,14 +162,24 @@ class Cgroup(object):
   """
 
   NEEDED_SUBSYSTEMS = ('cpuset',)
+  ACCOUNTING_SUBSYSTEMS = ('cpuacct', 'memory', 'blkio')
+  OPTIONAL_SUBSYSTEMS = ACCOUNTING_SUBSYSTEMS + ('freezer',)
   PROC_PATH = '/proc/cgroups'
   _MOUNT_ROOT_POTENTIALS = ('/sys/fs/cgroup',)
   _MOUNT_ROOT_FALLBACK = '/dev/cgroup'
   CGROUP_ROOT = None
   MOUNT_ROOT = None
+  # Maps each usable optional subsystem to the root of its hierarchy.
+  SUBSYSTEM_ROOTS = {}
+  # The root of the unified hierarchy, if it is mounted and may be used.
+  UNIFIED_ROOT = None
   # Whether or not the cgroup implementation does auto inheritance via
   # cgroup.clone_children
   _SUPPORTS_AUTOINHERIT = False
+  # Hierarchies mounted by someone else (the distro, systemd) are only used
+  # if this is set to 1 in the environment.  Moving our processes into them
+  # takes those processes out of the groups their owner put them in.
+  SHARE_HIERARCHIES_ENV = 'CROS_CGROUPS_SHARE_HIERARCHIES'
 
   @classmethod
   @MemoizedSingleCall
@@ -143,7 +189,7 @@ class Cgroup(object):
       return False
 
     def _EnsureMounted(mnt, args):
-      if _FileContains('/proc/mounts', [mnt]):
+      if _FileContains('/proc/mounts', [' %s ' % mnt]):
         return True
 
       # Grab a lock so in the off chance we have multiple programs (like two
@@ -152,7 +198,7 @@ class Cgroup(object):
       lock_path = '/tmp/.chromite.cgroups.lock'
       with locking.FileLock(lock_path, 'cgroup lock') as lock:
         lock.write_lock()
-        if _FileContains('/proc/mounts', [mnt]):
+        if _FileContains('/proc/mounts', [' %s ' % mnt]):
           return True
 
         # Not all distros mount cgroup_root to sysfs.
@@ -166,8 +212,61 @@ class Cgroup(object):
     opts = ','.join(cls.NEEDED_SUBSYSTEMS)
     cgroup_root_args = ['-t', 'cgroup', '-o', opts, 'cros']
 
-    return _EnsureMounted(cls.MOUNT_ROOT, mount_root_args) and \
-        _EnsureMounted(cls.CGROUP_ROOT, cgroup_root_args)
+    if not (_EnsureMounted(cls.MOUNT_ROOT, mount_root_args) and
+            _EnsureMounted(cls.CGROUP_ROOT, cgroup_root_args)):
+      return False
+
+    # The other subsystems are optional; mount a hierarchy of our own for
+    # each.  A subsystem can only be in one hierarchy, so if someone else
+    # already mounted it, it is skipped unless sharing was asked for.
+    roots = {}
+    mounts = _GetCgroupMounts()
+    enabled = cls._GetEnabledSubsystems()
+    share = os.environ.get(cls.SHARE_HIERARCHIES_ENV) == '1'
+    for subsystem in cls.OPTIONAL_SUBSYSTEMS:
+      if subsystem not in enabled:
+        continue
+      name = 'cros-%s' % subsystem
+      root = os.path.join(cls.MOUNT_ROOT, name)
+      existing = mounts.get(subsystem, [])
+      if existing and root not in existing:
+        if not share:
+          cros_build_lib.Debug('Not using the %s subsystem: it is mounted at '
+                               '%s; set %s=1 to use it anyway.', subsystem,
+                               existing[0], cls.SHARE_HIERARCHIES_ENV)
+          continue
+        root = existing[0]
+      elif not existing:
+        try:
+          _EnsureMounted(root, ['-t', 'cgroup', '-o', subsystem, name])
+        except cros_build_lib.RunCommandError as e:
+          cros_build_lib.Warning('Not using the %s subsystem: %s',
+                                 subsystem, e)
+          continue
+      roots[subsystem] = root
+    cls.SUBSYSTEM_ROOTS = roots
+    # We never mount the unified hierarchy ourselves; whatever mounted it
+    # (usually systemd) owns it.
+    if share:
+      cls.UNIFIED_ROOT = mounts.get('cgroup2', [None])[0]
+    return True
+
+  @classmethod
+  def _GetEnabledSubsystems(cls):
+    """Return the set of subsystems the kernel has enabled."""
+    enabled = set()
+    for line in osutils.ReadFile(cls.PROC_PATH).splitlines():
+      fields = line.split()
+      if len(fields) == 4 and not line.startswith('#') and fields[3] == '1':
+        enabled.add(fields[0])
+    return enabled
+
+  @classmethod
+  def _GetMirrorRoots(cls):
+    """Return the roots of the hierarchies mirroring ours."""
+    roots = set(cls.SUBSYSTEM_ROOTS.itervalues())
+    roots.add(cls.UNIFIED_ROOT)
+    return sorted(roots - set([cls.CGROUP_ROOT, None]))
 
   @classmethod
   @MemoizedSingleCall
@@ -268,6 +367,11 @@ class Cgroup(object):
   def path(self):
     return os.path.abspath(os.path.join(self.CGROUP_ROOT, self.namespace))
 
+  def _GetMirrorPaths(self):
+    """Return the paths of this group in the hierarchies mirroring ours."""
+    return [os.path.abspath(os.path.join(root, self.namespace))
+            for root in self._GetMirrorRoots()]
+
   @property
   def tasks(self):
     s = set(x.strip() for x in self.GetValue('tasks', '').splitlines())
@@ -321,25 +425,70 @@ class Cgroup(object):
       return None
     # See documentation at the top of the file for the naming scheme.
     # It's basically "%(program_name)s:%(owning_pid)i" if the group
-    # is nested.
-    return os.path.basename(self.namespace).rsplit(':', 1)[-1]
+    # is nested.  Groups not named that way have no owner.
+    name = os.path.basename(self.namespace)
+    if ':' not in name:
+      return None
+    return name.rsplit(':', 1)[-1]
 
   def GroupIsAParent(self, node):
     """Is the given node a parent of us?"""
     parent_path = node.path + '/'
     return self.path.startswith(parent_path)
 
-  def GetValue(self, key, default=None):
+  def GetValue(self, key, default=None, subsystem=None):
     """Query a cgroup configuration key from disk.
 
-    If the file doesn't exist, return the given default."""
+    If the file doesn't exist, return the given default.  If subsystem is
+    given, the key is read from that accounting hierarchy instead."""
+    path = self.path
+    if subsystem is not None:
+      root = self.SUBSYSTEM_ROOTS.get(subsystem)
+      if root is None:
+        return default
+      path = os.path.join(root, self.namespace)
     try:
-      return osutils.ReadFile(os.path.join(self.path, key))
+      return osutils.ReadFile(os.path.join(path, key))
     except EnvironmentError, e:
       if e.errno != errno.ENOENT:
         raise
       return default
 
+  def GetUsage(self):
+    """Return the ResourceUsage of the processes that ran in this group.
+
+    CPU time and bytes read and written include the nested groups.  The
+    memory peak is the high watermark of memory.max_usage_in_bytes, so it
+    counts page cache as well as RSS.  Counters of subsystems that are not
+    mounted are None.
+    """
+    cpu_seconds = memory_peak = read_bytes = write_bytes = None
+
+    value = self.GetValue('cpuacct.usage', subsystem='cpuacct')
+    if value:
+      cpu_seconds = int(value) / 1e9
+
+    value = self.GetValue('memory.max_usage_in_bytes', subsystem='memory')
+    if value:
+      memory_peak = int(value)
+
+    value = self.GetValue('blkio.throttle.io_service_bytes_recursive',
+                          subsystem='blkio')
+    if value is None:
+      value = self.GetValue('blkio.throttle.io_service_bytes',
+                            subsystem='blkio')
+    if value is not None:
+      read_bytes = write_bytes = 0
+      # Lines look like "8:0 Read 1024", with a final "Total 2048".
+      for line in value.splitlines():
+        fields = line.split()
+        if len(fields) == 3 and fields[1] == 'Read':
+          read_bytes += int(fields[2])
+        elif len(fields) == 3 and fields[1] == 'Write':
+          write_bytes += int(fields[2])
+
+    return ResourceUsage(cpu_seconds, memory_peak, read_bytes, write_bytes)
+
   def _AddSingleGroup(self, name, **kwds):
     """Method for creating a node nested within this one.
 
@@ -386,6 +535,18 @@ class Cgroup(object):
       self.parent.Instantiate()
     osutils.SafeMakedirs(self.path, sudo=True)
 
+    try:
+      for path in self._GetMirrorPaths():
+        osutils.SafeMakedirs(path, sudo=True)
+      # Count the usage of nested groups too, if the kernel lets us.  This
+      # can only be changed while the group has no children.
+      value = self.GetValue('memory.use_hierarchy', '', subsystem='memory')
+      if value.strip() == '0':
+        self._SudoSet('memory.use_hierarchy', '1', subsystem='memory')
+    except (EnvironmentError, cros_build_lib.RunCommandError):
+      self.RemoveThisGroup()
+      raise
+
     force_inheritance = True
     if self.parent.GetValue('cgroup.clone_children', '').strip() == '1':
       force_inheritance = False
@@ -425,9 +586,16 @@ class Cgroup(object):
   # we use a more developer friendly variable name.
   Instantiate._cache_key = '_inited'
 
-  def _SudoSet(self, key, value):
-    """Set a cgroup file in this namespace to a specific value"""
+  def _SudoSet(self, key, value, subsystem=None, root=None):
+    """Set a cgroup file in this namespace to a specific value
+
+    If subsystem is given, the file is set in that subsystem's hierarchy; if
+    root is given, in the hierarchy mounted there."""
     name = self._LimitName(key, True)
+    if subsystem is not None:
+      root = self.SUBSYSTEM_ROOTS[subsystem]
+    if root is not None:
+      name = os.path.join(root, self.namespace, self._LimitName(key))
     try:
       return sudo.SetFileContents(name, value, cwd=os.path.dirname(name))
     except cros_build_lib.RunCommandError, e:
@@ -484,8 +652,14 @@ class Cgroup(object):
                          "strict was %r, sudo_strict was %r"
                          % (path, strict, sudo_strict))
 
+    # Remove the mirrors of the group in the accounting hierarchies too.
+    relpath = os.path.relpath(path, cls.CGROUP_ROOT)
+    paths = [os.path.join(root, relpath) for root in cls._GetMirrorRoots()]
+    paths = [x for x in paths if os.path.isdir(x)] + [path]
+
     result = cros_build_lib.SudoRunCommand(
-        ['find', path, '-depth', '-type', 'd', '-exec', 'rmdir', '{}', '+'],
+        ['find'] + paths + ['-depth', '-type', 'd', '-exec', 'rmdir', '{}',
+                            '+'],
         redirect_stderr=True, error_code_ok=not strict,
         print_cmd=False, strict=sudo_strict)
     if result.returncode == 0:
@@ -543,6 +717,11 @@ class Cgroup(object):
     # Assign this root process to the new cgroup.
     try:
       self._SudoSet('tasks', '%d' % int(pid))
+      for root in self._GetMirrorRoots():
+        # The unified hierarchy has no tasks file; cgroup.procs moves the
+        # whole process.
+        key = 'cgroup.procs' if root == self.UNIFIED_ROOT else 'tasks'
+        self._SudoSet(key, '%d' % int(pid), root=root)
       return True
     except cros_build_lib.RunCommandError:
       if not allow_missing:
@@ -621,16 +800,116 @@ class Cgroup(object):
           # Non strict since the group may have failed to be created.
           node.RemoveThisGroup(strict=False)
 
+  @staticmethod
+  def _SignalPids(pids, signum):
+    """Send signum to all of pids, with a single kill."""
+    cros_build_lib.SudoRunCommand(
+        ['kill', '-%i' % signum] + sorted(pids),
+        print_cmd=False, error_code_ok=True, redirect_stdout=True,
+        combine_stdout_stderr=True)
+
+  def _SetFrozen(self, frozen):
+    """Freeze or thaw this group and all the groups nested in it."""
+    root = self.SUBSYSTEM_ROOTS['freezer']
+    paths = [os.path.join(root, group.namespace, 'freezer.state')
+             for group in [self] + self.all_nested_groups]
+    # Groups may vanish as we go; a single tee sets whichever are left.
+    cros_build_lib.SudoRunCommand(
+        ['tee'] + [x for x in paths if os.path.exists(x)],
+        input='FROZEN' if frozen else 'THAWED', print_cmd=False,
+        error_code_ok=True, redirect_stdout=True, combine_stdout_stderr=True)
+
+  def _IsPopulated(self):
+    """Return whether any process is in this group or one nested in it."""
+    groups = [self] + self.all_nested_groups
+    return any(group.GetValue('tasks', '').strip() for group in groups)
+
+  def _WaitUntilEmpty(self, timeout, poll_interval):
+    """Wait up to timeout seconds for this group to become empty.
+
+    With the unified hierarchy, cgroup.events tells when the group becomes
+    empty; otherwise, fall back to polling, backing off up to a second.
+
+    Returns:
+      Whether the group is empty.
+    """
+    time_end = time.time() + timeout
+    watcher = events = None
+    if self.UNIFIED_ROOT is not None:
+      events = os.path.join(self.UNIFIED_ROOT, self.namespace, 'cgroup.events')
+      try:
+        watcher = inotify.Inotify()
+        watcher.AddWatch(events, inotify.IN_MODIFY)
+      except OSError:
+        if watcher is not None:
+          watcher.Close()
+        watcher = None
+
+    try:
+      while True:
+        if watcher is not None:
+          populated = 'populated 1' in osutils.ReadFile(events)
+        else:
+          populated = self._IsPopulated()
+        remaining = time_end - time.time()
+        if not populated or remaining <= 0:
+          return not populated
+        if watcher is not None:
+          select.select([watcher.fd], [], [], remaining)
+          watcher.ReadEvents()
+        else:
+          time.sleep(min(poll_interval, remaining))
+          poll_interval = min(poll_interval * 2, 1)
+    finally:
+      if watcher is not None:
+        watcher.Close()
+
+  def _KillFrozenProcesses(self, my_pids, poll_interval, remove,
+                           sigterm_timeout):
+    """Kill all processes in this namespace, freezing them while we do.
+
+    Frozen processes can't fork, so a single kill gets all of them; they
+    handle the signal once thawed.  See KillProcesses for the arguments.
+    """
+    signum, timeout = signal.SIGTERM, sigterm_timeout
+    while True:
+      pids = self.all_tasks
+      self_kill = my_pids.intersection(pids)
+      if self_kill:
+        raise Exception("Bad API usage: asked to kill cgroup %s, but "
+                        "current pid %s is in that group.  Effectively "
+                        "asked to kill ourselves."
+                        % (self.namespace, self_kill))
+
+      if pids:
+        self._SetFrozen(True)
+        try:
+          # Look again, now that nothing in the group can fork.
+          pids = self.all_tasks.difference(my_pids)
+          if pids:
+            self._SignalPids(pids, signum)
+        finally:
+          self._SetFrozen(False)
+
+      if self._WaitUntilEmpty(timeout, poll_interval):
+        break
+      # Anything still around after a SIGTERM gets a SIGKILL; anything still
+      # around after a SIGKILL was forked before the freeze, so try again.
+      signum, timeout = signal.SIGKILL, 1
+
+    if remove:
+      return self.RemoveThisGroup(strict=False)
+    for group in self.nested_groups:
+      group.RemoveThisGroup(strict=False)
+
   def KillProcesses(self, poll_interval=0.05, remove=False, sigterm_timeout=10):
     """Kill all processes in this namespace."""
 
     my_pids = set(map(str, self._GetCurrentProcessThreads()))
 
-    def _SignalPids(pids, signum):
-      cros_build_lib.SudoRunCommand(
-          ['kill', '-%i' % signum] + sorted(pids),
-          print_cmd=False, error_code_ok=True, redirect_stdout=True,
-          combine_stdout_stderr=True)
+    if 'freezer' in self.SUBSYSTEM_ROOTS:
+      return self._KillFrozenProcesses(my_pids, poll_interval, remove,
+                                       sigterm_timeout)
 
     # First sigterm what we can, exiting after 2 runs w/out seeing pids.
     # Let this phase run for a max of 10 seconds; afterwards, switch to
@@ -656,7 +935,7 @@ class Cgroup(object):
         saw_pids = True
         new_pids = pids.difference(previous_pids)
         if new_pids:
-          _SignalPids(new_pids, signal.SIGTERM)
+          self._SignalPids(new_pids, signal.SIGTERM)
           # As long as new pids keep popping up, skip sleeping and just keep
           # stomping them as quickly as possible (whack-a-mole is a good visual
           # analogy of this).  We do this to ensure that fast moving spawns
@@ -681,7 +960,7 @@ class Cgroup(object):
                           "asked to kill ourselves."
                           % (self.namespace, self_kill))
 
-        _SignalPids(pids, signal.SIGKILL)
+        self._SignalPids(pids, signal.SIGKILL)
         saw_pids = True
       elif not (saw_pids or groups_existed):
         break
@@ -791,6 +1070,69 @@ def SimpleContainChildren(process_name, nesting=True, **kwds):
   name = '%s:%i' % (process_name, os.getpid())
   return node.ContainChildren(name, **kwds)
 
+
+class ResourceMeter(object):
+  """Context manager measuring the resources used within it via a cgroup.
+
+  On entry, the current process moves into a new group nested in the cros
+  group it is in.  On exit, it moves back, the ResourceUsage of the new group
+  is stored in the usage attribute, and the group is removed.  Processes
+  started within the context and still running at exit keep the group alive
+  until they exit.
+
+  If the current process is not in a cros group (for example, cbuildbot was
+  run with --nocgroups) or nothing can be measured, this does nothing and
+  usage stays None.
+  """
+
+  def __init__(self, name):
+    """Initialize the meter.
+
+    Args:
+      name: What is being measured; used to name the group.
+    """
+    self.name = name
+    self.usage = None
+    self._parent = None
+    self._group = None
+
+  def __enter__(self):
+    if not Cgroup.IsSupported():
+      return self
+    namespace = Cgroup._FindCurrentCrosGroup()
+    if namespace is None or not Cgroup.IsUsable():
+      return self
+    if not set(Cgroup.ACCOUNTING_SUBSYSTEMS) & set(Cgroup.SUBSYSTEM_ROOTS):
+      return self
+
+    # pylint: disable=W0212
+    parent = _cros_node.AddGroup(namespace, autoclean=False, lazy_init=True)
+    parent._inited = True
+    # Don't follow the name:pid convention; the group isn't owned by a
+    # process, and we must be able to kill whatever is left in it.
+    name = '%s-%i' % (re.sub(r'[^\w.-]+', '_', self.name), os.getpid())
+    group = parent.AddGroup(name, autoclean=True, lazy_init=True)
+    try:
+      group.TransferCurrentProcess()
+    except (EnvironmentError, cros_build_lib.RunCommandError,
+            _GroupWasRemoved) as e:
+      cros_build_lib.Warning('Not measuring the usage of %s: %s',
+                             self.name, e)
+      parent.TransferCurrentProcess()
+      group.RemoveThisGroup(strict=False)
+      return self
+    self._parent, self._group = parent, group
+    return self
+
+  def __exit__(self, _exc_type, _exc_value, _traceback):
+    if self._group is None:
+      return
+    with signals.DeferSignals():
+      self._parent.TransferCurrentProcess()
+    self.usage = self._group.GetUsage()
+    self._group.RemoveThisGroup(strict=False)
+    self._parent = self._group = None
+
 # This is a generic group, not associated with any specific process id, so
 # we shouldn't autoclean it on exit; doing so would delete the group from
 # under the feet of any other processes interested in using the group.
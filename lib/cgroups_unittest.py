@@ -5,16 +5,21 @@
 # found in the LICENSE file.
 
 import os
+import subprocess
 import sys
+import time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
     os.path.abspath(__file__)))))
 
 from chromite.lib import cgroups
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
+from chromite.lib import osutils
 from chromite.lib import parallel
 from chromite.lib import sudo
 
+# pylint: disable=W0212
+
 
 class TestCreateGroups(cros_test_lib.TestCase):
 
@@ -29,5 +34,196 @@ class TestCreateGroups(cros_test_lib.TestCase):
         parallel.RunTasksInProcessPool(self._CrosSdk, [[]] * 20, 10)
 
 
+class TestKillProcesses(cros_test_lib.TestCase):
+
+  PROCESSES = 2000
+
+  def _SudoKeepAlive(self):
+    """Return a context keeping sudo alive, or None if it is unavailable."""
+    if os.getuid() == 0:
+      # SudoRunCommand runs commands directly as root.
+      return cros_build_lib.NoOpContextManager()
+    result = cros_build_lib.RunCommand(
+        ['sudo', '-n', 'true'], print_cmd=False, error_code_ok=True,
+        redirect_stdout=True, combine_stdout_stderr=True)
+    if result.returncode:
+      return None
+    return sudo.SudoKeepAlive()
+
+  def testKillSleepers(self):
+    """Time killing a group full of sleeping processes."""
+    keepalive = self._SudoKeepAlive()
+    if keepalive is None:
+      self.skipTest('needs root or passwordless sudo')
+    with keepalive:
+      if not cgroups.Cgroup.IsUsable():
+        self.skipTest('cgroups are not usable here')
+      node = cgroups.Cgroup.FindStartingGroup('example')
+      group = node.AddGroup('sleepers-%i' % os.getpid())
+      with node.TemporarilySwitchToGroup(group):
+        proc = subprocess.Popen(
+            ['sh', '-c', 'i=0; while [ $i -lt %i ]; do sleep 1000 & '
+             'i=$((i+1)); done; wait' % self.PROCESSES])
+      try:
+        while len(group.tasks) <= self.PROCESSES:
+          time.sleep(0.1)
+        start = time.time()
+        self.assertTrue(group.KillProcesses(remove=True))
+        cros_build_lib.Info('Killed %i processes in %.2fs', self.PROCESSES,
+                            time.time() - start)
+        self.assertFalse(os.path.exists(group.path))
+      finally:
+        if proc.poll() is None:
+          proc.kill()
+        proc.wait()
+
+
+class ResourceMeterTest(cros_test_lib.MockTempDirTestCase):
+  """Tests for ResourceMeter, run against a fake cgroupfs layout."""
+
+  NAMESPACE = 'cbuildbot/cbuildbot:1'
+  PID = 12345
+
+  def setUp(self):
+    roots = dict((x, os.path.join(self.tempdir, x))
+                 for x in cgroups.Cgroup.ACCOUNTING_SUBSYSTEMS)
+    self.PatchObject(cgroups.Cgroup, 'CGROUP_ROOT',
+                     os.path.join(self.tempdir, 'cros'))
+    self.PatchObject(cgroups.Cgroup, 'SUBSYSTEM_ROOTS', roots)
+    self.PatchObject(cgroups.Cgroup, 'UNIFIED_ROOT', None)
+    self.PatchObject(cgroups.Cgroup, 'IsSupported', return_value=True)
+    self.PatchObject(cgroups.Cgroup, 'IsUsable', return_value=True)
+    self.PatchObject(cgroups.Cgroup, '_GetCurrentProcessThreads',
+                     return_value=[self.PID])
+    self.find_group = self.PatchObject(
+        cgroups.Cgroup, '_FindCurrentCrosGroup', return_value=self.NAMESPACE)
+
+    # Run the commands without sudo; the fake layout is ours.
+    def _RunCommand(cmd, **kwds):
+      kwds.pop('strict', None)
+      return cros_build_lib.RunCommand(cmd, **kwds)
+    self.sudo = self.PatchObject(cros_build_lib, 'SudoRunCommand',
+                                 side_effect=_RunCommand)
+
+    self.paths = [os.path.join(self.tempdir, 'cros')]
+    self.paths += [roots[x] for x in cgroups.Cgroup.ACCOUNTING_SUBSYSTEMS]
+    for path in self.paths:
+      osutils.SafeMakedirs(os.path.join(path, 'cros', self.NAMESPACE))
+    for name in ('cpuset.cpus', 'cpuset.mems'):
+      osutils.WriteFile(os.path.join(self.paths[0], 'cros', self.NAMESPACE,
+                                     name), '0\n')
+
+  def _GroupFile(self, root, name, group='Build_x86_-%i' % os.getpid()):
+    return os.path.join(root, 'cros', self.NAMESPACE, group, name)
+
+  def testMeasure(self):
+    """Test that the group is created, moved into, and measured."""
+    with cgroups.ResourceMeter('Build [x86]') as meter:
+      for path in self.paths:
+        self.assertEqual(osutils.ReadFile(self._GroupFile(path, 'tasks')),
+                         str(self.PID))
+      # What the kernel would have counted.
+      osutils.WriteFile(self._GroupFile(self.paths[1], 'cpuacct.usage'),
+                        '2500000000\n')
+      osutils.WriteFile(self._GroupFile(self.paths[2], 'memory.max_usage_'
+                                        'in_bytes'), '1048576\n')
+      osutils.WriteFile(self._GroupFile(self.paths[3],
+                                        'blkio.throttle.io_service_bytes'),
+                        '8:0 Read 4096\n8:0 Write 8192\n8:0 Total 12288\n'
+                        '8:16 Read 1024\n8:16 Write 0\n8:16 Total 1024\n'
+                        'Total 13312\n')
+      self.assertEqual(meter.usage, None)
+
+    self.assertEqual(meter.usage, cgroups.ResourceUsage(2.5, 1048576, 5120,
+                                                        8192))
+    for path in self.paths:
+      self.assertEqual(osutils.ReadFile(self._GroupFile(path, 'tasks', '')),
+                       str(self.PID))
+
+  def testRemoveGroup(self):
+    """Test that the group is removed from all the hierarchies."""
+    with cgroups.ResourceMeter('Build'):
+      pass
+    # The control files of the fake layout keep rmdir from working, so just
+    # check that it was asked to.
+    cmd = self.sudo.call_args[0][0]
+    self.assertEqual(cmd[0], 'find')
+    self.assertEqual(sorted(os.path.normpath(x) for x in cmd[1:5]),
+                     sorted(self._GroupFile(x, 'Build-%i' % os.getpid(), '')
+                            for x in self.paths))
+
+  def testNotInGroup(self):
+    """Test that nothing happens outside of the cros cgroups."""
+    self.find_group.return_value = None
+    with cgroups.ResourceMeter('Build') as meter:
+      pass
+    self.assertEqual(meter.usage, None)
+    self.assertFalse(self.sudo.called)
+
+
+class InitSystemTest(cros_test_lib.MockTestCase):
+  """Tests for picking the hierarchies of the optional subsystems."""
+
+  MOUNT_ROOT = '/sys/fs/cgroup'
+
+  def setUp(self):
+    self.PatchObject(cgroups.Cgroup, '_InitSystem_cached', None, create=True)
+    self.PatchObject(cgroups.Cgroup, 'IsSupported', return_value=True)
+    self.PatchObject(cgroups.Cgroup, 'MOUNT_ROOT', self.MOUNT_ROOT)
+    self.PatchObject(cgroups.Cgroup, 'CGROUP_ROOT',
+                     os.path.join(self.MOUNT_ROOT, 'cros'))
+    self.PatchObject(cgroups.Cgroup, 'SUBSYSTEM_ROOTS', {})
+    self.PatchObject(cgroups.Cgroup, 'UNIFIED_ROOT', None)
+    self.PatchObject(cgroups.Cgroup, '_GetEnabledSubsystems',
+                     return_value=set(['cpuset', 'cpuacct', 'memory']))
+    self.PatchObject(cgroups, '_FileContains', return_value=False)
+    self.PatchObject(osutils, 'SafeMakedirs')
+    self.PatchObject(cgroups.locking, 'FileLock')
+    self.sudo = self.PatchObject(cros_build_lib, 'SudoRunCommand')
+    self.PatchObject(os, 'environ', {})
+    self.PatchObject(cgroups, '_GetCgroupMounts', return_value={
+        'cpuacct': [os.path.join(self.MOUNT_ROOT, 'cpu,cpuacct')],
+        'memory': [os.path.join(self.MOUNT_ROOT, 'cros-memory')],
+        'cgroup2': [os.path.join(self.MOUNT_ROOT, 'unified')],
+    })
+
+  def _MountedRoots(self):
+    return sorted(call[0][0][-1] for call in self.sudo.call_args_list)
+
+  def testForeignHierarchySkipped(self):
+    """Test that hierarchies mounted by others are left alone."""
+    self.assertTrue(cgroups.Cgroup.InitSystem())
+    self.assertEqual(cgroups.Cgroup.SUBSYSTEM_ROOTS, {
+        'memory': os.path.join(self.MOUNT_ROOT, 'cros-memory'),
+    })
+    self.assertEqual(cgroups.Cgroup.UNIFIED_ROOT, None)
+    # Only the tmpfs and the cpuset hierarchy were mounted.
+    self.assertEqual(self._MountedRoots(),
+                     [self.MOUNT_ROOT, os.path.join(self.MOUNT_ROOT, 'cros')])
+
+  def testForeignHierarchyShared(self):
+    """Test that hierarchies mounted by others are used on request."""
+    os.environ[cgroups.Cgroup.SHARE_HIERARCHIES_ENV] = '1'
+    self.assertTrue(cgroups.Cgroup.InitSystem())
+    self.assertEqual(cgroups.Cgroup.SUBSYSTEM_ROOTS, {
+        'cpuacct': os.path.join(self.MOUNT_ROOT, 'cpu,cpuacct'),
+        'memory': os.path.join(self.MOUNT_ROOT, 'cros-memory'),
+    })
+    self.assertEqual(cgroups.Cgroup.UNIFIED_ROOT,
+                     os.path.join(self.MOUNT_ROOT, 'unified'))
+
+  def testMountOwnHierarchy(self):
+    """Test that subsystems nobody mounted get a hierarchy of our own."""
+    cgroups._GetCgroupMounts.return_value = {}
+    self.assertTrue(cgroups.Cgroup.InitSystem())
+    roots = dict((x, os.path.join(self.MOUNT_ROOT, 'cros-%s' % x))
+                 for x in ('cpuacct', 'memory'))
+    self.assertEqual(cgroups.Cgroup.SUBSYSTEM_ROOTS, roots)
+    self.assertEqual(self._MountedRoots(),
+                     sorted([self.MOUNT_ROOT,
+                             os.path.join(self.MOUNT_ROOT, 'cros')] +
+                            roots.values()))
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
@@ -9,6 +9,7 @@ Library containing utility functions used for Chrome-specific build tasks.
 """
 
 
+import fcntl
 import functools
 import glob
 import logging
@@ -19,6 +20,11 @@ import shutil
 from chromite.buildbot import cbuildbot_results as results_lib
 from chromite.lib import cros_build_lib
 from chromite.lib import osutils
+from chromite.lib import parallel
+
+
+# The FICLONE ioctl, which makes a file share the data of another (a reflink).
+_FICLONE = 0x40049409
 
 
 # Taken from external/gyp.git/pylib.
@@ -108,6 +114,21 @@ class MustNotBeDirError(results_lib.StepFailure):
   """The specified path should not be a directory, but is."""
 
 
+def _CopyFile(src, dest):
+  """Copy the contents, permissions and times of |src| to |dest|.
+
+  The copy is a reflink where the filesystem supports it, which is almost free
+  and still leaves |dest| a file of its own.
+  """
+  with open(src, 'rb') as src_file:
+    with open(dest, 'wb') as dest_file:
+      try:
+        fcntl.ioctl(dest_file.fileno(), _FICLONE, src_file.fileno())
+      except IOError:
+        shutil.copyfileobj(src_file, dest_file, 1024 * 1024)
+  shutil.copystat(src, dest)
+
+
 class Copier(object):
   """Single file/directory copier.
 
@@ -125,6 +146,14 @@ class Copier(object):
     self.strip_bin = strip_bin
     self.exe_opts = exe_opts
 
+  def _Strip(self, src, dest):
+    """Strip the executable |src| into |dest|."""
+    cros_build_lib.DebugRunCommand([self.strip_bin, '--strip-unneeded',
+                                    '-o', dest, src])
+    shutil.copystat(src, dest)
+    if self.exe_opts is not None:
+      os.chmod(dest, self.exe_opts)
+
   def Copy(self, src, dest, exe):
     """Perform the copy.
 
@@ -142,20 +171,55 @@ class Copier(object):
     osutils.SafeMakedirs(os.path.dirname(dest))
     src_is_dir = os.path.isdir(src)
     Log(src_is_dir)
+    # Like cp, copy to a containing directory.
+    if os.path.isdir(dest):
+      dest = os.path.join(dest, os.path.basename(src))
+
     if src_is_dir:
-      # copytree() does not know about copying to a containing directory.
-      if os.path.isdir(dest):
-        dest = os.path.join(dest, os.path.basename(src))
       shutil.copytree(src, dest)
-    elif exe and os.path.getsize(src) > 0:
-      if self.strip_bin:
-        cros_build_lib.DebugRunCommand([self.strip_bin, '--strip-unneeded',
-                                        '-o', dest, src])
-        shutil.copystat(src, dest)
-      if self.exe_opts is not None:
-        os.chmod(dest, self.exe_opts)
+    elif exe and os.path.getsize(src) > 0 and self.strip_bin:
+      self._Strip(src, dest)
     else:
-      shutil.copy2(src, dest)
+      _CopyFile(src, dest)
+      if exe and self.exe_opts is not None:
+        os.chmod(dest, self.exe_opts)
+
+  def Wait(self):
+    """Wait for copies still in progress.  Nothing to do for this class."""
+
+
+class ParallelCopier(Copier):
+  """Copier that strips executables in a pool of processes.
+
+  Copy only queues up the executables to strip; they are stripped by Wait,
+  largest first, so that the largest binary does not end up running alone at
+  the end.  Everything else is still copied right away.
+  """
+
+  def __init__(self, strip_bin=None, exe_opts=None, processes=None):
+    """Initialization.
+
+    Arguments:
+      strip_bin: See Copier.
+      exe_opts: See Copier.
+      processes: Maximum number of binaries to strip at once.  Defaults to the
+                 number of cpus.
+    """
+    Copier.__init__(self, strip_bin=strip_bin, exe_opts=exe_opts)
+    self.processes = processes
+    self._pending = []
+
+  def _Strip(self, src, dest):
+    self._pending.append((src, dest))
+
+  def Wait(self):
+    """Strip all the executables queued up so far."""
+    pending = sorted(self._pending, key=lambda x: os.path.getsize(x[0]),
+                     reverse=True)
+    self._pending = []
+    if pending:
+      parallel.RunTasksInProcessPool(functools.partial(Copier._Strip, self),
+                                     pending, processes=self.processes)
 
 
 class Path(object):
@@ -357,11 +421,12 @@ def StageChromeFromBuildDir(staging_dir, build_dir, strip_bin, strict=False,
   if staging_flags is None:
     staging_flags = []
 
-  copier = Copier(strip_bin=strip_bin, exe_opts=0755)
+  copier = ParallelCopier(strip_bin=strip_bin, exe_opts=0755)
   copied_paths = []
   for p in _COPY_PATHS:
     if not strict or p.ShouldProcess(gyp_defines, staging_flags):
       copied_paths += p.Copy(build_dir, staging_dir, copier, strict, sloppy)
+  copier.Wait()
 
   if not copied_paths:
     raise MissingPathError('Couldn\'t find anything to copy!\n'
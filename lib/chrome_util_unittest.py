@@ -11,6 +11,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                 '..', '..'))
 from chromite.lib import cros_test_lib
 from chromite.lib import chrome_util
+from chromite.lib import osutils
 
 # pylint: disable=W0212,W0233
 
@@ -212,5 +213,58 @@ class SloppyDirCopyTest(SloppyFileCopyTest, DirCopyTest):
   """Test directory copies with sloppy=True"""
 
 
+class ParallelCopierTest(cros_test_lib.TempDirTestCase):
+  """Tests for ParallelCopier."""
+
+  def setUp(self):
+    self.src_base = os.path.join(self.tempdir, 'src_base')
+    self.dest_base = os.path.join(self.tempdir, 'dest_base')
+    self.log = os.path.join(self.tempdir, 'strip.log')
+    # Fake strip that records its input, and "strips" by truncating.
+    self.strip_bin = os.path.join(self.tempdir, 'strip')
+    osutils.WriteFile(self.strip_bin,
+                      '#!/bin/sh\necho "$4" >> %s\nhead -c 1 "$4" > "$3"\n'
+                      % self.log)
+    os.chmod(self.strip_bin, 0755)
+
+  def _MakeFile(self, name, size):
+    path = os.path.join(self.src_base, name)
+    osutils.WriteFile(path, 'x' * size, makedirs=True)
+    os.chmod(path, 0600)
+    return path
+
+  def testStripLargestFirst(self):
+    """Test that executables are stripped on Wait, largest first."""
+    copier = chrome_util.ParallelCopier(strip_bin=self.strip_bin,
+                                        exe_opts=0755, processes=1)
+    srcs = [self._MakeFile(name, size) for name, size in
+            (('small', 10), ('large', 1000), ('medium', 100))]
+    for src in srcs:
+      copier.Copy(src, os.path.join(self.dest_base, os.path.basename(src)),
+                  True)
+    self.assertFalse(os.path.exists(self.log))
+
+    copier.Wait()
+    self.assertEqual(osutils.ReadFile(self.log).split(),
+                     [srcs[1], srcs[2], srcs[0]])
+    for src in srcs:
+      dest = os.path.join(self.dest_base, os.path.basename(src))
+      self.assertEqual(osutils.ReadFile(dest), 'x')
+      self.assertEqual(os.stat(dest).st_mode & 0777, 0755)
+
+  def testCopyUnstripped(self):
+    """Test that files which need no stripping are copied right away."""
+    copier = chrome_util.ParallelCopier(exe_opts=0755)
+    for name, exe in (('data', False), ('exe', True)):
+      src = self._MakeFile(name, 100)
+      dest = os.path.join(self.dest_base, name)
+      copier.Copy(src, dest, exe)
+      self.assertEqual(osutils.ReadFile(dest), 'x' * 100)
+      self.assertNotEqual(os.stat(src).st_ino, os.stat(dest).st_ino)
+      self.assertEqual(os.stat(dest).st_mode & 0777, 0755 if exe else 0600)
+    copier.Wait()
+    self.assertFalse(os.path.exists(self.log))
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
@@ -233,6 +233,18 @@ class BaseParser(object):
     group.add_option(*args, **kwargs)
 
 
+def GetCacheDir():
+  """Return the cache directory to use outside of option parsing.
+
+  This is $CROS_CACHEDIR, which --cache-dir sets for child processes, and
+  falls back to the .cache directory of the source checkout.
+  """
+  path = os.environ.get(constants.SHARED_CACHE_ENVVAR)
+  if path:
+    return os.path.abspath(path)
+  return os.path.join(constants.SOURCE_ROOT, BaseParser.REPO_CACHE_DIR)
+
+
 class OptionParser(optparse.OptionParser, BaseParser):
   """Custom parser adding our custom option class in.
 
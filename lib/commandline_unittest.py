@@ -11,6 +11,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
     os.path.abspath(__file__)))))
 
+from chromite.buildbot import constants
 from chromite.lib import commandline
 from chromite.lib import cros_test_lib
 from chromite.lib import git
@@ -127,5 +128,19 @@ class CacheTest(cros_test_lib.MockTestCase):
     self._CheckCall(self.CACHE_DIR)
 
 
+class GetCacheDirTest(cros_test_lib.TestCase):
+  """Test GetCacheDir."""
+
+  def testDefault(self):
+    """Test that the cache dir defaults to the one in the checkout."""
+    self.assertEqual(commandline.GetCacheDir(),
+                     os.path.join(constants.SOURCE_ROOT, '.cache'))
+
+  def testEnvironment(self):
+    """Test that $CROS_CACHEDIR overrides the default."""
+    os.environ[constants.SHARED_CACHE_ENVVAR] = '/fake/cache/dir'
+    self.assertEqual(commandline.GetCacheDir(), '/fake/cache/dir')
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
@@ -13,11 +13,11 @@ import json
 import logging
 import os
 import re
+import select
 import signal
 import socket
 import subprocess
 import sys
-import tempfile
 import time
 import urllib
 
@@ -250,6 +250,115 @@ class _Popen(subprocess.Popen):
       else:
         raise
 
+  # Size of the reads used to drain output pipes.
+  _BUFSIZE = 64 * 1024
+
+  # How often communicate checks whether the child has exited.
+  _EXIT_CHECK_INTERVAL = 0.1
+
+  def _close_fds(self, but):
+    """Close the fds inherited by the child, other than stdio and |but|.
+
+    The stock version closes every possible fd up to the fd limit, which is a
+    syscall per fd and dominates the cost of short commands when that limit
+    is high.  Close only the fds that are actually open instead.
+    """
+    try:
+      fds = os.listdir('/proc/self/fd')
+    except EnvironmentError:
+      subprocess.Popen._close_fds(self, but)
+      return
+
+    for fd in fds:
+      fd = int(fd)
+      if fd > 2 and fd != but:
+        try:
+          os.close(fd)
+        except EnvironmentError:
+          pass
+
+  def communicate(self, input=None):
+    """Like Popen.communicate, but return once the child itself has exited.
+
+    Output pipes are drained as the child writes to them.  Unlike the stock
+    version, this does not wait for the pipes to be closed, since processes
+    left behind by the child (daemons and the like) may hold them open
+    indefinitely.  Whatever they have written by the time the child exits is
+    still returned.
+    """
+    if not (self.stdout or self.stderr):
+      return subprocess.Popen.communicate(self, input)
+
+    outputs = {}
+    files = {}
+    poller = select.poll()
+    for f in (self.stdout, self.stderr):
+      if f:
+        outputs[f] = []
+        files[f.fileno()] = f
+        poller.register(f, select.POLLIN | select.POLLPRI)
+    if self.stdin:
+      if input:
+        files[self.stdin.fileno()] = self.stdin
+        poller.register(self.stdin, select.POLLOUT)
+      else:
+        self.stdin.close()
+
+    offset = 0
+    exited = False
+    next_check = time.time() + self._EXIT_CHECK_INTERVAL
+    try:
+      while files:
+        # Once the child is gone, only collect what is already buffered.
+        if exited:
+          timeout = 0
+        else:
+          timeout = max(0, next_check - time.time()) * 1000
+        try:
+          events = poller.poll(timeout)
+        except select.error as e:
+          if e.args[0] == errno.EINTR:
+            continue
+          raise
+
+        if exited and not events:
+          break
+
+        for fd, mode in events:
+          f = files[fd]
+          try:
+            if f is self.stdin:
+              if mode & select.POLLOUT:
+                offset += os.write(fd, input[offset:offset + select.PIPE_BUF])
+              done = offset >= len(input) or not mode & select.POLLOUT
+            else:
+              data = os.read(fd, self._BUFSIZE)
+              outputs[f].append(data)
+              done = not data
+          except OSError as e:
+            if e.errno == errno.EINTR:
+              continue
+            elif e.errno != errno.EPIPE:
+              raise
+            done = True
+
+          if done:
+            poller.unregister(fd)
+            del files[fd]
+            f.close()
+
+        if not exited and time.time() >= next_check:
+          exited = self.poll() is not None
+          next_check = time.time() + self._EXIT_CHECK_INTERVAL
+    finally:
+      for f in files.itervalues():
+        f.close()
+
+    self.wait()
+    stdout = ''.join(outputs[self.stdout]) if self.stdout else None
+    stderr = ''.join(outputs[self.stderr]) if self.stderr else None
+    return stdout, stderr
+
 
 #pylint: disable=W0622
 def RunCommand(cmd, print_cmd=True, error_ok=False, error_message=None,
@@ -272,7 +381,8 @@ def RunCommand(cmd, print_cmd=True, error_ok=False, error_message=None,
     redirect_stdout: returns the stdout.
     redirect_stderr: holds stderr output until input is communicated.
     cwd: the working directory to run this cmd.
-    input: input to pipe into this command through stdin.
+    input: input to pipe into this command through stdin.  If a file object
+      or a file descriptor, stdin is connected to it directly instead.
     enter_chroot: this command should be run from within the chroot.  If set,
       cwd must point to the scripts directory.
     shell: Controls whether we add a shell as a command interpreter.  See cmd
@@ -320,31 +430,17 @@ def RunCommand(cmd, print_cmd=True, error_ok=False, error_message=None,
   # a self-explanatory exception will be thrown.
   kill_timeout = float(kill_timeout)
 
-  def _get_tempfile():
-    try:
-      return tempfile.TemporaryFile(bufsize=0)
-    except EnvironmentError as e:
-      if e.errno != errno.ENOENT:
-        raise
-      # This can occur if we were pointed at a specific location for our
-      # TMP, but that location has since been deleted.  Suppress that issue
-      # in this particular case since our usage gurantees deletion,
-      # and since this is primarily triggered during hard cgroups shutdown.
-      return tempfile.TemporaryFile(bufsize=0, dir='/tmp')
-
   # Modify defaults based on parameters.
-  # Note that tempfiles must be unbuffered else attempts to read
-  # what a separate process did to that file can result in a bad
-  # view of the file.
+  # Captured output is read from pipes by _Popen.communicate.
   if log_stdout_to_file:
     stdout = open(log_stdout_to_file, 'w+')
   elif redirect_stdout or mute_output or log_output:
-    stdout = _get_tempfile()
+    stdout = subprocess.PIPE
 
   if combine_stdout_stderr:
     stderr = subprocess.STDOUT
   elif redirect_stderr or mute_output or log_output:
-    stderr = _get_tempfile()
+    stderr = subprocess.PIPE
 
   # If subprocesses have direct access to stdout or stderr, they can bypass
   # our buffers, so we need to flush to ensure that output is not interleaved.
@@ -352,7 +448,10 @@ def RunCommand(cmd, print_cmd=True, error_ok=False, error_message=None,
     sys.stdout.flush()
     sys.stderr.flush()
 
-  if input:
+  if isinstance(input, (file, int)):
+    stdin = input
+    input = None
+  elif input:
     stdin = subprocess.PIPE
 
   if isinstance(cmd, basestring):
@@ -427,16 +526,6 @@ def RunCommand(cmd, print_cmd=True, error_ok=False, error_message=None,
         signal.signal(signal.SIGINT, old_sigint)
         signal.signal(signal.SIGTERM, old_sigterm)
 
-      if stdout and not log_stdout_to_file:
-        stdout.seek(0)
-        cmd_result.output = stdout.read()
-        stdout.close()
-
-      if stderr and stderr != subprocess.STDOUT:
-        stderr.seek(0)
-        cmd_result.error = stderr.read()
-        stderr.close()
-
     cmd_result.returncode = proc.returncode
 
     if log_output:
@@ -686,7 +775,7 @@ def RetryInvocation(return_handler, exc_handler, max_retry, functor, *args,
   #pylint: disable=E0702
   if exc_info is None:
     raise RetriesExhausted(max_retry, functor, args, kwds)
-  raise Exception(exc_info[0], exc_info[1], exc_info[2])
+  raise exc_info[0], exc_info[1], exc_info[2]
 
 
 def RetryReturned(ret_retry, max_retry, functor, *args, **kwds):
@@ -830,7 +919,7 @@ def FindCompressor(compression, chroot=None):
     para = 'pbzip2'
   elif compression == COMP_XZ:
     std = 'xz'
-    para = 'xz'
+    para = 'pixz'
   elif compression == COMP_NONE:
     return 'cat'
   else:
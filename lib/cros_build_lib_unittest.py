@@ -105,6 +105,57 @@ class TestRunCommandNoMock(cros_test_lib.TestCase):
     self.assertRaises(cros_build_lib.RunCommandError, cros_build_lib.RunCommand,
                       ['/does/not/exist'])
 
+  def testCaptureLargeOutput(self):
+    """Test capturing more input and output than fits in a pipe."""
+    data = 'x' * 1000000
+    result = cros_build_lib.RunCommand(
+        ['bash', '-c', 'cat; cat /proc/self/status >&2'], input=data,
+        redirect_stdout=True, redirect_stderr=True, print_cmd=False)
+    self.assertEqual(result.output, data)
+    self.assertTrue('Pid:' in result.error)
+
+  def testInputFromFd(self):
+    """Test that stdin can be connected to a file descriptor."""
+    read_fd, write_fd = os.pipe()
+    try:
+      os.write(write_fd, 'from a pipe')
+      os.close(write_fd)
+      result = cros_build_lib.RunCommand(
+          ['cat'], input=read_fd, redirect_stdout=True, print_cmd=False)
+    finally:
+      os.close(read_fd)
+    self.assertEqual(result.output, 'from a pipe')
+
+  def testBackgroundedChild(self):
+    """Test that processes left behind by the command are not waited for."""
+    start = time.time()
+    result = cros_build_lib.RunCommand(
+        ['bash', '-c', 'echo foo; sleep 60 &'], redirect_stdout=True,
+        combine_stdout_stderr=True, print_cmd=False)
+    self.assertEqual(result.output, 'foo\n')
+    self.assertTrue(time.time() - start < 30)
+
+  def testTimeout(self):
+    """Test that timeouts interrupt commands while capturing output."""
+    start = time.time()
+    with cros_build_lib.SubCommandTimeout(1):
+      self.assertRaises(cros_build_lib.TimeoutError, cros_build_lib.RunCommand,
+                        ['sleep', '60'], redirect_stdout=True,
+                        redirect_stderr=True, print_cmd=False)
+    self.assertTrue(time.time() - start < 30)
+
+  def testCloseFds(self):
+    """Test that fds of the parent are not leaked to the command."""
+    read_fd, write_fd = os.pipe()
+    try:
+      result = cros_build_lib.RunCommand(
+          ['bash', '-c', '[[ -e /dev/fd/%d || -e /dev/fd/%d ]]'
+           % (read_fd, write_fd)], error_code_ok=True, print_cmd=False)
+    finally:
+      os.close(read_fd)
+      os.close(write_fd)
+    self.assertEqual(result.returncode, 1)
+
 
 def _ForceLoggingLevel(functor):
   def inner(*args, **kwds):
@@ -485,6 +536,30 @@ class TestRetries(cros_test_lib.MoxTestCase):
     self.assertRaises(StopIteration,
                       cros_build_lib.RetryReturned, f, 3, tested_source)
 
+  def testRetryExceptionOriginal(self):
+    """The first exception is re-raised as is once retries run out."""
+    class _TestError(Exception):
+      """Error raised by the retried functor."""
+
+    attempts = []
+    def f():
+      attempts.append(len(attempts))
+      raise _TestError(len(attempts))
+
+    try:
+      cros_build_lib.RetryException(_TestError, 2, f)
+    except _TestError as e:
+      self.assertEqual(e.args, (1,))
+    else:
+      self.fail('RetryException did not raise _TestError')
+    self.assertEqual(attempts, [0, 1, 2])
+
+    # Exceptions the handler does not retry on propagate straight away.
+    del attempts[:]
+    self.assertRaises(_TestError, cros_build_lib.RetryException,
+                      ValueError, 2, f)
+    self.assertEqual(attempts, [0])
+
   @osutils.TempDirDecorator
   def testBasicRetry(self):
     # pylint: disable=E1101
@@ -886,6 +961,82 @@ class TestManifestCheckout(cros_test_lib.TempDirTestCase):
     self.assertEqual(branches, ['refs/remotes/origin/release-R23-2913.B'])
 
 
+class TestGitRepoInfo(cros_test_lib.MockTempDirTestCase):
+  """Tests for git.GitRepoInfo against real repositories."""
+
+  def _MakeRepo(self, name, projectname=None):
+    """Create a repository with one commit, and return its path."""
+    path = os.path.join(self.tempdir, name)
+    osutils.WriteFile(os.path.join(path, 'README'), name, makedirs=True)
+    git.RunGit(path, ['init'])
+    git.RunGit(path, ['add', 'README'])
+    git.RunGit(path, ['-c', 'user.name=Test', '-c', 'user.email=t@example.com',
+                      'commit', '-m', 'Add %s' % name])
+    if projectname:
+      git.RunGit(path, ['config', 'remote.cros.projectname', projectname])
+    return path
+
+  def _Git(self, path, *args):
+    return git.RunGit(path, list(args)).output.strip()
+
+  def assertSameAsGit(self, info, path):
+    self.assertEqual(info.GetHead(path), self._Git(path, 'rev-parse', 'HEAD'))
+    self.assertEqual(info.GetTree(path),
+                     self._Git(path, 'log', '-1', '--format=%T'))
+
+  def testLooseAndPackedRefs(self):
+    """Test reading HEAD through loose refs, packed refs and detached HEADs."""
+    path = self._MakeRepo('repo')
+    os.makedirs(os.path.join(path, 'subdir'))
+    self.assertSameAsGit(git.GitRepoInfo(), os.path.join(path, 'subdir'))
+    git.RunGit(path, ['gc', '-q'])
+    self.assertEqual(os.listdir(os.path.join(path, '.git', 'refs', 'heads')),
+                     [])
+    self.assertSameAsGit(git.GitRepoInfo(), path)
+    git.RunGit(path, ['checkout', '-q', '--detach'])
+    self.assertSameAsGit(git.GitRepoInfo(), path)
+
+  def testGitFile(self):
+    """Test checkouts whose .git is a file pointing elsewhere."""
+    path = self._MakeRepo('repo')
+    os.rename(os.path.join(path, '.git'), os.path.join(self.tempdir, 'git'))
+    osutils.WriteFile(os.path.join(path, '.git'), 'gitdir: ../git\n')
+    self.assertSameAsGit(git.GitRepoInfo(), path)
+
+  def testProjectName(self):
+    """Test reading projectname out of the config."""
+    info = git.GitRepoInfo()
+    path = self._MakeRepo('repo', projectname='chromiumos/platform/repo')
+    git.RunGit(path, ['config', 'remote.cros-internal.projectname', 'other'])
+    self.assertEqual(info.GetProjectName(path, ('cros', 'cros-internal')),
+                     'chromiumos/platform/repo')
+    self.assertEqual(info.GetProjectName(path, ('cros-internal',)), 'other')
+    self.assertEqual(info.GetProjectName(path, ('missing',)), None)
+    git.RunGit(path, ['config', 'remote.cros.projectname', 'quoted "name"'])
+    self.assertEqual(info.GetProjectName(path, ('cros',)), None)
+
+  def testPrefetch(self):
+    """Test that the trees of many repositories are read in one go."""
+    paths = [self._MakeRepo('repo%d' % i) for i in range(3)]
+    git.RunGit(paths[1], ['gc', '-q'])
+    info = git.GitRepoInfo()
+    run_mock = self.PatchObject(cros_build_lib, 'RunCommand',
+                                side_effect=cros_build_lib.RunCommand)
+    info.Prefetch(paths + [self.tempdir])
+    for path in paths:
+      info.GetTree(path)
+    self.assertEqual(run_mock.call_count, 1)
+    run_mock.stop()
+    for path in paths:
+      self.assertSameAsGit(info, path)
+
+  def testGitEnvironment(self):
+    """Test that nothing is guessed when GIT_DIR is set."""
+    path = self._MakeRepo('repo')
+    self.PatchObject(os, 'environ', {'GIT_DIR': os.path.join(path, '.git')})
+    self.assertEqual(git.GitRepoInfo().GetHead(path), None)
+
+
 # pylint: disable=W0212,R0904
 class TestTreeStatus(cros_test_lib.MoxTestCase):
   """Tests TreeStatus method in cros_build_lib."""
@@ -427,8 +427,12 @@ class SpreadsheetComm(object):
   # Spreadsheet column numbers start at 1.
   COLUMN_NUMBER_OFFSET = 1
 
+  # Maximum number of queued cell updates to send in one batch request.
+  BATCH_SIZE = 500
+
   __slots__ = (
     '_columns',    # Tuple of translated column names, filled in as needed
+    '_pending',    # Dict of (ss_key, ws_key) to dict of (row, col) to value
     '_rows',       # Tuple of Row dicts in order, filled in as needed
     'gd_client',   # Google Data client
     'ss_key',      # Spreadsheet key
@@ -482,6 +486,7 @@ class SpreadsheetComm(object):
   def __init__(self):
     for slot in self.__slots__:
       setattr(self, slot, None)
+    self._pending = {}
 
   def Connect(self, creds, ss_key, ws_name, source='chromiumos'):
     """Login to spreadsheet service and set current worksheet.
@@ -543,6 +548,16 @@ class SpreadsheetComm(object):
     oper.Die('Unable to find worksheet "%s" in spreadsheet "%s"' %
              (ws_name, ss_key))
 
+  @ReadWriteDecorator
+  def GetWorksheetUpdated(self):
+    """Return the last-updated timestamp of the current worksheet.
+
+    This only fetches the worksheet entry, so it is a cheap way to find out
+    whether anything in the worksheet changed since an earlier call.
+    """
+    entry = self.gd_client.GetWorksheetsFeed(self.ss_key, wksht_id=self.ws_key)
+    return entry.updated.text
+
   @ReadWriteDecorator
   def GetColumns(self):
     """Return tuple of column names in worksheet.
@@ -605,6 +620,97 @@ class SpreadsheetComm(object):
         self.ReplaceCellValue(rowIx, colIx, row[colName])
     self._ClearCache(keep_columns=True)
 
+  def QueueRowUpdate(self, rowIx, row):
+    """Queue replacing cell values in row at |rowIx| with those in |row| dict.
+
+    Unlike UpdateRowCellByCell nothing is sent to the spreadsheet until
+    FlushCellUpdates is called.
+    """
+    for colName in row:
+      colIx = self.GetColumnIndex(colName)
+      if colIx is not None:
+        self.QueueCellValue(rowIx, colIx, row[colName])
+
+  def QueueCellValue(self, rowIx, colIx, val):
+    """Queue replacing cell value at |rowIx| and |colIx| with |val|."""
+    pending = self._pending.setdefault((self.ss_key, self.ws_key), {})
+    pending[(rowIx, colIx)] = val
+
+  @ReadWriteDecorator
+  def FlushCellUpdates(self):
+    """Send all queued cell updates, in batches of at most BATCH_SIZE cells.
+
+    Returns:
+      The number of cells updated.
+    """
+    count = 0
+    for (ss_key, ws_key), pending in sorted(self._pending.items()):
+      cells = sorted(pending.iteritems())
+      for start in xrange(0, len(cells), self.BATCH_SIZE):
+        self._UpdateCellBatch(ss_key, ws_key,
+                              cells[start:start + self.BATCH_SIZE])
+        # Drop cells as they are sent so a failure does not resend them.
+        for cell, _ in cells[start:start + self.BATCH_SIZE]:
+          del pending[cell]
+      del self._pending[(ss_key, ws_key)]
+      count += len(cells)
+
+    if count:
+      self._ClearCache(keep_columns=True)
+    return count
+
+  @staticmethod
+  def _GetRowRanges(cells):
+    """Split |cells|, sorted by row, into runs of consecutive rows.
+
+    Returns:
+      A list of (min_row, max_row, min_col, max_col) tuples, one per run,
+      each covering the cells of that run.
+    """
+    ranges = []
+    for (rowIx, colIx), _ in cells:
+      if ranges and rowIx <= ranges[-1][1] + 1:
+        min_row, _, min_col, max_col = ranges[-1]
+        ranges[-1] = (min_row, rowIx, min(min_col, colIx), max(max_col, colIx))
+      else:
+        ranges.append((rowIx, rowIx, colIx, colIx))
+    return ranges
+
+  def _UpdateCellBatch(self, ss_key, ws_key, cells):
+    """Update |cells|, a list of ((row, col), value), with one batch request.
+
+    The cell entries are fetched with one query per run of consecutive rows
+    in |cells|, for the columns used in that run, so that rows which are not
+    updated are never fetched.  They are then posted back to the cells batch
+    feed.
+    """
+    entries = {}
+    for min_row, max_row, min_col, max_col in self._GetRowRanges(cells):
+      query = gdata.spreadsheet.service.CellQuery()
+      query['min-row'] = str(min_row)
+      query['max-row'] = str(max_row)
+      query['min-col'] = str(min_col)
+      query['max-col'] = str(max_col)
+      query['return-empty'] = 'true'
+      feed = self.gd_client.GetCellsFeed(ss_key, ws_key, query=query)
+      entries.update(((int(entry.cell.row), int(entry.cell.col)), entry)
+                     for entry in feed.entry)
+
+    batch = gdata.spreadsheet.SpreadsheetsCellsFeed()
+    for (rowIx, colIx), val in cells:
+      entry = entries.get((rowIx, colIx))
+      if entry is None:
+        raise SpreadsheetError('Cell R%dC%d is not in worksheet' %
+                               (rowIx, colIx))
+      entry.cell.inputValue = '' if val is None else val
+      batch.AddUpdate(entry)
+
+    result = self.gd_client.ExecuteBatch(batch, url=feed.GetBatchLink().href)
+    for entry in result.entry:
+      if entry.batch_status and entry.batch_status.code != '200':
+        raise SpreadsheetError('Batch update of cell %s failed: %s' %
+                               (entry.id.text, entry.batch_status.reason))
+
   @ReadWriteDecorator
   def DeleteRow(self, ss_row):
     """Delete the given |ss_row| (must be original spreadsheet row object."""
@@ -8,8 +8,11 @@
 import getpass
 import re
 
+import atom
 import atom.service
 import gdata.projecthosting.client as gd_ph_client
+import gdata
+import gdata.spreadsheet
 import gdata.spreadsheet.service
 import mox
 import os
@@ -709,6 +712,133 @@ class SpreadsheetCommTest(cros_test_lib.MoxOutputTestCase):
     gdata_lib.SpreadsheetComm.ClearCellValue(mocked_scomm, rowIx, colIx)
     self.mox.VerifyAll()
 
+  def testGetWorksheetUpdated(self):
+    mocked_scomm = self.MockScomm()
+
+    entry = cros_test_lib.EasyAttr(updated=cros_test_lib.EasyAttr(text='T1'))
+
+    # Replay script
+    mocked_scomm.gd_client.GetWorksheetsFeed(
+        self.SS_KEY, wksht_id=self.WS_KEY).AndReturn(entry)
+    self.mox.ReplayAll()
+
+    # Verify
+    result = gdata_lib.SpreadsheetComm.GetWorksheetUpdated(mocked_scomm)
+    self.mox.VerifyAll()
+    self.assertEquals(result, 'T1')
+
+  def testQueueRowUpdate(self):
+    mocked_scomm = self.MockScomm()
+
+    rowIx = 5
+    row = {'a': 123, 'b': 234, 'c': 345}
+    colIndices = {'a': 1, 'b': None, 'c': 4}
+
+    # Replay script
+    for colName in row:
+      colIx = colIndices[colName]
+      mocked_scomm.GetColumnIndex(colName).AndReturn(colIx)
+      if colIx is not None:
+        mocked_scomm.QueueCellValue(rowIx, colIx, row[colName])
+    self.mox.ReplayAll()
+
+    # This is the test verification.
+    gdata_lib.SpreadsheetComm.QueueRowUpdate(mocked_scomm, rowIx, row)
+    self.mox.VerifyAll()
+
+  def testFlushCellUpdates(self):
+    """Test that queued cells are sent in bounded batches."""
+    gd_client = FakeCellsClient()
+    scomm = self.NewScomm(gd_client=gd_client)
+    scomm._rows = 'StaleRows'
+    self.mox.stubs.Set(gdata_lib.SpreadsheetComm, 'BATCH_SIZE', 40)
+
+    # Queue 100 rows of two cells each, and update one cell twice.
+    for rowIx in xrange(2, 102):
+      scomm.QueueCellValue(rowIx, 1, 'pkg%d' % rowIx)
+      scomm.QueueCellValue(rowIx, 3, None)
+    scomm.QueueCellValue(2, 1, 'newpkg')
+    self.assertEquals(scomm.FlushCellUpdates(), 200)
+
+    # Five batches, each one cells feed query plus one batch post.
+    self.assertEquals(gd_client.requests, 10)
+    self.assertEquals(gd_client.cells[(2, 1)], 'newpkg')
+    self.assertEquals(gd_client.cells[(101, 1)], 'pkg101')
+    self.assertEquals(gd_client.cells[(50, 3)], '')
+    self.assertEquals(scomm._rows, None)
+
+    # Nothing left to send.
+    self.assertEquals(scomm.FlushCellUpdates(), 0)
+    self.assertEquals(gd_client.requests, 10)
+
+  def testFlushCellUpdatesSparse(self):
+    """Test that only the rows being updated are fetched."""
+    gd_client = FakeCellsClient()
+    scomm = self.NewScomm(gd_client=gd_client)
+    scomm.QueueCellValue(2, 1, 'first')
+    scomm.QueueCellValue(3, 2, 'second')
+    scomm.QueueCellValue(1000, 20, 'last')
+    self.assertEquals(scomm.FlushCellUpdates(), 3)
+
+    # One query per run of rows, and one batch post.
+    self.assertEquals(gd_client.requests, 3)
+    self.assertEquals(gd_client.fetched, 5)
+    self.assertEquals(gd_client.cells[(3, 2)], 'second')
+    self.assertEquals(gd_client.cells[(1000, 20)], 'last')
+
+  def testFlushCellUpdatesError(self):
+    """Test that failed batch entries raise SpreadsheetError."""
+    gd_client = FakeCellsClient(fail_cells=[(3, 1)])
+    scomm = self.NewScomm(gd_client=gd_client)
+    scomm.QueueCellValue(3, 1, 'foo')
+    self.assertRaises(gdata_lib.SpreadsheetError, scomm.FlushCellUpdates)
+
+
+class FakeCellsClient(object):
+  """Stand-in for the cells feed of a spreadsheet service.
+
+  Answers cells feed queries and batch posts from an in-memory worksheet,
+  counting the requests made and the cells fetched.
+  """
+
+  BATCH_URL = 'http://fake/batch'
+
+  def __init__(self, fail_cells=()):
+    self.cells = {}
+    self.requests = 0
+    self.fetched = 0
+    self.fail_cells = fail_cells
+
+  def GetCellsFeed(self, _ss_key, _ws_key, query):
+    self.requests += 1
+    feed = gdata.spreadsheet.SpreadsheetsCellsFeed()
+    feed.link.append(atom.Link(rel='http://schemas.google.com/g/2005#batch',
+                               href=self.BATCH_URL))
+    for rowIx in xrange(int(query['min-row']), int(query['max-row']) + 1):
+      for colIx in xrange(int(query['min-col']), int(query['max-col']) + 1):
+        cell = gdata.spreadsheet.Cell(row=str(rowIx), col=str(colIx),
+                                      inputValue=self.cells.get((rowIx, colIx)))
+        feed.entry.append(gdata.spreadsheet.SpreadsheetsCell(
+            atom_id=atom.Id(text='R%dC%d' % (rowIx, colIx)), cell=cell))
+        self.fetched += 1
+    return feed
+
+  def ExecuteBatch(self, batch, url):
+    assert url == self.BATCH_URL
+    self.requests += 1
+    result = gdata.spreadsheet.SpreadsheetsCellsFeed()
+    for entry in batch.entry:
+      cell = (int(entry.cell.row), int(entry.cell.col))
+      code = '200'
+      if cell in self.fail_cells:
+        code = '409'
+      else:
+        self.cells[cell] = entry.cell.inputValue
+      result.entry.append(gdata.spreadsheet.SpreadsheetsCell(
+          atom_id=entry.id,
+          batch_status=gdata.BatchStatus(code=code, reason='reason')))
+    return result
+
 
 class IssueCommentTest(cros_test_lib.TestCase):
 
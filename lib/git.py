@@ -175,6 +175,196 @@ def GetCurrentBranch(cwd):
     return None
 
 
+# Environment variables that change where git looks for a repository.
+_GIT_DIR_ENV_VARS = ('GIT_DIR', 'GIT_COMMON_DIR', 'GIT_OBJECT_DIRECTORY')
+_CONFIG_SECTION_RE = re.compile(
+    r'^\[\s*([A-Za-z0-9.-]+)(?:\s+"([^"\\]*)")?\s*\]\s*(?:[#;].*)?$')
+_CONFIG_VALUE_RE = re.compile(
+    r'^([A-Za-z][A-Za-z0-9-]*)\s*(?:=\s*(.*?))?\s*$')
+
+
+def _FindGitDir(path):
+  """Return the .git directory of the checkout containing |path|, or None.
+
+  Only handles the plain layouts that repo creates; None is also returned
+  when git would have to be asked.
+  """
+  if any(var in os.environ for var in _GIT_DIR_ENV_VARS):
+    return None
+  path = os.path.realpath(path)
+  while True:
+    git_dir = os.path.join(path, '.git')
+    if os.path.isdir(git_dir):
+      break
+    elif os.path.isfile(git_dir):
+      content = osutils.ReadFile(git_dir).strip()
+      if not content.startswith('gitdir: '):
+        return None
+      git_dir = os.path.join(path, content[len('gitdir: '):])
+      break
+    elif path == '/':
+      return None
+    path = os.path.dirname(path)
+  if os.path.exists(os.path.join(git_dir, 'commondir')):
+    # Worktrees share refs with another repository.
+    return None
+  return git_dir
+
+
+def _ReadRef(git_dir, ref, depth=5):
+  """Resolve |ref| to a SHA1 using the files in |git_dir|, or return None."""
+  try:
+    value = osutils.ReadFile(os.path.join(git_dir, ref)).strip()
+  except EnvironmentError as e:
+    if e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EISDIR):
+      raise
+  else:
+    if value.startswith('ref: ') and depth:
+      return _ReadRef(git_dir, value[len('ref: '):], depth - 1)
+    return value if IsSHA1(value) else None
+
+  try:
+    packed_refs = osutils.ReadFile(os.path.join(git_dir, 'packed-refs'))
+  except EnvironmentError as e:
+    if e.errno != errno.ENOENT:
+      raise
+    return None
+  for line in packed_refs.splitlines():
+    if not line.startswith(('#', '^')):
+      sha1, _, name = line.partition(' ')
+      if name == ref:
+        return sha1 if IsSHA1(sha1) else None
+  return None
+
+
+def _ReadConfig(git_dir, section, subsection, key):
+  """Read a value out of the config file in |git_dir|.
+
+  Returns:
+    The last value of section.subsection.key, or None if it is not set or if
+    the file uses syntax that is not handled here (includes, quoting, ...).
+  """
+  try:
+    config = osutils.ReadFile(os.path.join(git_dir, 'config'))
+  except EnvironmentError:
+    return None
+
+  current = None
+  value = None
+  for line in config.splitlines():
+    line = line.strip()
+    if not line or line[0] in '#;':
+      continue
+    m = _CONFIG_SECTION_RE.match(line)
+    if m:
+      if m.group(1).lower() == 'include' or '.' in m.group(1):
+        return None
+      current = (m.group(1).lower(), m.group(2))
+      continue
+    m = _CONFIG_VALUE_RE.match(line)
+    if not m or current is None or (m.group(2) and
+                                    any(c in m.group(2) for c in '"\\#;')):
+      return None
+    if current == (section, subsection) and m.group(1).lower() == key:
+      value = m.group(2)
+  return value
+
+
+class GitRepoInfo(object):
+  """Looks up the HEAD commit, tree and project name of git checkouts.
+
+  HEAD and the project name are read straight out of the .git directory, and
+  the trees of the HEAD commits of any number of checkouts are read with a
+  single `git cat-file --batch`, so that dealing with many checkouts does not
+  cost several git processes per checkout.  For anything unusual, the lookups
+  return None, and callers should fall back to running git in the checkout.
+
+  Commit to tree mappings never change, so one instance can be shared for as
+  long as needed; HEAD is read again on every call.
+  """
+
+  def __init__(self):
+    self._trees = {}
+
+  def GetHead(self, path):
+    """Return the SHA1 of the HEAD commit of the checkout containing |path|."""
+    git_dir = _FindGitDir(path)
+    return _ReadRef(git_dir, 'HEAD') if git_dir else None
+
+  def GetTree(self, path):
+    """Return the SHA1 of the tree of the HEAD commit of |path|."""
+    commit = self.GetHead(path)
+    if commit is not None and commit not in self._trees:
+      self.Prefetch([path])
+    return self._trees.get(commit)
+
+  def Prefetch(self, paths):
+    """Look up the trees of the HEAD commits of |paths| in one go.
+
+    Args:
+      paths: Paths inside the checkouts to look up.
+    """
+    git_dirs = []
+    object_dirs = []
+    commits = []
+    for path in paths:
+      git_dir = _FindGitDir(path)
+      commit = _ReadRef(git_dir, 'HEAD') if git_dir else None
+      if commit is None or commit in self._trees:
+        continue
+      commits.append(commit)
+      git_dirs.append(git_dir)
+      object_dir = os.path.realpath(os.path.join(git_dir, 'objects'))
+      if object_dir not in object_dirs:
+        object_dirs.append(object_dir)
+    if not commits:
+      return
+
+    # Make the objects of all the checkouts visible to a single git process.
+    alternates = object_dirs[1:]
+    if os.environ.get('GIT_ALTERNATE_OBJECT_DIRECTORIES'):
+      alternates.append(os.environ['GIT_ALTERNATE_OBJECT_DIRECTORIES'])
+    result = cros_build_lib.RunCommand(
+        ['git', 'cat-file', '--batch'], input='\n'.join(commits) + '\n',
+        extra_env={'GIT_DIR': git_dirs[0],
+                   'GIT_ALTERNATE_OBJECT_DIRECTORIES': ':'.join(alternates)},
+        redirect_stdout=True, redirect_stderr=True, error_code_ok=True,
+        print_cmd=False)
+
+    # Each object is output as "<sha1> <type> <size>\n<contents>\n", and
+    # objects that were not found as "<sha1> missing\n".
+    output = result.output
+    pos = 0
+    while pos < len(output):
+      end = output.find('\n', pos)
+      if end == -1:
+        break
+      header = output[pos:end].split()
+      pos = end + 1
+      if len(header) != 3:
+        continue
+      sha1, obj_type, size = header
+      contents = output[pos:pos + int(size)]
+      pos += int(size) + 1
+      if obj_type == 'commit' and contents.startswith('tree '):
+        self._trees[sha1] = contents[len('tree '):].split('\n', 1)[0]
+
+  def GetProjectName(self, path, remotes):
+    """Return the projectname of a remote of the checkout containing |path|.
+
+    Args:
+      path: A path inside the checkout.
+      remotes: The remotes to try, in order.
+    """
+    git_dir = _FindGitDir(path)
+    if git_dir:
+      for remote in remotes:
+        value = _ReadConfig(git_dir, 'remote', remote, 'projectname')
+        if value:
+          return value
+    return None
+
+
 def StripRefsHeads(ref, strict=True):
   """Remove leading 'refs/heads/' from a ref name.
 
@@ -813,7 +1003,7 @@ def GetTrackingBranchViaManifest(git_repo, for_checkout=True, for_push=False,
         return None
 
     return remote, revision
-  except EnvironmentError:
+  except EnvironmentError as e:
     if e.errno != errno.ENOENT:
       raise
   return None
@@ -84,6 +84,75 @@ class GSContextMock(partial_mock.PartialCmdMock):
       return self.backup['_DoCommand'](inst, gsutil_cmd, **kwargs)
 
 
+class LocalGSUtil(object):
+  """A gsutil stand-in that serves gs:// URLs out of a local directory.
+
+  Only `cat` and `ls [-l]` are supported, with the same output and errors as
+  gsutil.  This allows code that runs gsutil directly to be tested, or timed,
+  without network access.  Point gs.GSUTIL_BIN at |gsutil_bin| to use it.
+  """
+
+  _SCRIPT = """#!%(python)s
+import datetime, os, sys, time
+root, delay = %(root)r, %(delay)r
+time.sleep(delay)
+
+def Path(url):
+  if not url.startswith('gs://'):
+    sys.exit('InvalidUriError: %%s is not a gs:// URL' %% url)
+  return os.path.join(root, url[len('gs://'):])
+
+cmd, args = sys.argv[1], sys.argv[2:]
+if cmd == 'cat':
+  for url in args:
+    if not os.path.isfile(Path(url)):
+      sys.exit('InvalidUriError: Attempt to get key for "%%s" failed' %% url)
+    sys.stdout.write(open(Path(url)).read())
+elif cmd == 'ls':
+  long_format = args[0] == '-l'
+  url = args[-1]
+  path = Path(url)
+  names = sorted(os.listdir(path)) if os.path.isdir(path) else []
+  if not names:
+    sys.exit('CommandException: One or more URIs matched no objects.')
+  for name in names:
+    st = os.stat(os.path.join(path, name))
+    obj_url = url.rstrip('/') + '/' + name
+    if os.path.isdir(os.path.join(path, name)):
+      print obj_url + '/'
+    elif long_format:
+      mtime = datetime.datetime.utcfromtimestamp(st.st_mtime)
+      print '%%10d  %%s  %%s' %% (st.st_size, mtime.isoformat(), obj_url)
+    else:
+      print obj_url
+  if long_format:
+    print 'TOTAL: %%d objects' %% len(names)
+else:
+  sys.exit('CommandException: %%s is not supported' %% cmd)
+"""
+
+  def __init__(self, tempdir, delay=0):
+    """Create the stand-in.
+
+    Args:
+      tempdir: Directory to keep the objects and the stand-in script in.
+      delay: Seconds to sleep in each command, to emulate network latency.
+    """
+    self.root = os.path.join(tempdir, 'gs')
+    self.gsutil_bin = os.path.join(tempdir, 'gsutil')
+    osutils.SafeMakedirs(self.root)
+    osutils.WriteFile(self.gsutil_bin,
+                      self._SCRIPT % {'python': sys.executable,
+                                      'root': self.root, 'delay': delay})
+    os.chmod(self.gsutil_bin, 0755)
+
+  def WriteObject(self, url, content):
+    """Store |content| at the gs:// |url|."""
+    assert url.startswith('gs://')
+    osutils.WriteFile(os.path.join(self.root, url[len('gs://'):]), content,
+                      makedirs=True)
+
+
 class AbstractGSContextTest(cros_test_lib.MockTempDirTestCase):
   """Base class for GSContext tests."""
 
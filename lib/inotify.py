@@ -0,0 +1,80 @@
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Minimal ctypes binding of the Linux inotify API."""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+
+
+# Constants from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CREATE = 0x00000100
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0x00080000
+IN_NONBLOCK = 0x00000800
+
+
+class Inotify(object):
+  """An inotify instance, and the watches added to it.
+
+  Raises:
+    OSError if inotify is not available.
+  """
+
+  _EVENT = struct.Struct('iIII')
+
+  def __init__(self):
+    try:
+      libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+      self._add_watch = libc.inotify_add_watch
+      self._rm_watch = libc.inotify_rm_watch
+      fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (AttributeError, OSError):
+      raise OSError(errno.ENOSYS, 'inotify is not available')
+    if fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    self.fd = fd
+
+  def AddWatch(self, path, mask):
+    """Watch |path| for the events in |mask|, and return the watch descriptor.
+
+    Raises:
+      OSError if the watch could not be added, e.g. because the limit of
+      watches per user was reached.
+    """
+    wd = self._add_watch(self.fd, path, mask)
+    if wd < 0:
+      err = ctypes.get_errno()
+      raise OSError(err, '%s: %s' % (os.strerror(err), path))
+    return wd
+
+  def RemoveWatch(self, wd):
+    """Stop watching the watch descriptor |wd|."""
+    self._rm_watch(self.fd, wd)
+
+  def ReadEvents(self):
+    """Return the pending events as a list of (wd, mask, name) tuples."""
+    events = []
+    while True:
+      try:
+        data = os.read(self.fd, 65536)
+      except OSError as e:
+        if e.errno == errno.EAGAIN:
+          return events
+        raise
+      pos = 0
+      while pos < len(data):
+        wd, mask, _cookie, length = self._EVENT.unpack_from(data, pos)
+        pos += self._EVENT.size
+        events.append((wd, mask, data[pos:pos + length].rstrip('\0')))
+        pos += length
+
+  def Close(self):
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
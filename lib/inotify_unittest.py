@@ -0,0 +1,68 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for inotify.py."""
+
+import errno
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite.lib import cros_test_lib
+from chromite.lib import inotify
+from chromite.lib import osutils
+
+
+class InotifyTest(cros_test_lib.TempDirTestCase):
+  """Tests for Inotify."""
+
+  def setUp(self):
+    try:
+      self.inotify = inotify.Inotify()
+    except OSError as e:
+      if e.errno != errno.ENOSYS:
+        raise
+      self.inotify = None
+
+  def tearDown(self):
+    if self.inotify is not None:
+      self.inotify.Close()
+
+  def testEvents(self):
+    """Test that events are read back for the right watch."""
+    if self.inotify is None:
+      return
+    path = os.path.join(self.tempdir, 'file')
+    osutils.Touch(path)
+    self.assertEqual(self.inotify.ReadEvents(), [])
+    wd = self.inotify.AddWatch(self.tempdir, inotify.IN_MODIFY |
+                               inotify.IN_CREATE)
+    osutils.WriteFile(path, 'data')
+    osutils.Touch(os.path.join(self.tempdir, 'new'))
+    self.assertEqual(self.inotify.ReadEvents(), [
+        (wd, inotify.IN_MODIFY, 'file'),
+        (wd, inotify.IN_CREATE, 'new'),
+    ])
+    self.inotify.RemoveWatch(wd)
+    self.assertEqual(self.inotify.ReadEvents(),
+                     [(wd, inotify.IN_IGNORED, '')])
+
+  def testMissingPath(self):
+    """Test that watching a missing path raises OSError."""
+    if self.inotify is None:
+      return
+    try:
+      self.inotify.AddWatch(os.path.join(self.tempdir, 'missing'),
+                            inotify.IN_MODIFY)
+    except OSError as e:
+      self.assertEqual(e.errno, errno.ENOENT)
+    else:
+      self.fail('AddWatch did not raise OSError')
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
@@ -11,6 +11,8 @@ import os
 import shutil
 import cStringIO
 import tempfile
+from chromite.buildbot import constants
+from chromite.lib import bash_vars
 from chromite.lib import cros_build_lib
 
 # Env vars that tempdir can be gotten from; minimally, this
@@ -364,6 +366,30 @@ def SetEnvironment(env):
   os.environ.update(env)
 
 
+def _EvaluateEnvironment(script, whitelist, ifs, env):
+  """Emulate the output of the bash script used by SourceEnvironment.
+
+  Raises:
+    bash_vars.UnsupportedSyntax if |script| needs to be run by bash.
+  """
+  # Replicate the environment RunCommand would give bash.
+  env = dict(os.environ if env is None else env)
+  for var in constants.ENV_PASSTHRU:
+    if var not in env and var in os.environ:
+      env[var] = os.environ[var]
+
+  variables = bash_vars.Evaluate(ReadFile(script), env)
+  output = []
+  for var in whitelist:
+    value = bash_vars.GetValue(variables, var)
+    if isinstance(value, list):
+      # Like ${VAR[*]}, which also treats empty arrays as unset.
+      value = ifs[:1].join(value) if value else None
+    if value is not None:
+      output.append('%s=%s' % (var, value))
+  return '\n'.join(output)
+
+
 def SourceEnvironment(script, whitelist, ifs=',', env=None):
   """Returns the environment exported by a shell script.
 
@@ -382,19 +408,24 @@ def SourceEnvironment(script, whitelist, ifs=',', env=None):
     A dictionary containing the values of the whitelisted environment
     variables that are set.
   """
-  dump_script = ['source "%s" >/dev/null' % script,
-                 'IFS="%s"' % ifs]
-  for var in whitelist:
-    dump_script.append(
-        '[[ "${%(var)s+set}" == "set" ]] && echo %(var)s="${%(var)s[*]}"'
-        % {'var': var})
-  dump_script.append('exit 0')
-
   if env is None:
     env = {}
   elif env is True:
     env = None
-  output = cros_build_lib.RunCommand(['bash'], env=env, redirect_stdout=True,
-                                     redirect_stderr=True, print_cmd=False,
-                                     input='\n'.join(dump_script)).output
+
+  # Most scripts only assign variables, so try to evaluate them without
+  # spawning bash first.
+  try:
+    output = _EvaluateEnvironment(script, whitelist, ifs, env)
+  except (bash_vars.UnsupportedSyntax, EnvironmentError):
+    dump_script = ['source "%s" >/dev/null' % script,
+                   'IFS="%s"' % ifs]
+    for var in whitelist:
+      dump_script.append(
+          '[[ "${%(var)s+set}" == "set" ]] && echo %(var)s="${%(var)s[*]}"'
+          % {'var': var})
+    dump_script.append('exit 0')
+    output = cros_build_lib.RunCommand(
+        ['bash'], env=env, redirect_stdout=True, redirect_stderr=True,
+        print_cmd=False, input='\n'.join(dump_script)).output
   return cros_build_lib.LoadKeyValueFile(cStringIO.StringIO(output))
@@ -4,131 +4,353 @@
 
 """Module for running cbuildbot stages in the background."""
 
-import collections
 import contextlib
 import errno
+import fcntl
 import functools
 import multiprocessing
+from multiprocessing import reduction
 import os
-import Queue
+import select
 import signal
 import sys
 import tempfile
+import threading
 import traceback
 
 from chromite.buildbot import cbuildbot_results as results_lib
 
-_PRINT_INTERVAL = 1
-_BUFSIZE = 1024
+_BUFSIZE = 64 * 1024
+# Output of steps that are not being printed yet is held in memory up to
+# this size, and spilled to a temporary file beyond it.
+_SPOOL_SIZE = 1024 * 1024
 
 
 class BackgroundFailure(results_lib.StepFailure):
   pass
 
 
-class _BackgroundSteps(multiprocessing.Process):
-  """Run a list of functions in sequence in the background.
-
-  These functions may be the 'Run' functions from buildbot stages or just plain
-  functions. They will be run in the background. Output from these functions
-  is saved to a temporary file and is printed when the 'WaitForStep' function
-  is called.
-  """
-
-  def __init__(self, semaphore=None):
-    """Create a new _BackgroundSteps object.
+def _Poll(poller):
+  """Call poller.poll(), retrying if it is interrupted by a signal."""
+  while True:
+    try:
+      return poller.poll()
+    except select.error as ex:
+      if ex.args[0] != errno.EINTR:
+        raise
 
-    If semaphore is supplied, it will be acquired for the duration of the
-    steps that are run in the background. This can be used to limit the
-    number of simultaneous parallel tasks.
-    """
-    multiprocessing.Process.__init__(self)
-    self._steps = collections.deque()
-    self._queue = multiprocessing.Queue()
-    self._semaphore = semaphore
-    self._started = multiprocessing.Event()
 
-  def AddStep(self, step):
-    """Add a step to the list of steps to run in the background."""
-    output = tempfile.NamedTemporaryFile(delete=False, bufsize=0)
-    self._steps.append((step, output))
+def _Read(fd):
+  """Read a block from |fd|, retrying if interrupted by a signal.
 
-  def Kill(self):
-    """Kill a running task."""
-    self._started.wait()
-    # Kill the children nicely with a KeyboardInterrupt.
+  Returns None if |fd| is non-blocking and has no data available.
+  """
+  while True:
     try:
-      os.kill(self.pid, signal.SIGINT)
+      return os.read(fd, _BUFSIZE)
     except OSError as ex:
-      if ex.errno != errno.ESRCH:
+      if ex.errno == errno.EAGAIN:
+        return None
+      if ex.errno != errno.EINTR:
         raise
 
-  def WaitForStep(self):
-    """Wait for the next step to complete.
+
+class _StepOutput(object):
+  """The output and result of a single background step.
+
+  The step writes its output to a pipe, whose read end is passed to the
+  parent when the step starts. The _OutputPump reads the pipe and the result
+  of the step from a helper thread. Output is buffered until the parent is
+  ready to print it, and then printed as it arrives.
+
+  All methods other than Wait must be called with the pump lock held.
+  """
+
+  def __init__(self):
+    self.fd = None
+    self.eof = False
+    self.done = False
+    self.result = None
+    self._buf = None
+    self._printing = False
+    self._printed = False
+    self._wake_fd = None
+
+  def fileno(self):
+    return self.fd
+
+  def Start(self, fd):
+    """Start reading the output of the step from |fd|."""
+    # Earlier events may already have been handled by Finish, so never block
+    # waiting for more.
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    self.fd = fd
+
+  def Handle(self):
+    """Handle output from the step. Returns False at EOF."""
+    if self.eof:
+      return False
+    data = _Read(self.fd)
+    if data is None:
+      return True
+    elif not data:
+      self.eof = True
+      os.close(self.fd)
+    elif self._printing:
+      sys.stdout.write(data)
+      sys.stdout.flush()
+    elif not self._printed:
+      if self._buf is None:
+        self._buf = tempfile.SpooledTemporaryFile(_SPOOL_SIZE)
+      self._buf.write(data)
+    return not self.eof
+
+  def Finish(self, error, results):
+    """Record the result of the step."""
+    # All of the output of the step was written to the pipe before the result
+    # was sent, so whatever is left can be read without blocking.
+    if self.fd is not None:
+      poller = select.poll()
+      poller.register(self.fd, select.POLLIN)
+      while not self.eof and poller.poll(0):
+        self.Handle()
+    self.result = (error, results)
+    self.done = True
+    if self._wake_fd is not None:
+      os.write(self._wake_fd, 'x')
+
+  def Wait(self, pump):
+    """Wait for the step to complete.
 
     Output from the step is printed as the step runs.
 
     If an exception occurs, return a string containing the traceback.
     """
-    assert not self.Empty()
-    _step, output = self._steps.popleft()
-
     # Flush stdout and stderr to be sure no output is interleaved.
     sys.stdout.flush()
     sys.stderr.flush()
 
-    # File position pointers are shared across processes, so we must open
-    # our own file descriptor to ensure output is not lost.
-    output_name = output.name
-    with open(output_name, 'r') as output:
-      os.unlink(output_name)
-      pos = 0
-      more_output = True
-      while more_output:
-        # Check whether the process is finished.
-        try:
-          error, results = self._queue.get(True, _PRINT_INTERVAL)
-          more_output = False
-        except Queue.Empty:
-          more_output = True
-
-        # Print output so far.
-        output.seek(pos)
-        buf = output.read(_BUFSIZE)
-        while len(buf) > 0:
-          sys.stdout.write(buf)
-          pos += len(buf)
-          if len(buf) < _BUFSIZE:
-            break
-          buf = output.read(_BUFSIZE)
+    read_fd, write_fd = os.pipe()
+    try:
+      with pump.lock:
+        if self._buf is not None:
+          self._buf.seek(0)
+          for data in iter(functools.partial(self._buf.read, _BUFSIZE), ''):
+            sys.stdout.write(data)
+          self._buf.close()
+          self._buf = None
         sys.stdout.flush()
+        self._printing = True
+        self._wake_fd = write_fd
+
+      poller = select.poll()
+      poller.register(read_fd, select.POLLIN)
+      while not self.done:
+        _Poll(poller)
+        _Read(read_fd)
+    finally:
+      with pump.lock:
+        self._printing = False
+        self._printed = True
+        self._wake_fd = None
+      os.close(read_fd)
+      os.close(write_fd)
+    sys.stdout.flush()
 
     # Propagate any results.
+    error, results = self.result
     for result in results:
       results_lib.Results.Record(*result)
 
     # If a traceback occurred, return it.
     return error
 
-  def Empty(self):
-    """Return True if there are any steps left to run."""
-    return len(self._steps) == 0
+
+class _OutputPump(object):
+  """Read the output and results of background steps from a helper thread.
+
+  The pump waits on a set of sources, each of which has a fileno() method
+  returning the fd to wait on, and a Handle() method that is called when the
+  fd is readable. Sources are dropped once Handle() returns False.
+  """
+
+  def __init__(self):
+    self.pid = os.getpid()
+    self.lock = threading.RLock()
+    self._sources = set()
+    self._thread = None
+    self._wake_fd, self._wake_write_fd = os.pipe()
+
+  def Add(self, source):
+    """Start waiting on |source|."""
+    with self.lock:
+      self._sources.add(source)
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._Run)
+        self._thread.daemon = True
+        self._thread.start()
+    os.write(self._wake_write_fd, 'x')
+
+  def _Run(self):
+    """Wait on all sources, until there are none left."""
+    while True:
+      with self.lock:
+        if not self._sources:
+          self._thread = None
+          return
+        sources = dict((x.fileno(), x) for x in self._sources)
+
+      poller = select.poll()
+      poller.register(self._wake_fd, select.POLLIN)
+      for fd in sources:
+        poller.register(fd, select.POLLIN)
+      events = _Poll(poller)
+
+      with self.lock:
+        for fd, _ in events:
+          if fd == self._wake_fd:
+            os.read(self._wake_fd, _BUFSIZE)
+          elif sources[fd] in self._sources and not sources[fd].Handle():
+            self._sources.discard(sources[fd])
+
+
+_pump = None
+
+
+def _GetPump():
+  """Return the _OutputPump for this process."""
+  global _pump
+  # Child processes cannot use the pump of their parent, as its thread is not
+  # running there.
+  if _pump is None or _pump.pid != os.getpid():
+    _pump = _OutputPump()
+  return _pump
+
+
+class _BackgroundSteps(multiprocessing.Process):
+  """Run a list of functions in sequence in the background.
+
+  These functions may be the 'Run' functions from buildbot stages or just plain
+  functions. They will be run in the background. Output from these functions
+  is sent back over a pipe per step, and is printed when the parent waits for
+  the matching _StepOutput.
+
+  Several _BackgroundSteps objects can share a list of steps, in which case
+  each step is run by whichever of them is free first.
+  """
+
+  def __init__(self, steps, next_step=None, stop=None):
+    """Create a new _BackgroundSteps object.
+
+    Args:
+      steps: A list of (step, _StepOutput) tuples to run.
+      next_step: A multiprocessing.Value holding the index of the next step to
+        run, shared by all the _BackgroundSteps objects that share |steps|.
+        If None, all of |steps| are run by this object.
+      stop: A multiprocessing.Value shared along with |next_step|. Once it is
+        set, no more steps are started, and the remaining ones are skipped.
+    """
+    multiprocessing.Process.__init__(self)
+    self._steps = steps
+    self._next_step = next_step
+    self._stop = stop
+    self._index = 0
+    self._running = None
+    self._eof = False
+    # The _BackgroundSteps objects sharing |steps|, including this one.
+    self.peers = [self]
+    self._conn, self._child_conn = multiprocessing.Pipe()
+    self._started = multiprocessing.Event()
+
+  def fileno(self):
+    return self._conn.fileno()
+
+  def Handle(self):
+    """Handle a message from the child. Returns False at EOF."""
+    try:
+      msg = self._conn.recv()
+    except EOFError:
+      self._conn.close()
+      self._eof = True
+      if self._running is not None:
+        output = self._steps[self._running][1]
+        output.Finish('Background step exited without reporting a result\n',
+                      [])
+      # If no process is left to run the remaining steps, nobody will.
+      if all(peer._eof for peer in self.peers):
+        for _step, output in self._steps:
+          if not output.done:
+            output.Finish('Background step was never run\n', [])
+      return False
+
+    if isinstance(msg, int):
+      # The child started a step, and is sending us its output pipe.
+      self._running = msg
+      output = self._steps[msg][1]
+      output.Start(reduction.recv_handle(self._conn))
+      _GetPump().Add(output)
+    else:
+      index, error, results = msg
+      self._running = None
+      self._steps[index][1].Finish(error, results)
+    return True
+
+  def Kill(self):
+    """Kill a running task, and skip the steps that did not start yet."""
+    if self._stop is not None:
+      self._stop.value = 1
+    self._started.wait()
+    # Kill the children nicely with a KeyboardInterrupt.
+    try:
+      os.kill(self.pid, signal.SIGINT)
+    except OSError as ex:
+      if ex.errno != errno.ESRCH:
+        raise
 
   def start(self):
     """Invoke multiprocessing.Process.start after flushing output/err."""
     sys.stdout.flush()
     sys.stderr.flush()
-    return multiprocessing.Process.start(self)
+    multiprocessing.Process.start(self)
+    self._child_conn.close()
+    _GetPump().Add(self)
 
   def run(self):
     """Run the list of steps."""
-    if self._semaphore is not None:
-      self._semaphore.acquire()
-    try:
-      self._RunSteps()
-    finally:
-      if self._semaphore is not None:
-        self._semaphore.release()
+    self._conn.close()
+    # Keep programs run by the steps from holding the connection open.
+    fd = self._child_conn.fileno()
+    fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) |
+                fcntl.FD_CLOEXEC)
+    self._RunSteps()
+
+  def _GetNextStep(self):
+    """Return the index of the next step to run, or None if none are left."""
+    if self._next_step is None:
+      index = self._index
+      self._index += 1
+    else:
+      with self._next_step.get_lock():
+        if self._stop.value:
+          self._SkipRemainingSteps()
+          return None
+        index = self._next_step.value
+        self._next_step.value += 1
+    if index < len(self._steps):
+      return index
+    return None
+
+  def _SkipRemainingSteps(self):
+    """Report the steps that nobody started yet as skipped.
+
+    Must be called with the lock of |self._next_step| held.
+    """
+    self._stop.value = 1
+    for index in xrange(self._next_step.value, len(self._steps)):
+      self._child_conn.send((index, 'Step skipped after an earlier step was '
+                                    'interrupted\n', []))
+    self._next_step.value = max(self._next_step.value, len(self._steps))
 
   def _RunSteps(self):
     """Internal method for running the list of steps."""
@@ -138,7 +360,6 @@ class _BackgroundSteps(multiprocessing.Process):
     # custom one instead.
     def kill_us(_sig_num, _frame):
       raise KeyboardInterrupt('SIGINT received')
-    signal.signal(signal.SIGINT, kill_us)
 
     sys.stdout.flush()
     sys.stderr.flush()
@@ -147,21 +368,30 @@ class _BackgroundSteps(multiprocessing.Process):
     stderr_fileno = sys.__stderr__.fileno()
     orig_stdout_fd, orig_stderr_fd = map(os.dup,
                                          [stdout_fileno, stderr_fileno])
-    cancel = False
-    while self._steps:
-      step, output = self._steps.popleft()
-      # Send all output to a named temporary file.
-      os.dup2(output.fileno(), stdout_fileno)
-      os.dup2(output.fileno(), stderr_fileno)
+    while True:
+      index = self._GetNextStep()
+      if index is None:
+        break
+      step = self._steps[index][0]
+
+      # Send all output to a new pipe, and hand the other end to the parent.
+      read_fd, write_fd = os.pipe()
+      self._child_conn.send(index)
+      reduction.send_handle(self._child_conn, read_fd, os.getppid())
+      os.close(read_fd)
+      os.dup2(write_fd, stdout_fileno)
+      os.dup2(write_fd, stderr_fileno)
+      os.close(write_fd)
       # Replace std[out|err] with unbuffered file objects
       sys.stdout = os.fdopen(sys.__stdout__.fileno(), 'w', 0)
       sys.stderr = os.fdopen(sys.__stderr__.fileno(), 'w', 0)
       error = None
+      cancel = False
       try:
+        signal.signal(signal.SIGINT, kill_us)
         results_lib.Results.Clear()
         self._started.set()
-        if not cancel:
-          step()
+        step()
       except results_lib.StepFailure as ex:
         error = str(ex)
       except BaseException as ex:
@@ -169,16 +399,26 @@ class _BackgroundSteps(multiprocessing.Process):
         # If it's a fatal exception, don't run any more steps.
         if isinstance(ex, (SystemExit, KeyboardInterrupt)):
           cancel = True
+      # Only the step itself should be interrupted by Kill().
+      signal.signal(signal.SIGINT, signal.SIG_IGN)
 
       sys.stdout.flush()
       sys.stderr.flush()
-      output.close()
       sys.stdout, sys.stderr = orig_stdout, orig_stderr
       os.dup2(orig_stdout_fd, stdout_fileno)
       os.dup2(orig_stderr_fd, stderr_fileno)
-      map(os.close, [orig_stdout_fd, orig_stderr_fd])
-      results = results_lib.Results.Get()
-      self._queue.put((error, results))
+      results = [result + (results_lib.Results.GetUsage(result[0]),)
+                 for result in results_lib.Results.Get()]
+      self._child_conn.send((index, error, results))
+      if cancel:
+        if self._next_step is not None:
+          with self._next_step.get_lock():
+            self._SkipRemainingSteps()
+        break
+
+    map(os.close, [orig_stdout_fd, orig_stderr_fd])
+    self._child_conn.close()
+    self._started.set()
 
 
 @contextlib.contextmanager
@@ -188,8 +428,8 @@ def _ParallelSteps(steps, max_parallel=None, halt_on_error=False):
   This function launches the provided functions in the background, yields,
   and then waits for the functions to exit.
 
-  The output from the functions is saved to a temporary file and printed as if
-  they were run in sequence.
+  The output from the functions is buffered in the background and printed as
+  if they were run in sequence.
 
   If exceptions occur in the steps, we join together the tracebacks and print
   them after all parallel tasks have finished running. Further, a
@@ -198,37 +438,45 @@ def _ParallelSteps(steps, max_parallel=None, halt_on_error=False):
   Args:
     steps: A list of functions to run.
     max_parallel: The maximum number of simultaneous tasks to run in parallel.
-      By default, run all tasks in parallel.
+      By default, run all tasks in parallel. Otherwise, only this many
+      processes are started, and each of them runs steps until none are left.
     halt_on_error: After the first exception occurs, halt any running steps,
       and squelch any further output, including any exceptions that might occur.
   """
 
-  semaphore = None
-  if max_parallel is not None:
-    semaphore = multiprocessing.Semaphore(max_parallel)
-
   # First, start all the steps.
+  pump = _GetPump()
+  entries = [(step, _StepOutput()) for step in steps]
+  if max_parallel is None or max_parallel >= len(steps):
+    args = [([entry],) for entry in entries]
+  else:
+    next_step = multiprocessing.Value('i', 0)
+    stop = multiprocessing.Value('b', 0)
+    args = [(entries, next_step, stop)] * max_parallel
   bg_steps = []
-  for step in steps:
-    bg = _BackgroundSteps(semaphore)
-    bg.AddStep(step)
+  for bg_args in args:
+    bg_steps.append(_BackgroundSteps(*bg_args))
+  if max_parallel is not None and max_parallel < len(steps):
+    for bg in bg_steps:
+      bg.peers = bg_steps
+  for bg in bg_steps:
     bg.start()
-    bg_steps.append(bg)
 
   try:
     yield
   finally:
     # Wait for each step to complete.
     tracebacks = []
+    for _step, output in entries:
+      if tracebacks and halt_on_error:
+        for bg in bg_steps:
+          if bg.is_alive():
+            bg.Kill()
+        break
+      error = output.Wait(pump)
+      if error is not None:
+        tracebacks.append(error)
     for bg in bg_steps:
-      while not bg.Empty():
-        if tracebacks and halt_on_error:
-          bg.Kill()
-          break
-        else:
-          error = bg.WaitForStep()
-          if error is not None:
-            tracebacks.append(error)
       bg.join()
 
     # Propagate any exceptions.
@@ -241,8 +489,8 @@ def RunParallelSteps(steps, max_parallel=None, halt_on_error=False):
 
   This function blocks until all steps are completed.
 
-  The output from the functions is saved to a temporary file and printed as if
-  they were run in sequence.
+  The output from the functions is buffered in the background and printed as
+  if they were run in sequence.
 
   If exceptions occur in the steps, we join together the tracebacks and print
   them after all parallel tasks have finished running. Further, a
@@ -319,7 +567,7 @@ def BackgroundTaskRunner(task, queue=None, processes=None, onexit=None):
   wait for input on the specified queue. These workers run task(*input) for
   each input on the queue.
 
-  The output from these tasks is saved to a temporary file. When control
+  The output from these tasks is buffered in the background. When control
   returns to the context manager, the background output is printed in order,
   as if the tasks were run in sequence.
 
@@ -370,7 +618,7 @@ def RunTasksInProcessPool(task, inputs, processes=None, onexit=None):
   This function runs task(*x) for x in inputs in a pool of processes. This
   function blocks until all tasks are completed.
 
-  The output from these tasks is saved to a temporary file. When control
+  The output from these tasks is buffered in the background. When control
   returns to the context manager, the background output is printed in order,
   as if the tasks were run in sequence.
 
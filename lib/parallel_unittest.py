@@ -4,8 +4,11 @@
 # found in the LICENSE file.
 
 import contextlib
+import functools
 import multiprocessing
 import os
+import signal
+import subprocess
 import sys
 import tempfile
 import time
@@ -80,10 +83,6 @@ class TestBackgroundWrapper(cros_test_lib.TestCase):
     self.tempfile = None
 
   def wrapOutputTest(self, func):
-    # Set _PRINT_INTERVAL to a smaller number to make it easier to
-    # reproduce bugs.
-    old_print_interval = parallel._PRINT_INTERVAL
-    parallel._PRINT_INTERVAL = 0.01
     with tempfile.NamedTemporaryFile(bufsize=0) as output:
       old_stdout = sys.stdout
       with open(output.name, 'r', 0) as tmp:
@@ -92,7 +91,6 @@ class TestBackgroundWrapper(cros_test_lib.TestCase):
           sys.stdout = output
           func()
         finally:
-          parallel._PRINT_INTERVAL = old_print_interval
           sys.stdout = old_stdout
         tmp.seek(0)
         return tmp.read()
@@ -107,14 +105,13 @@ class TestHelloWorld(TestBackgroundWrapper):
     """Write 'hello world' to stdout."""
     sys.stdout.write('hello')
     sys.stdout.flush()
-    sys.stdout.seek(0)
     self.printed_hello.set()
 
-    # Wait for the parent process to read the output. Once the output
-    # has been read, try writing 'hello world' again, to be sure that
-    # rewritten output is not read twice.
-    time.sleep(parallel._PRINT_INTERVAL * 10)
-    sys.stdout.write(_GREETING)
+    # Give the parent process a chance to print the output. Once the output
+    # has been printed, write the rest of the greeting, to be sure that
+    # output is not printed twice.
+    time.sleep(0.1)
+    sys.stdout.write(_GREETING[len('hello'):])
     sys.stdout.flush()
 
   def _ParallelHelloWorld(self):
@@ -131,7 +128,7 @@ class TestHelloWorld(TestBackgroundWrapper):
       self.printed_hello.wait()
 
   def testParallelHelloWorld(self):
-    """Test that output is not written multiple times when seeking."""
+    """Test that output is not written multiple times."""
     out = self.wrapOutputTest(self._ParallelHelloWorld)
     self.assertEquals(out, _GREETING)
 
@@ -157,6 +154,146 @@ class TestFastPrinting(TestBackgroundWrapper):
     self.assertEquals(len(out), _TOTAL_BYTES)
 
 
+class _EventWriter(object):
+  """File-like object that sets |event| when |text| is written to it."""
+
+  def __init__(self, text, event):
+    self.text = text
+    self.event = event
+    self.written = []
+
+  def write(self, data):
+    self.written.append(data)
+    if self.text in ''.join(self.written):
+      self.event.set()
+
+  def flush(self):
+    pass
+
+
+class TestOutputStreaming(TestBackgroundWrapper):
+  """Test how output is carried from the steps to the parent."""
+
+  def _Step(self, i):
+    sys.stdout.write('step %d\n' % i)
+
+  def testManyShortSteps(self):
+    """Verify that output of many short steps is printed in order."""
+    steps = [functools.partial(self._Step, i) for i in xrange(500)]
+    start = time.time()
+    out = self.wrapOutputTest(lambda: parallel.RunParallelSteps(steps))
+    self.assertEquals(out, ''.join('step %d\n' % i for i in xrange(500)))
+    # Printing used to wait up to a second per step; now it waits on the pipes.
+    self.assertTrue(time.time() - start < 60)
+
+  def testLiveOutput(self):
+    """Verify that output is printed while the step is still running."""
+    printed = multiprocessing.Event()
+
+    def _Step():
+      sys.stdout.write('ping')
+      sys.stdout.flush()
+      if not printed.wait(30):
+        raise AssertionError('Output was not printed while step was running')
+
+    old_stdout = sys.stdout
+    sys.stdout = writer = _EventWriter('ping', printed)
+    try:
+      parallel.RunParallelSteps([_Step])
+    finally:
+      sys.stdout = old_stdout
+    self.assertEquals(''.join(writer.written), 'ping')
+
+  def testCrashedStep(self):
+    """Verify that a step that dies without reporting back is an error."""
+    def _Step():
+      sys.stdout.write(_GREETING)
+      sys.stdout.flush()
+      os._exit(1)
+
+    self.assertRaises(parallel.BackgroundFailure, self.wrapOutputTest,
+                      lambda: parallel.RunParallelSteps([_Step]))
+
+  def testLingeringProcess(self):
+    """Verify that processes left behind by a step do not block the parent."""
+    pids = multiprocessing.Queue()
+
+    def _Step():
+      pids.put(subprocess.Popen(['sleep', '60']).pid)
+      sys.stdout.write(_GREETING)
+
+    start = time.time()
+    try:
+      out = self.wrapOutputTest(lambda: parallel.RunParallelSteps([_Step]))
+    finally:
+      os.kill(pids.get(), signal.SIGKILL)
+    self.assertEquals(out, _GREETING)
+    self.assertTrue(time.time() - start < 30)
+
+
+class TestMaxParallel(TestBackgroundWrapper):
+  """Test running steps with a bounded number of processes."""
+
+  def setUp(self):
+    self.pids = multiprocessing.Queue()
+
+  def _Step(self, i):
+    self.pids.put(os.getpid())
+    sys.stdout.write('step %d\n' % i)
+
+  def _Fail(self):
+    raise ValueError('failed')
+
+  def testReusesProcesses(self):
+    """Verify that steps are run in turn by max_parallel processes."""
+    steps = [functools.partial(self._Step, i) for i in xrange(1000)]
+    out = self.wrapOutputTest(
+        lambda: parallel.RunParallelSteps(steps, max_parallel=4))
+    self.assertEquals(out, ''.join('step %d\n' % i for i in xrange(1000)))
+    pids = set(self.pids.get() for _ in xrange(1000))
+    self.assertTrue(len(pids) <= 4)
+
+  def testFailure(self):
+    """Verify that a failed step does not stop the other steps."""
+    steps = [functools.partial(self._Step, i) for i in xrange(10)]
+    steps.insert(5, self._Fail)
+    self.assertRaises(parallel.BackgroundFailure, self.wrapOutputTest,
+                      lambda: parallel.RunParallelSteps(steps, max_parallel=2))
+    # All of the other steps still ran.
+    for _ in xrange(10):
+      self.pids.get(True, 10)
+
+  def _Exit(self):
+    sys.exit(1)
+
+  def testSystemExit(self):
+    """Verify that steps after a SystemExit are skipped, not waited for."""
+    steps = [self._Exit] + [functools.partial(self._Step, i) for i in xrange(3)]
+    start = time.time()
+    with cros_test_lib.OutputCapturer():
+      self.assertRaises(parallel.BackgroundFailure,
+                        parallel.RunParallelSteps, steps, max_parallel=1)
+    self.assertTrue(time.time() - start < 30)
+    self.assertTrue(self.pids.empty())
+
+  def testHaltOnError(self):
+    """Verify that halt_on_error stops workers from starting more steps."""
+    def _Sleep():
+      self.pids.put(os.getpid())
+      time.sleep(1)
+    steps = [self._Fail] + [_Sleep] * 20
+    start = time.time()
+    with cros_test_lib.OutputCapturer():
+      self.assertRaises(parallel.BackgroundFailure, parallel.RunParallelSteps,
+                        steps, max_parallel=2, halt_on_error=True)
+    self.assertTrue(time.time() - start < 10)
+    started = 0
+    while not self.pids.empty():
+      self.pids.get()
+      started += 1
+    self.assertTrue(started < 5)
+
+
 class TestParallelMock(cros_test_lib.TestCase):
   """Test the ParallelMock class."""
 
@@ -973,6 +973,19 @@ class LocalPatch(GitRepoPatch):
 
     return new_sha1
 
+  def GetUploadRefspec(self, remote_ref, carbon_copy=True):
+    """Return the refspec that pushes this patch to |remote_ref|.
+
+    Arguments:
+      remote_ref: The ref on the remote host to push to.
+      carbon_copy: Use a carbon_copy of the local commit.
+    """
+    if carbon_copy:
+      ref_to_upload = self._GetCarbonCopy()
+    else:
+      ref_to_upload = self.sha1
+    return '%s:%s' % (ref_to_upload, remote_ref)
+
   def Upload(self, push_url, remote_ref, carbon_copy=True, dryrun=False,
              reviewers=(), cc=()):
     """Upload the patch to a remote git branch.
@@ -987,11 +1000,6 @@ class LocalPatch(GitRepoPatch):
     Returns:
       A list of gerrit URLs found in the output
     """
-    if carbon_copy:
-      ref_to_upload = self._GetCarbonCopy()
-    else:
-      ref_to_upload = self.sha1
-
     cmd = ['push']
     if reviewers or cc:
       pack = '--receive-pack=git receive-pack '
@@ -1000,7 +1008,7 @@ class LocalPatch(GitRepoPatch):
       if cc:
         pack += ' '.join(['--cc=' + x for x in cc])
       cmd.append(pack)
-    cmd += [push_url, '%s:%s' % (ref_to_upload, remote_ref)]
+    cmd += [push_url, self.GetUploadRefspec(remote_ref, carbon_copy)]
     if dryrun:
       cmd.append('--dry-run')
 
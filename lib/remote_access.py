@@ -26,6 +26,11 @@ REBOOT_SSH_CONNECT_ATTEMPTS = 2
 CHECK_INTERVAL = 5
 DEFAULT_SSH_PORT = 22
 SSH_ERROR_CODE = 255
+# How long the shared ssh connection lingers once it is no longer used.
+CONTROL_PERSIST = 60
+# Unix socket paths are limited to 108 bytes, and ssh appends a random suffix
+# to the control path while it sets the socket up.
+CONTROL_PATH_MAX = 80
 
 
 def CompileSSHConnectSettings(ConnectTimeout=30, ConnectionAttempts=4):
@@ -61,6 +66,17 @@ class RemoteAccess(object):
     self.private_key = os.path.join(tempdir, os.path.basename(TEST_PRIVATE_KEY))
     shutil.copyfile(TEST_PRIVATE_KEY, self.private_key)
     os.chmod(self.private_key, stat.S_IRUSR)
+    # All ssh invocations share a single connection through this socket; the
+    # first one to run sets it up.
+    self.control_path = os.path.join(tempdir, 'ssh-control')
+    if len(self.control_path) > CONTROL_PATH_MAX:
+      self.control_path = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, _type, _value, _traceback):
+    self.Close()
 
   @property
   def target_ssh_url(self):
@@ -70,10 +86,28 @@ class RemoteAccess(object):
     if connect_settings is None:
       connect_settings = CompileSSHConnectSettings()
 
+    control_settings = []
+    if self.control_path:
+      control_settings = [
+          '-o', 'ControlMaster=auto',
+          '-o', 'ControlPath=%s' % self.control_path.replace('%', '%%'),
+          '-o', 'ControlPersist=%d' % CONTROL_PERSIST]
+
     return (['ssh', '-p', str(self.port)] +
-             connect_settings +
+             connect_settings + control_settings +
              ['-i', self.private_key, ])
 
+  def Close(self):
+    """Shut down the shared ssh connection to the device, if there is one.
+
+    Later commands will set up a new one as needed.
+    """
+    if self.control_path and os.path.exists(self.control_path):
+      cros_build_lib.RunCommand(
+          self._GetSSHCmd() + ['-O', 'exit', self.target_ssh_url],
+          print_cmd=False, redirect_stdout=True, combine_stdout_stderr=True,
+          error_code_ok=True, debug_level=self.debug_level)
+
   def RemoteSh(self, cmd, connect_settings=None, error_code_ok=False,
                ssh_error_ok=False, debug_level=None):
     """Run a sh command on the remote device through ssh.
@@ -114,6 +148,56 @@ class RemoteAccess(object):
 
     return result
 
+  def RemoteShBatch(self, cmds, error_code_ok=False, ssh_error_ok=False,
+                    debug_level=None):
+    """Run several sh commands on the remote device through a single ssh.
+
+    The commands run in order, each in its own subshell with stdin from
+    /dev/null.  Unless error_code_ok is set, the batch stops at the first
+    command that fails.
+
+    Arguments:
+      cmds: List of command strings to run.
+      error_code_ok: See RemoteSh.
+      ssh_error_ok: See RemoteSh.  If set, the results of the commands that
+                    completed before ssh failed are returned.
+      debug_level:  See cros_build_lib.RunCommand documentation.
+
+    Returns:
+      A list with a CommandResult object for each command that ran.
+
+    Raises:  RunCommandError for the first failing command, or for ssh itself,
+             when the error is not ignored through error_code_ok and
+             ssh_error_ok flags.
+    """
+    boundary = 'remote-sh-batch-%s' % os.urandom(8).encode('hex')
+    script = []
+    for cmd in cmds:
+      script.append('(%s\n) </dev/null; rc=$?' % cmd)
+      script.append('echo; echo "%s $rc"; echo >&2; echo "%s" >&2'
+                    % (boundary, boundary))
+      if not error_code_ok:
+        script.append('[ $rc -eq 0 ] || exit 0')
+    script.append('exit 0')
+    result = self.RemoteSh('\n'.join(script), ssh_error_ok=ssh_error_ok,
+                           debug_level=debug_level)
+
+    results = []
+    outputs = result.output.split('\n%s ' % boundary)
+    errors = result.error.split('\n%s\n' % boundary)
+    for i, cmd in enumerate(cmds[:len(outputs) - 1]):
+      returncode, _, outputs[i + 1] = outputs[i + 1].partition('\n')
+      results.append(cros_build_lib.CommandResult(
+          cmd=cmd, output=outputs[i], error=errors[i],
+          returncode=int(returncode)))
+
+    for cmd_result in results:
+      if cmd_result.returncode and not error_code_ok:
+        raise cros_build_lib.RunCommandError(
+            'Failed remote command "%s" in batch' % cmd_result.cmd, cmd_result)
+
+    return results
+
   def LearnBoard(self):
     """Grab the board reported by the remote device.
 
@@ -161,6 +245,8 @@ class RemoteAccess(object):
     """Reboot the remote device."""
     logging.info('Rebooting %s...', self.remote_host)
     self.RemoteSh('touch %s && reboot' % REBOOT_MARKER)
+    # The shared connection will not survive the reboot.
+    self.Close()
     time.sleep(CHECK_INTERVAL)
     try:
       cros_build_lib.WaitForCondition(self._CheckIfRebooted, CHECK_INTERVAL,
@@ -6,13 +6,18 @@
 
 import os
 import re
+import socket
+import subprocess
 import sys
+import time
+import unittest
 
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                 '..', '..'))
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_build_lib_unittest
 from chromite.lib import cros_test_lib
+from chromite.lib import osutils
 from chromite.lib import partial_mock
 from chromite.lib import remote_access
 
@@ -88,6 +93,135 @@ class RemoteShTest(RemoteAccessTest):
     self.host.RemoteSh(self.TEST_CMD, ssh_error_ok=True, error_code_ok=True)
 
 
+class ControlMasterTest(cros_build_lib_unittest.RunCommandTempDirTestCase):
+  """Tests for the shared ssh connection."""
+
+  def setUp(self):
+    self.host = remote_access.RemoteAccess('foon', self.tempdir)
+
+  def testSSHCmd(self):
+    """Test that ssh commands share a connection through the tempdir."""
+    ssh_cmd = self.host._GetSSHCmd()
+    self.assertTrue('ControlMaster=auto' in ssh_cmd)
+    self.assertTrue('ControlPath=%s' % os.path.join(self.tempdir, 'ssh-control')
+                    in ssh_cmd)
+
+  def testLongTempDir(self):
+    """Test that connections are not shared if the socket path is too long."""
+    tempdir = os.path.join(self.tempdir, 'x' * remote_access.CONTROL_PATH_MAX)
+    osutils.SafeMakedirs(tempdir)
+    host = remote_access.RemoteAccess('foon', tempdir)
+    self.assertFalse('ControlMaster=auto' in host._GetSSHCmd())
+
+  def testClose(self):
+    """Test that Close only shuts down a connection that is up."""
+    self.host.Close()
+    self.assertCommandContains(['-O', 'exit'], expected=False)
+
+    osutils.Touch(self.host.control_path)
+    with self.host:
+      pass
+    self.assertCommandContains(['-O', 'exit', 'root@foon'])
+
+
+class RemoteShBatchTest(cros_test_lib.MockTempDirTestCase):
+  """Tests for RemoteShBatch, with commands run by a local shell."""
+
+  def setUp(self):
+    self.host = remote_access.RemoteAccess('foon', self.tempdir)
+    self.PatchObject(self.host, '_GetSSHCmd',
+                     return_value=['sh', '-c', 'exec sh -c "$2"', 'ssh'])
+
+  def testResults(self):
+    """Test that each command gets its own output and return code."""
+    results = self.host.RemoteShBatch(
+        ['echo foo; echo bar >&2', 'printf baz', 'true', 'exit 3'],
+        error_code_ok=True)
+    self.assertEqual([r.output for r in results], ['foo\n', 'baz', '', ''])
+    self.assertEqual([r.error for r in results], ['bar\n', '', '', ''])
+    self.assertEqual([r.returncode for r in results], [0, 0, 0, 3])
+    self.assertEqual(results[1].cmd, 'printf baz')
+
+  def testStopOnFailure(self):
+    """Test that the batch stops at the first failing command."""
+    try:
+      self.host.RemoteShBatch(['true', 'echo failed; false', 'echo not run'])
+    except cros_build_lib.RunCommandError as e:
+      self.assertEqual(e.result.returncode, 1)
+      self.assertEqual(e.result.output, 'failed\n')
+    else:
+      self.fail('RemoteShBatch did not raise')
+
+
+def _FindSshd():
+  """Return the path to sshd, or None if it is not installed."""
+  return osutils.Which('sshd', path='/usr/sbin:/usr/local/sbin:/sbin')
+
+
+@unittest.skipUnless(_FindSshd() and os.getuid() == 0,
+                     'needs sshd, and root to log into it as root')
+class LocalSshdTest(cros_test_lib.TempDirTestCase):
+  """Tests RemoteAccess against an sshd running out of the tempdir."""
+
+  def setUp(self):
+    host_key = os.path.join(self.tempdir, 'host_key')
+    cros_build_lib.RunCommand(
+        ['ssh-keygen', '-q', '-t', 'rsa', '-N', '', '-f', host_key],
+        print_cmd=False)
+    authorized_keys = os.path.join(self.tempdir, 'authorized_keys')
+    osutils.WriteFile(authorized_keys,
+                      osutils.ReadFile(remote_access.TEST_PRIVATE_KEY + '.pub'))
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    self.port = sock.getsockname()[1]
+    sock.close()
+
+    config = os.path.join(self.tempdir, 'sshd_config')
+    osutils.WriteFile(config, '\n'.join([
+        'ListenAddress 127.0.0.1:%d' % self.port,
+        'HostKey %s' % host_key,
+        'AuthorizedKeysFile %s' % authorized_keys,
+        'PidFile %s' % os.path.join(self.tempdir, 'sshd.pid'),
+        'PermitRootLogin yes',
+        'StrictModes no',
+        'UsePAM no',
+    ]))
+    self.sshd = subprocess.Popen([_FindSshd(), '-D', '-e', '-f', config],
+                                 stderr=open(os.devnull, 'w'))
+    for _ in range(100):
+      try:
+        socket.create_connection(('127.0.0.1', self.port)).close()
+        break
+      except socket.error:
+        time.sleep(0.1)
+
+    self.host = remote_access.RemoteAccess('127.0.0.1', self.tempdir,
+                                           port=self.port)
+
+  def tearDown(self):
+    self.host.Close()
+    self.sshd.terminate()
+    self.sshd.wait()
+
+  def testSharedConnection(self):
+    """Test that commands share one connection, which Close shuts down."""
+    for i in range(5):
+      result = self.host.RemoteSh('echo %d' % i)
+      self.assertEqual(result.output.strip(), str(i))
+    self.assertTrue(os.path.exists(self.host.control_path))
+    self.host.Close()
+    self.assertFalse(os.path.exists(self.host.control_path))
+
+  def testBatch(self):
+    """Test running a batch of commands on the device."""
+    results = self.host.RemoteShBatch(['echo foo', 'echo bar >&2; exit 2'],
+                                      error_code_ok=True)
+    self.assertEqual([r.output for r in results], ['foo\n', ''])
+    self.assertTrue(results[1].error.endswith('bar\n'))
+    self.assertEqual([r.returncode for r in results], [0, 2])
+
+
 class CheckIfRebootedTest(RemoteAccessTest):
 
   def MockCheckReboot(self, returncode):
@@ -882,6 +882,11 @@ def _CreateParser():
                         'use the repo root.')
   group.add_option('--resume', action='store_true', default=False,
                    help='Skip stages already successfully completed.')
+  group.add_option('--status-channel', default=None, dest='status_channel',
+                   help='Status service url or shared directory that builders '
+                        'publish their statuses to, so that masters can be '
+                        'notified of completed slaves without waiting for '
+                        'the next Google Storage poll.')
   group.add_remote_option('--timeout', action='store', type='int', default=0,
                           help='Specify the maximum amount of time this job '
                                'can run for, at which point the build will be '
@@ -6,25 +6,47 @@ from chromite.cros import commands
 from chromite.lib import commandline
 
 
+class _LazySubParsersAction(commandline.argparse._SubParsersAction):
+  """Subparsers action that imports a command only once it is selected.
+
+  Every command gets an empty sub-parser up front so that `cros --help` can
+  list them; the arguments of the selected command are added just before its
+  sub-parser runs.
+  """
+
+  def __call__(self, parser, namespace, values, option_string=None):
+    sub_parser = self._name_parser_map.get(values[0])
+    if sub_parser is not None and not sub_parser.get_default('cros_class'):
+      class_def = commands.ImportCommand(values[0])
+      sub_parser.description = class_def.__doc__
+      sub_parser.epilog = getattr(class_def, 'EPILOG', None)
+      class_def.AddParser(sub_parser)
+    super(_LazySubParsersAction, self).__call__(
+        parser, namespace, values, option_string=option_string)
+
+
 def GetOptions(my_commands):
-  """Returns the argparse to use for Cros."""
+  """Returns the argparse to use for Cros.
+
+  Args:
+    my_commands: List of command names to add sub-parsers for.
+  """
   parser = commandline.ArgumentParser(caching=True)
-  if not commands:
+  if not my_commands:
     return parser
 
+  parser.register('action', 'parsers', _LazySubParsersAction)
   subparsers = parser.add_subparsers(title='cros commands')
-  for cmd_name, class_def in sorted(my_commands.iteritems(), key=lambda x:x[0]):
-    epilog = getattr(class_def, 'EPILOG', None)
-    sub_parser = subparsers.add_parser(
-        cmd_name, description=class_def.__doc__, epilog=epilog,
+  for cmd_name in sorted(my_commands):
+    subparsers.add_parser(
+        cmd_name,
         formatter_class=commandline.argparse.RawDescriptionHelpFormatter)
-    class_def.AddParser(sub_parser)
 
   return parser
 
 
 def main(args):
-  parser = GetOptions(commands.ListCommands())
+  parser = GetOptions(commands.ListCommandNames())
   # Cros currently does nothing without a subcmd. Print help if no args are
   # specified.
   if not args:
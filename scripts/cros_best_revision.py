@@ -8,8 +8,11 @@
 checks in a LKGM version for Chrome OS for other consumers.
 """
 
+import cPickle
 import distutils.version
+import functools
 import logging
+import multiprocessing
 import os
 import shutil
 import tempfile
@@ -21,6 +24,7 @@ from chromite.lib import cros_build_lib
 from chromite.lib import gclient
 from chromite.lib import gs
 from chromite.lib import osutils
+from chromite.lib import parallel
 
 
 class LKGMNotFound(Exception):
@@ -37,6 +41,8 @@ class ChromeCommitter(object):
   _COMMIT_MSG = ('Automated Commit: Committing new LKGM version %(version)s '
                  'for chromeos.')
   _CANDIDATES_TO_CONSIDER = 10
+  # Number of versions whose statuses are fetched at the same time.
+  _MAX_PARALLEL_FETCHES = 8
 
   _SLEEP_TIMEOUT = 30
   _TREE_TIMEOUT = 7200
@@ -79,6 +85,60 @@ class ChromeCommitter(object):
     return sorted(new_canary_versions, key=lv,
                   reverse=True)[0:self._CANDIDATES_TO_CONSIDER]
 
+  @staticmethod
+  def _FetchBuildStatuses(result_dir, best, index, version, canaries):
+    """Fetch the statuses of |version| and save them in |result_dir|.
+
+    The statuses are written to a file rather than sent back over a pipe, so
+    that a worker never waits on its parent to read them.
+
+    Args:
+      result_dir: Directory to write the pickled statuses to, in a file named
+        after |index|.
+      best: Shared index of the newest version known to have passed on all
+        canaries.  Older versions cannot win, so they are skipped.
+      index: Index of |version|; newer versions have lower indices.
+      version: Version string.
+      canaries: The canaries to get the statuses of.
+    """
+    if index > best.value:
+      return
+    statuses = manifest_version.BuildSpecsManager.GetBuildStatuses(
+        canaries, version, retries=0)
+    if all(status and status.Passed() for status in statuses.itervalues()):
+      with best.get_lock():
+        best.value = min(best.value, index)
+    osutils.WriteFile(os.path.join(result_dir, str(index)),
+                      cPickle.dumps(statuses, cPickle.HIGHEST_PROTOCOL))
+
+  def _GetBuildStatuses(self, versions, canaries):
+    """Get the statuses of |canaries| for |versions|, newest first.
+
+    The statuses of several versions are fetched at once, and versions older
+    than one that passed on all canaries are not fetched at all.
+
+    Returns:
+      A dictionary mapping versions to dictionaries mapping canaries to
+      BuilderStatus instances, or None if there is no status yet.  Skipped
+      versions are left out.
+    """
+    best = multiprocessing.Value('i', len(versions))
+    results = {}
+    with osutils.TempDirContextManager() as tempdir:
+      # The counter is shared with the workers when they are forked; it cannot
+      # be passed along with the inputs.
+      task = functools.partial(self._FetchBuildStatuses, tempdir, best)
+      inputs = [(i, version, canaries) for i, version in enumerate(versions)]
+      parallel.RunTasksInProcessPool(
+          task, inputs, processes=min(len(inputs), self._MAX_PARALLEL_FETCHES))
+
+      for i, version in enumerate(versions):
+        path = os.path.join(tempdir, str(i))
+        if os.path.exists(path):
+          with open(path) as f:
+            results[version] = cPickle.load(f)
+    return results
+
   def FindNewLKGM(self):
     """Finds a new LKGM for chrome from previous chromeos releases."""
     versions = self._GetLatestCanaryVersions()
@@ -91,11 +151,14 @@ class ChromeCommitter(object):
                  ' '.join(canaries))
 
     # Scores are based on passing builders.
+    all_statuses = self._GetBuildStatuses(versions, canaries)
     version_scores = {}
     for version in versions:
+      if version not in all_statuses:
+        logging.info('Skipped version %s, a newer version passed', version)
+        continue
       for builder in canaries:
-        status = manifest_version.BuildSpecsManager.GetBuildStatus(
-            builder, version, retries=0)
+        status = all_statuses[version][builder]
         if status:
           if status.Passed():
             version_scores[version] = version_scores.get(version, 0) + 1
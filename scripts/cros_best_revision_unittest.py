@@ -6,6 +6,7 @@
 
 """Unit tests for the cros_best_revision program."""
 
+import cPickle
 import os
 import sys
 
@@ -19,6 +20,7 @@ from chromite.lib import cros_build_lib
 from chromite.lib import cros_build_lib_unittest
 from chromite.lib import cros_test_lib
 from chromite.lib import gclient
+from chromite.lib import gs
 from chromite.lib import gs_unittest
 from chromite.lib import osutils
 from chromite.lib import partial_mock
@@ -56,6 +58,58 @@ class ChromeGSTest(BaseChromeCommitterTest):
     self.assertEqual(versions, expected_output)
 
 
+class ChromeStatusTest(BaseChromeCommitterTest):
+  """Tests fetching statuses from a local stand-in for Google Storage."""
+
+  canaries = ['a-release', 'b-release']
+  versions = ['5.0.0', '4.0.0', '3.0.0']
+
+  def setUp(self):
+    self.local_gs = gs_unittest.LocalGSUtil(self.tempdir)
+    self.PatchObject(gs, 'GSUTIL_BIN', self.local_gs.gsutil_bin)
+
+  def _WriteStatuses(self, version, statuses, message=None):
+    for canary, status in zip(self.canaries, statuses):
+      if status is not None:
+        url = manifest_version.BuildSpecsManager._GetStatusUrl(canary, version)
+        self.local_gs.WriteObject(
+            url, cPickle.dumps(dict(status=status, message=message)))
+
+  def testFindNewLKGM(self):
+    """Tests scoring versions with statuses fetched in parallel."""
+    passed = manifest_version.BuilderStatus.STATUS_PASSED
+    failed = manifest_version.BuilderStatus.STATUS_FAILED
+    self._WriteStatuses('5.0.0', [passed, failed])
+    self._WriteStatuses('4.0.0', [passed, None])
+    self.PatchObject(self.committer, '_GetLatestCanaryVersions',
+                     return_value=self.versions)
+    self.PatchObject(cbuildbot_config, 'GetCanariesForChromeLKGM',
+                     return_value=self.canaries)
+    self.committer.FindNewLKGM()
+    self.assertEqual(self.committer._lkgm, '4.0.0')
+
+  def testSkipOlderVersions(self):
+    """Tests that versions older than one that passed are not fetched."""
+    passed = manifest_version.BuilderStatus.STATUS_PASSED
+    for version in self.versions:
+      self._WriteStatuses(version, [passed, passed])
+    self.PatchObject(cros_best_revision.ChromeCommitter,
+                     '_MAX_PARALLEL_FETCHES', 1)
+    statuses = self.committer._GetBuildStatuses(self.versions, self.canaries)
+    self.assertEqual(statuses.keys(), ['5.0.0'])
+    self.assertTrue(statuses['5.0.0']['b-release'].Passed())
+
+  def testLargeStatuses(self):
+    """Tests that statuses larger than a pipe buffer do not block workers."""
+    failed = manifest_version.BuilderStatus.STATUS_FAILED
+    message = 'x' * 100000
+    for version in self.versions:
+      self._WriteStatuses(version, [failed, failed], message=message)
+    statuses = self.committer._GetBuildStatuses(self.versions, self.canaries)
+    self.assertEqual(sorted(statuses), sorted(self.versions))
+    self.assertEqual(statuses['3.0.0']['a-release'].message, message)
+
+
 class ChromeCommitterTester(cros_build_lib_unittest.RunCommandTestCase,
                             BaseChromeCommitterTest):
 
@@ -80,14 +134,14 @@ class ChromeCommitterTester(cros_build_lib_unittest.RunCommandTestCase,
     for canary, results in zip(self.canaries, all_results):
       for version, status in zip(self.versions, results):
         expected[(canary, version)] = status
-    def _GetBuildStatus(canary, version, **_):
-      return expected[(canary, version)]
+    def _GetBuildStatuses(canaries, version, **_):
+      return dict((c, expected[(c, version)]) for c in canaries)
     self.PatchObject(self.committer, '_GetLatestCanaryVersions',
                      return_value=self.versions)
     self.PatchObject(cbuildbot_config, 'GetCanariesForChromeLKGM',
                      return_value=self.canaries)
-    self.PatchObject(manifest_version.BuildSpecsManager, 'GetBuildStatus',
-                     side_effect=_GetBuildStatus)
+    self.PatchObject(manifest_version.BuildSpecsManager, 'GetBuildStatuses',
+                     side_effect=_GetBuildStatuses)
     self.committer.FindNewLKGM()
     self.assertTrue(self.committer._lkgm, lkgm)
 
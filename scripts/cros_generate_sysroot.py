@@ -8,7 +8,12 @@
 Meant for use after setup_board and build_packages have been run.
 """
 
+import contextlib
+import errno
 import os
+import Queue
+import threading
+import time
 
 from chromite.buildbot import constants
 from chromite.lib import cros_build_lib
@@ -43,6 +48,92 @@ def ParseCommandLine(argv):
   return options
 
 
+class TarballStream(object):
+  """Writes a compressed tarball of entries given to it while it runs.
+
+  tar runs in the background and reads the names of the entries to archive
+  from a pipe, so that the entries that are already known get compressed
+  while the rest of the tree is still being installed.  Entries are not
+  recursed into; every directory and file has to be added explicitly.
+  """
+
+  def __init__(self, target, cwd):
+    """Initialize.
+
+    Arguments:
+      target: The path of the tarball to write.
+      cwd: The directory the names of the entries are relative to.
+    """
+    self._target = target
+    self._cwd = cwd
+    self._names = Queue.Queue()
+    self._error = None
+    self._read_fd, self._write_fd = os.pipe()
+    self._threads = [threading.Thread(target=self._Archive),
+                     threading.Thread(target=self._Feed)]
+    for thread in self._threads:
+      thread.daemon = True
+      thread.start()
+
+  def _Archive(self):
+    try:
+      cros_build_lib.CreateTarball(
+          self._target, self._cwd, sudo=True, inputs=[],
+          extra_args=['--no-recursion', '--null', '-T', '-'],
+          input=self._read_fd)
+    except Exception as e:
+      self._error = e
+    finally:
+      os.close(self._read_fd)
+
+  def _Feed(self):
+    try:
+      while True:
+        names = self._names.get()
+        if names is None:
+          break
+        data = ''.join('%s\0' % name for name in names)
+        while data:
+          data = data[os.write(self._write_fd, data):]
+    except OSError as e:
+      # tar went away; _Archive has the reason.
+      if e.errno != errno.EPIPE:
+        raise
+    finally:
+      os.close(self._write_fd)
+
+  def Add(self, names):
+    """Queue |names| to be added to the tarball, in order."""
+    self._names.put(list(names))
+
+  def _Wait(self):
+    self._names.put(None)
+    for thread in self._threads:
+      thread.join()
+
+  def Abort(self):
+    """Stop adding entries, and wait for tar to exit, ignoring its errors."""
+    self._Wait()
+
+  def Finish(self, changed_ok=False):
+    """Wait for all the queued entries to be written.
+
+    Arguments:
+      changed_ok: Whether to ignore files that changed while tar read them.
+        Only set this when those files were added again afterwards.
+
+    Raises:
+      RunCommandError if tar failed.
+    """
+    self._Wait()
+    if self._error is not None:
+      # tar exits with 1 when a file changed while it was being archived.
+      if not (changed_ok and isinstance(self._error,
+                                        cros_build_lib.RunCommandError) and
+              self._error.result.returncode == 1):
+        raise self._error
+
+
 class GenerateSysroot(object):
   """Wrapper for generation functionality."""
 
@@ -57,6 +148,19 @@ class GenerateSysroot(object):
     """
     self.sysroot = sysroot
     self.options = options
+    self.timings = []
+
+  @contextlib.contextmanager
+  def _Phase(self, name):
+    """Time the code run in this context as the phase |name|."""
+    cros_build_lib.Info('Starting phase: %s', name)
+    start = time.time()
+    try:
+      yield
+    finally:
+      elapsed = time.time() - start
+      self.timings.append((name, elapsed))
+      cros_build_lib.Info('Finished phase: %s (%.1fs)', name, elapsed)
 
   def _InstallToolchain(self):
     cros_build_lib.RunCommand(
@@ -76,16 +180,99 @@ class GenerateSysroot(object):
          '--root=%s' % self.sysroot, '--usepkg', '--onlydeps',
          '--usepkg-exclude=%s' % self.options.package, self.options.package])
 
+  def _ListSysroot(self):
+    """Return a list of (path, ctime, is_dir, attrs) for the sysroot entries.
+
+    The paths are relative to the sysroot, in the order find walks them,
+    which puts every directory before its contents.  |attrs| holds the
+    permissions and owners of the entry.
+    """
+    result = cros_build_lib.SudoRunCommand(
+        ['find', '.', '-printf', r'%C@ %y %m:%U:%G %p\0'], cwd=self.sysroot,
+        redirect_stdout=True, print_cmd=False)
+    entries = []
+    for line in result.output.split('\0')[:-1]:
+      ctime, kind, attrs, path = line.split(' ', 3)
+      entries.append((path, ctime, kind == 'd', attrs))
+    return entries
+
   def _CreateTarball(self):
     target = os.path.join(self.options.out_dir, self.options.out_file)
     cros_build_lib.CreateTarball(target, self.sysroot, sudo=True)
 
+  def _InstallAndArchive(self):
+    """Install the build dependencies while archiving what is already there.
+
+    The entries installed so far are streamed into the tarball while the
+    build dependencies are installed.  Afterwards, the entries that are new
+    or changed, and the directories whose permissions or owners changed, are
+    appended; tar extracts the last copy of an entry, so the changed files
+    replace the ones streamed earlier.  If an installed entry went away or
+    changed between a directory and a file, the streamed tarball would not
+    match the sysroot, so it is created again from scratch.
+    """
+    target = os.path.join(self.options.out_dir, self.options.out_file)
+    before = self._ListSysroot()
+    stream = TarballStream(target, self.sysroot)
+    try:
+      stream.Add(entry[0] for entry in before)
+      with self._Phase('build dependencies'):
+        self._InstallBuildDependencies()
+      with self._Phase('sysroot scan'):
+        after = self._ListSysroot()
+        old = dict((entry[0], entry[1:]) for entry in before)
+        current = set(entry[0] for entry in after)
+        rebuild = any(path not in current for path in old)
+        changed = False
+        new = []
+        for path, ctime, is_dir, attrs in after:
+          if path not in old:
+            new.append(path)
+            continue
+          old_ctime, was_dir, old_attrs = old[path]
+          if ctime == old_ctime:
+            continue
+          if is_dir != was_dir:
+            rebuild = True
+          elif not is_dir:
+            new.append(path)
+            changed = True
+          elif attrs != old_attrs:
+            # Adding entries to a directory changes its ctime, but only
+            # changes to its permissions need to make it to the tarball.
+            new.append(path)
+        if not rebuild:
+          stream.Add(new)
+    except BaseException:
+      stream.Abort()
+      osutils.SafeUnlink(target, sudo=True)
+      raise
+    if rebuild:
+      # tar may have failed on the entries that went away; start over.
+      cros_build_lib.Info('Installed files went away; creating the tarball '
+                          'again.')
+      stream.Abort()
+      with self._Phase('tarball rebuild'):
+        self._CreateTarball()
+    else:
+      with self._Phase('tarball'):
+        stream.Finish(changed_ok=changed)
+
   def Perform(self):
-    """Generate the sysroot."""
-    self._InstallToolchain()
-    self._InstallKernelHeaders()
-    self._InstallBuildDependencies()
-    self._CreateTarball()
+    """Generate the sysroot.
+
+    The build dependencies are installed while the toolchain and the kernel
+    headers are being compressed.  The toolchain and the kernel headers are
+    installed one after the other, as both write to the same root.
+    """
+    with self._Phase('toolchain'):
+      self._InstallToolchain()
+    with self._Phase('kernel headers'):
+      self._InstallKernelHeaders()
+    self._InstallAndArchive()
+    cros_build_lib.Info('Time spent per phase:')
+    for name, elapsed in self.timings:
+      cros_build_lib.Info('  %-30s %7.1fs', name, elapsed)
 
 
 def FinishParsing(options):
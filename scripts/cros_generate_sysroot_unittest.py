@@ -36,15 +36,31 @@ class CrosGenMock(partial_mock.PartialMock):
   def _InstallToolchain(self, inst):
     osutils.Touch(os.path.join(inst.sysroot, self.TOOLCHAIN))
 
-  def _InstallKernelHeaders(self, inst):
-    osutils.Touch(os.path.join(inst.sysroot, self.KERNEL_HEADERS))
+  def __init__(self):
+    partial_mock.PartialMock.__init__(self)
+    self.remove_toolchain = False
+    self.rewrite_toolchain = False
+    self.build_deps_error = None
 
   def _InstallBuildDependencies(self, inst):
+    if self.build_deps_error is not None:
+      raise self.build_deps_error
+    if self.remove_toolchain:
+      osutils.SafeUnlink(os.path.join(inst.sysroot, self.TOOLCHAIN))
+    if self.rewrite_toolchain:
+      osutils.WriteFile(os.path.join(inst.sysroot, self.TOOLCHAIN),
+                        self.TOOLCHAIN)
     osutils.Touch(os.path.join(inst.sysroot, self.BUILD_DEPS))
+    osutils.Touch(os.path.join(inst.sysroot, self.KERNEL_HEADERS, 'new'),
+                  makedirs=True)
+
+  def _InstallKernelHeaders(self, inst):
+    osutils.Touch(os.path.join(inst.sysroot, self.KERNEL_HEADERS, 'linux'),
+                  makedirs=True)
 
   def VerifyTarball(self, tarball):
-    dir_struct = [Dir('.', []), self.TOOLCHAIN, self.KERNEL_HEADERS,
-                  self.BUILD_DEPS]
+    dir_struct = [Dir('.', []), self.TOOLCHAIN,
+                  Dir(self.KERNEL_HEADERS, ['linux', 'new']), self.BUILD_DEPS]
     cros_test_lib.VerifyTarball(tarball, dir_struct)
 
 
@@ -66,6 +82,67 @@ class OverallTest(cros_test_lib.MockTempDirTestCase):
            '--out-file', TAR_NAME, '--package', constants.CHROME_CP])
       self.cg_mock.VerifyTarball(os.path.join(self.tempdir, TAR_NAME))
 
+  def _Generate(self):
+    options = cros_gen.ParseCommandLine(
+        ['--board', BOARD, '--out-dir', self.tempdir,
+         '--out-file', TAR_NAME, '--package', constants.CHROME_CP])
+    sysroot = os.path.join(self.tempdir, 'sysroot')
+    os.mkdir(sysroot)
+    gen = cros_gen.GenerateSysroot(sysroot, options)
+    gen.Perform()
+    return gen
+
+  def testStreamedTarball(self):
+    """Test that the tarball is streamed when nothing is overwritten."""
+    create = self.PatchObject(cros_build_lib, 'CreateTarball',
+                              side_effect=cros_build_lib.CreateTarball)
+    gen = self._Generate()
+    self.assertEqual(create.call_count, 1)
+    self.cg_mock.VerifyTarball(os.path.join(self.tempdir, TAR_NAME))
+    self.assertEqual(
+        [name for name, _ in gen.timings],
+        ['toolchain', 'kernel headers', 'build dependencies', 'sysroot scan',
+         'tarball'])
+
+  def testRewrittenFiles(self):
+    """Test that rewritten files are appended to the streamed tarball."""
+    self.cg_mock.rewrite_toolchain = True
+    create = self.PatchObject(cros_build_lib, 'CreateTarball',
+                              side_effect=cros_build_lib.CreateTarball)
+    gen = self._Generate()
+    self.assertEqual(create.call_count, 1)
+    self.assertEqual(gen.timings[-1][0], 'tarball')
+    extracted = os.path.join(self.tempdir, 'extracted')
+    os.mkdir(extracted)
+    cros_build_lib.RunCommand(
+        ['tar', '-xf', os.path.join(self.tempdir, TAR_NAME), '-C', extracted],
+        print_cmd=False)
+    cros_test_lib.VerifyOnDiskHierarchy(
+        extracted,
+        [CrosGenMock.TOOLCHAIN,
+         Dir(CrosGenMock.KERNEL_HEADERS, ['linux', 'new']),
+         CrosGenMock.BUILD_DEPS])
+    self.assertEqual(
+        osutils.ReadFile(os.path.join(extracted, CrosGenMock.TOOLCHAIN)),
+        CrosGenMock.TOOLCHAIN)
+
+  def testRemovedFiles(self):
+    """Test that the tarball is recreated when installed files go away."""
+    self.cg_mock.remove_toolchain = True
+    gen = self._Generate()
+    cros_test_lib.VerifyTarball(
+        os.path.join(self.tempdir, TAR_NAME),
+        [Dir('.', []), Dir(CrosGenMock.KERNEL_HEADERS, ['linux', 'new']),
+         CrosGenMock.BUILD_DEPS])
+    self.assertEqual(gen.timings[-1][0], 'tarball rebuild')
+
+  def testFailedInstall(self):
+    """Test that no partial tarball is left behind."""
+    self.cg_mock.build_deps_error = cros_build_lib.RunCommandError('failed',
+                                                                   None)
+    self.assertRaises(cros_build_lib.RunCommandError, self._Generate)
+    self.assertFalse(os.path.exists(os.path.join(self.tempdir, TAR_NAME)))
+
 
 class InterfaceTest(cros_test_lib.TempDirTestCase):
   """Test Parsing and error checking functionality."""
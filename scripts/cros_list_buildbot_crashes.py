@@ -10,6 +10,7 @@ from __future__ import print_function
 import collections
 import contextlib
 import datetime
+import json
 import multiprocessing
 import logging
 import optparse
@@ -20,7 +21,9 @@ import sys
 from chromite.buildbot import cbuildbot_config
 from chromite.buildbot import constants
 from chromite.buildbot import manifest_version
+from chromite.lib import commandline
 from chromite.lib import cros_build_lib
+from chromite.lib import osutils
 from chromite.lib import parallel
 
 
@@ -28,24 +31,138 @@ def ConvertGoogleStorageURLToHttpURL(url):
   return url.replace('gs://', 'http://sandbox.google.com/storage/')
 
 
+def _GetDefaultIndexPath(chrome_branch):
+  """Get the default location of the crash index for |chrome_branch|."""
+  return os.path.join(commandline.GetCacheDir(), 'crash_index',
+                      'R%s.json' % chrome_branch)
+
+
+class CrashIndex(object):
+  """Persistent index of crash reports that have already been processed.
+
+  The index maps the URL of each crash report to the program that crashed,
+  the signature of the stack trace, the date of the crash and the length of
+  the stack trace. Crash reports that are already in the index never need to
+  be downloaded again, so repeated runs only pay for new crashes.
+  """
+
+  DATE_FORMAT = '%Y%m%d'
+
+  def __init__(self, path):
+    """Initialize the index, loading any existing entries from |path|.
+
+    Args:
+      path: The on-disk location of the index.
+    """
+    self.path = path
+    self._crashes = {}
+    if os.path.exists(path):
+      try:
+        self._crashes = json.loads(osutils.ReadFile(path))
+      except ValueError:
+        cros_build_lib.Warning('Ignoring corrupt crash index %s', path)
+
+  def __contains__(self, url):
+    return url in self._crashes
+
+  def __len__(self):
+    return len(self._crashes)
+
+  def Add(self, url, program, signature, date, stack_len):
+    """Record a processed crash report in the index.
+
+    Args:
+      url: The URL where the crash is stored.
+      program: The program that crashed.
+      signature: The signature of the stack trace.
+      date: The date of the crash, formatted as YYYYMMDD.
+      stack_len: The number of functions in the stack trace.
+    """
+    self._crashes[url] = (program, signature, date, stack_len)
+
+  def Save(self):
+    """Atomically write the index back to disk."""
+    osutils.WriteFile(self.path, json.dumps(self._crashes), atomic=True,
+                      makedirs=True)
+
+  def Query(self, programs=None, signature=None, start_date=None,
+            end_date=None):
+    """Look up crashes in the index.
+
+    Args:
+      programs: If set, only return crashes in these programs.
+      signature: If set, a regular expression that the signature of the stack
+        trace must match.
+      start_date: If set, a datetime; only return crashes on or after it.
+      end_date: If set, a datetime; only return crashes on or before it.
+
+    Returns:
+      A dict mapping (program, signature) to a list of (date, stack_len, url)
+      tuples.
+    """
+    if signature is not None:
+      signature = re.compile(signature)
+    if start_date is not None:
+      start_date = start_date.strftime(self.DATE_FORMAT)
+    if end_date is not None:
+      end_date = end_date.strftime(self.DATE_FORMAT)
+
+    stack_traces = collections.defaultdict(list)
+    for url, (program, sig, date, stack_len) in self._crashes.iteritems():
+      if programs is not None and program not in programs:
+        continue
+      if signature is not None and not signature.search(sig):
+        continue
+      if start_date is not None and date < start_date:
+        continue
+      if end_date is not None and date > end_date:
+        continue
+      stack_traces[(program, sig)].append((date, stack_len, url))
+    return stack_traces
+
+
 class CrashTriager(object):
 
   CRASH_PATTERN = re.compile(r'/([^/.]*)\.(\d+)[^/]*\.dmp\.txt$')
   STACK_TRACE_PATTERN = re.compile(r'Thread 0 ((?:[^\n]+\n)*)')
   FUNCTION_PATTERN = re.compile(r'\S+!\S+')
 
-  def __init__(self, start_date, chrome_branch, all_programs, list_all, jobs):
+  def __init__(self, start_date, chrome_branch, all_programs, list_all, jobs,
+               index, programs=None, signature=None, offline=False):
+    """Initialize the crash triager.
+
+    Args:
+      start_date: Only look at crashes on or after this date.
+      chrome_branch: Chrome branch to look at for crash info.
+      all_programs: Whether to look at crashes in programs other than Chrome.
+      list_all: Whether to list all stack traces found (not just one).
+      jobs: Number of processes to run in parallel.
+      index: A CrashIndex of crash reports that were already processed.
+      programs: If set, only report crashes in these programs.
+      signature: If set, only report crashes whose signature matches this
+        regular expression.
+      offline: If True, only report crashes that are already in the index.
+    """
     self.start_date = start_date
     self.chrome_branch = chrome_branch
     self.crash_triage_queue = multiprocessing.Queue()
     self.stack_trace_queue = multiprocessing.Queue()
-    self.stack_traces = collections.defaultdict(list)
+    self.index = index
     self.all_programs = all_programs
     self.list_all = list_all
     self.jobs = jobs
+    self.programs = programs
+    if self.programs is None and not all_programs:
+      self.programs = ['chrome']
+    self.signature = signature
+    self.offline = offline
 
   def Run(self):
     """Run the crash triager, printing the most common stack traces."""
+    if self.offline:
+      self._PrintStackTraces()
+      return
+
     with self._PrintStackTracesInBackground():
       with self._DownloadCrashesInBackground():
         with self._ProcessCrashListInBackground():
@@ -97,9 +214,10 @@ class CrashTriager(object):
     """
     for line in self._ListCrashesForBot(bot_id, build_config):
       m = self.CRASH_PATTERN.search(line)
-      if m is None: continue
+      if m is None or line in self.index: continue
       program, crash_date = m.groups()
-      if self.all_programs or program == 'chrome':
+      if (self.all_programs or self.programs is None or
+          program in self.programs):
         crash_date_obj = datetime.datetime.strptime(crash_date, '%Y%m%d')
         if self.start_date <= crash_date_obj:
           self.crash_triage_queue.put((program, crash_date, line))
@@ -174,10 +292,15 @@ class CrashTriager(object):
       if functions:
         signature = functions[0]
     stack_len = len(functions)
-    self.stack_traces[(program, signature)].append((date, stack_len, url))
+    self.index.Add(url, program, signature, date, stack_len)
+
+  def _SaveIndexAndPrintStackTraces(self):
+    """Save the newly processed crashes to the index and print all traces."""
+    self.index.Save()
+    self._PrintStackTraces()
 
   def _PrintStackTraces(self):
-    """Print all stack traces."""
+    """Print all stack traces in the index that match our filters."""
 
     # Print header.
     if self.list_all:
@@ -186,7 +309,10 @@ class CrashTriager(object):
       print('Crash count, program, function, first crash, last crash, URL')
 
     # Print details about stack traces.
-    stack_traces = sorted(self.stack_traces.iteritems(),
+    stack_traces = self.index.Query(programs=self.programs,
+                                    signature=self.signature,
+                                    start_date=self.start_date)
+    stack_traces = sorted(stack_traces.iteritems(),
                           key=lambda x: len(x[1]), reverse=True)
     for (program, signature), crashes in stack_traces:
       if self.list_all:
@@ -204,10 +330,11 @@ class CrashTriager(object):
 
   @contextlib.contextmanager
   def _PrintStackTracesInBackground(self):
+    onexit = self._SaveIndexAndPrintStackTraces
     with parallel.BackgroundTaskRunner(self._ProcessStackTrace,
                                        queue=self.stack_trace_queue,
                                        processes=1,
-                                       onexit=self._PrintStackTraces):
+                                       onexit=onexit):
       yield
 
 
@@ -238,24 +365,45 @@ def _CreateParser():
                     help=('List all stack traces found (not just one).'))
   parser.add_option('', '--jobs',  dest='jobs', default=32, type='int',
                     help=('Number of processes to run in parallel.'))
+  parser.add_option('', '--index', dest='index', default=None,
+                    help=('Path to the index of processed crashes. Defaults '
+                          'to a per-branch index in the repo cache dir.'))
+  parser.add_option('', '--offline', action='store_true', dest='offline',
+                    default=False,
+                    help=('Only report crashes that are already in the index; '
+                          'do not look for new crashes.'))
+  parser.add_option('', '--program', action='append', dest='programs',
+                    default=None,
+                    help=('Only show crashes in this program. May be '
+                          'specified multiple times.'))
+  parser.add_option('', '--signature', dest='signature', default=None,
+                    help=('Only show crashes whose signature matches this '
+                          'regular expression.'))
   return parser
 
 def main(argv):
-  # Setup boto config for gsutil.
+  logging.disable(level=logging.INFO)
+  parser = _CreateParser()
+  (options, _) = parser.parse_args(argv)
+
+  # Setup boto config for gsutil. This is not needed when we only report
+  # crashes that are already in the index.
   boto_config = os.path.abspath(os.path.join(constants.SOURCE_ROOT,
       'src/private-overlays/chromeos-overlay/googlestorage_account.boto'))
   if os.path.isfile(boto_config):
     os.environ['BOTO_CONFIG'] = boto_config
-  else:
+  elif not options.offline:
     print('Cannot find %s' % boto_config, file=sys.stderr)
     print('This function requires a private checkout.', file=sys.stderr)
     print('See http://goto/chromeos-building', file=sys.stderr)
     sys.exit(1)
 
-  logging.disable(level=logging.INFO)
-  parser = _CreateParser()
-  (options, _) = parser.parse_args(argv)
   since = datetime.datetime.today() - datetime.timedelta(days=options.days)
+  index_path = options.index or _GetDefaultIndexPath(options.chrome_branch)
+  index = CrashIndex(index_path)
   triager = CrashTriager(since, options.chrome_branch, options.all_programs,
-                         options.list_all, options.jobs)
+                         options.list_all, options.jobs, index,
+                         programs=options.programs,
+                         signature=options.signature,
+                         offline=options.offline)
   triager.Run()
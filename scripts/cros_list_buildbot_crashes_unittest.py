@@ -0,0 +1,114 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unit tests for the cros_list_buildbot_crashes program."""
+
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite.lib import cros_test_lib
+from chromite.lib import osutils
+from chromite.scripts import cros_list_buildbot_crashes
+
+
+# pylint: disable=W0212
+class CrashIndexTest(cros_test_lib.TempDirTestCase):
+  """Tests for the CrashIndex class."""
+
+  URL = 'gs://chromeos-image-archive/x86-generic-full/R27-%d/%s.dmp.txt'
+
+  def setUp(self):
+    self.path = os.path.join(self.tempdir, 'index', 'R27.json')
+    self.index = cros_list_buildbot_crashes.CrashIndex(self.path)
+    self.index.Add(self.URL % (1, 'chrome.1'), 'chrome', 'foo!Bar',
+                   '20130101', 10)
+    self.index.Add(self.URL % (2, 'chrome.2'), 'chrome', 'foo!Bar',
+                   '20130105', 12)
+    self.index.Add(self.URL % (2, 'update_engine.1'), 'update_engine',
+                   'foo!Baz', '20130103', 3)
+
+  def testSaveAndLoad(self):
+    """Test that saved entries are visible to a new index."""
+    self.index.Save()
+    index = cros_list_buildbot_crashes.CrashIndex(self.path)
+    self.assertEqual(len(index), 3)
+    self.assertTrue(self.URL % (1, 'chrome.1') in index)
+    self.assertFalse(self.URL % (3, 'chrome.1') in index)
+
+  def testCorruptIndex(self):
+    """Test that a corrupt index is treated as empty."""
+    osutils.WriteFile(self.path, '{', makedirs=True)
+    index = cros_list_buildbot_crashes.CrashIndex(self.path)
+    self.assertEqual(len(index), 0)
+
+  def testQueryByProgram(self):
+    """Test that queries can be filtered by program."""
+    traces = self.index.Query(programs=['chrome'])
+    self.assertEqual(traces.keys(), [('chrome', 'foo!Bar')])
+    self.assertEqual(len(traces[('chrome', 'foo!Bar')]), 2)
+
+  def testQueryBySignature(self):
+    """Test that queries can be filtered by signature."""
+    traces = self.index.Query(signature='Baz$')
+    self.assertEqual(traces.keys(), [('update_engine', 'foo!Baz')])
+
+  def testQueryByDate(self):
+    """Test that queries can be filtered by date range."""
+    traces = self.index.Query(start_date=datetime.datetime(2013, 1, 2),
+                              end_date=datetime.datetime(2013, 1, 4))
+    self.assertEqual(traces.keys(), [('update_engine', 'foo!Baz')])
+    self.assertEqual(traces[('update_engine', 'foo!Baz')],
+                     [('20130103', 3, self.URL % (2, 'update_engine.1'))])
+
+
+class CrashTriagerTest(cros_test_lib.MockTempDirTestCase):
+  """Tests for the CrashTriager class."""
+
+  def setUp(self):
+    path = os.path.join(self.tempdir, 'R27.json')
+    self.index = cros_list_buildbot_crashes.CrashIndex(path)
+    self.triager = cros_list_buildbot_crashes.CrashTriager(
+        datetime.datetime(2013, 1, 1), '27', False, False, 1, self.index)
+
+  def testSkipIndexedCrashes(self):
+    """Test that crashes already in the index are not downloaded again."""
+    old = 'gs://bucket/bot/R27-1.0.0/chrome.20130102.1.dmp.txt'
+    new = 'gs://bucket/bot/R27-1.0.0/chrome.20130103.1.dmp.txt'
+    self.index.Add(old, 'chrome', 'foo!Bar', '20130102', 10)
+    self.PatchObject(self.triager, '_ListCrashesForBot',
+                     return_value=[old, new])
+    put = self.PatchObject(self.triager.crash_triage_queue, 'put')
+    self.triager._ProcessCrashListForBot('bot', {})
+    put.assert_called_once_with(('chrome', '20130103', new))
+
+  def testProgramFilter(self):
+    """Test that only crashes in the requested programs are downloaded."""
+    chrome = 'gs://bucket/bot/R27-1.0.0/chrome.20130102.1.dmp.txt'
+    other = 'gs://bucket/bot/R27-1.0.0/update_engine.20130102.1.dmp.txt'
+    triager = cros_list_buildbot_crashes.CrashTriager(
+        datetime.datetime(2013, 1, 1), '27', False, False, 1, self.index,
+        programs=['update_engine'])
+    self.PatchObject(triager, '_ListCrashesForBot',
+                     return_value=[chrome, other])
+    put = self.PatchObject(triager.crash_triage_queue, 'put')
+    triager._ProcessCrashListForBot('bot', {})
+    put.assert_called_once_with(('update_engine', '20130102', other))
+
+  def testProcessStackTrace(self):
+    """Test that processed stack traces are added to the index."""
+    url = 'gs://bucket/bot/R27-1.0.0/chrome.20130102.1.dmp.txt'
+    output = 'Thread 0 (crashed)\n 0  libc-2.15.so!raise\n 1  chrome!Foo\n\n'
+    self.triager._ProcessStackTrace('chrome', '20130102', url, output)
+    traces = self.index.Query()
+    self.assertEqual(traces.keys(), [('chrome', 'chrome!Foo[raise]')])
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
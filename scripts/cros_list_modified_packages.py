@@ -22,6 +22,7 @@ Some caveats:
 """
 
 import errno
+import hashlib
 import logging
 import multiprocessing
 import optparse
@@ -30,6 +31,7 @@ import Queue
 
 from chromite.buildbot import constants
 from chromite.buildbot import portage_utilities
+from chromite.lib import commandline
 from chromite.lib import cros_build_lib
 from chromite.lib import git
 from chromite.lib import osutils
@@ -66,16 +68,45 @@ class WorkonProjectsMonitor(object):
     if os.path.isdir(path):
       self._result_queue.put((project, self._LastModificationTime(path)))
 
+  @staticmethod
+  def _GetSavedMTimePath(path):
+    """Get the location of the saved modification time of |path|."""
+    key = hashlib.md5(os.path.realpath(path)).hexdigest()
+    return os.path.join(commandline.GetCacheDir(), 'workon_mtimes', key)
+
   def _LastModificationTime(self, path):
     """Calculate the last time a directory subtree was modified.
 
+    The result is saved, and the next call only has to sort the entries that
+    are newer than it.  Every entry still needs to be stat'ed, as writing to a
+    file does not change the mtime of its directory.  If the newest entry goes
+    back in time, the saved time is returned instead, which at worst causes
+    an unneeded rebuild.
+
     Args:
       path: Directory to look at.
     """
-    cmd = 'find . -name .git -prune -o -printf "%T@\n" | sort -nr | head -n1'
+    saved_path = self._GetSavedMTimePath(path)
+    try:
+      saved = float(osutils.ReadFile(saved_path))
+    except (EnvironmentError, ValueError):
+      saved = 0
+
+    cmd = 'find . -name .git -prune -o'
+    if saved:
+      cmd += ' -newermt @%r' % saved
+    cmd += ' -printf "%T@\n" | sort -nr | head -n1'
     ret = cros_build_lib.RunCommandCaptureOutput(cmd, cwd=path, shell=True,
                                                  print_cmd=False)
-    return float(ret.output) if ret.output else 0
+    if not ret.output:
+      return saved
+
+    mtime = float(ret.output)
+    try:
+      osutils.WriteFile(saved_path, '%r' % mtime, atomic=True, makedirs=True)
+    except EnvironmentError as e:
+      cros_build_lib.Warning('Could not save mtime of %s: %s', path, e)
+    return mtime
 
   def GetProjectModificationTimes(self):
     """Get the last modification time of each specified project.
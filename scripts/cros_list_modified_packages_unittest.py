@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unit tests for the cros_list_modified_packages program."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite.lib import cros_build_lib
+from chromite.lib import cros_test_lib
+from chromite.lib import git
+from chromite.lib import osutils
+from chromite.scripts import cros_list_modified_packages
+
+# TODO(build): Finish test wrapper (http://crosbug.com/37517).
+# Until then, this has to be after the chromite imports.
+import mock
+
+
+# pylint: disable=W0212
+class LastModificationTimeTest(cros_test_lib.MockTempDirTestCase):
+  """Tests for WorkonProjectsMonitor._LastModificationTime."""
+
+  BASE_TIME = 1000000000
+  FILES = ('a', 'dir/b', 'dir/sub/c', '.git/HEAD')
+
+  def setUp(self):
+    self.project = os.path.join(self.tempdir, 'project')
+    for name in self.FILES:
+      osutils.WriteFile(os.path.join(self.project, name), name, makedirs=True)
+    # The newest entry is in .git, which has to be ignored.
+    for root, dirs, files in os.walk(self.project, topdown=False):
+      for i, name in enumerate(sorted(dirs + files)):
+        self._SetMTime(os.path.join(root, name), self.BASE_TIME + i)
+    self._SetMTime(os.path.join(self.project, '.git', 'HEAD'),
+                   self.BASE_TIME + 1000)
+    self._SetMTime(self.project, self.BASE_TIME)
+
+    self.saved_path = os.path.join(self.tempdir, 'saved', 'mtime')
+    self.PatchObject(git.ManifestCheckout, 'Cached',
+                     return_value=mock.Mock(projects={}))
+    self.PatchObject(cros_list_modified_packages.WorkonProjectsMonitor,
+                     '_GetSavedMTimePath', return_value=self.saved_path)
+    self.monitor = cros_list_modified_packages.WorkonProjectsMonitor([])
+
+  @staticmethod
+  def _SetMTime(path, mtime):
+    os.utime(path, (mtime, mtime))
+
+  def _FullScan(self):
+    """Return the newest mtime the way the script used to find it."""
+    ret = cros_build_lib.RunCommandCaptureOutput(
+        'find . -name .git -prune -o -printf "%T@\n" | sort -nr | head -n1',
+        cwd=self.project, shell=True, print_cmd=False)
+    return float(ret.output)
+
+  def testFirstRun(self):
+    """Test that the first run matches the full find pipeline."""
+    mtime = self.monitor._LastModificationTime(self.project)
+    self.assertEqual(mtime, self._FullScan())
+    self.assertEqual(float(osutils.ReadFile(self.saved_path)), mtime)
+
+  def testInPlaceEdit(self):
+    """Test that writing to an existing file is picked up."""
+    first = self.monitor._LastModificationTime(self.project)
+    path = os.path.join(self.project, 'dir', 'sub', 'c')
+    osutils.WriteFile(path, 'edited')
+    self._SetMTime(path, first + 10)
+    self.assertEqual(self.monitor._LastModificationTime(self.project),
+                     first + 10)
+
+  def testUnchanged(self):
+    """Test that the saved time is returned when nothing is newer."""
+    first = self.monitor._LastModificationTime(self.project)
+    self.assertEqual(self.monitor._LastModificationTime(self.project), first)
+
+  def testNeverGoesBackwards(self):
+    """Test that an older newest entry does not lower the result."""
+    saved = self.BASE_TIME + 5000
+    osutils.WriteFile(self.saved_path, '%r' % float(saved), makedirs=True)
+    self.assertEqual(self.monitor._LastModificationTime(self.project), saved)
+
+  def testCorruptSavedTime(self):
+    """Test that a corrupt saved time falls back to a full scan."""
+    osutils.WriteFile(self.saved_path, 'garbage', makedirs=True)
+    mtime = self.monitor._LastModificationTime(self.project)
+    self.assertEqual(mtime, self._FullScan())
+    self.assertEqual(float(osutils.ReadFile(self.saved_path)), mtime)
+
+  def testUnreadableSavedTime(self):
+    """Test that an unreadable saved time falls back to a full scan."""
+    os.makedirs(self.saved_path)
+    self.assertEqual(self.monitor._LastModificationTime(self.project),
+                     self._FullScan())
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
@@ -232,6 +232,9 @@ def main(_argv):
   if command == 'commit':
     portage_utilities.BuildEBuildDictionary(
       overlays, options.all, package_list)
+    portage_utilities.EBuild.PrefetchSourceInfo(
+        [ebuild for ebuilds in overlays.itervalues() for ebuild in ebuilds],
+        options.srcroot)
 
   manifest = git.ManifestCheckout.Cached(options.srcroot)
 
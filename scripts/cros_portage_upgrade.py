@@ -5,6 +5,7 @@
 
 """Perform various tasks related to updating Portage packages."""
 
+import cPickle
 import filecmp
 import fnmatch
 import logging
@@ -20,6 +21,7 @@ from chromite.buildbot import constants
 from chromite.lib import cros_build_lib
 from chromite.lib import osutils
 from chromite.lib import operation
+from chromite.lib import parallel
 from chromite.lib import upgrade_table as utable
 from chromite.scripts import merge_package_status as mps
 
@@ -86,6 +88,100 @@ class PInfo(object):
     """Inequality support for completeness."""
     return not self == other
 
+class PortageQuery(object):
+  """Answer portage queries in-process, loading each portage tree only once.
+
+  Running 'equery which' for every package means starting a new python and
+  loading the portage config and tree from scratch for every query.  Instead,
+  keep one portdbapi object around for each distinct board and set of
+  portage envvars, and remember the answer to every query made against it.
+  """
+
+  __slots__ = ('_host_board',   # Board name that refers to the host
+               '_portdbs',      # Dict of (board, envvars) -> portdbapi
+               '_results',      # Dict of ((board, envvars), pkg) -> cpv
+               )
+
+  def __init__(self, host_board=None):
+    self._host_board = host_board
+    self._portdbs = {}
+    self._results = {}
+
+  def _GenBoardEnvvars(self, board):
+    """Returns envvars pointing portage at |board|, like emerge-${BOARD}."""
+    if board is None or board == self._host_board:
+      return {}
+
+    sysroot = '/build/%s' % board
+    return {'PORTAGE_CONFIGROOT': sysroot,
+            'PORTAGE_SYSROOT': sysroot,
+            'ROOT': sysroot,
+            'SYSROOT': sysroot,
+            }
+
+  def _GetPortDB(self, key):
+    """Return the portdbapi for |key|, creating it if necessary."""
+    portdb = self._portdbs.get(key)
+    if portdb is None:
+      (board, envvars) = key
+      env = os.environ.copy()
+      env.update(self._GenBoardEnvvars(board))
+      env.update(envvars)
+      settings = portage.config(config_root=env.get('PORTAGE_CONFIGROOT'),
+                                target_root=env.get('ROOT'), env=env)
+      portdb = portage.portdbapi(mysettings=settings)
+      self._portdbs[key] = portdb
+
+    return portdb
+
+  @staticmethod
+  def _GetAtom(portdb, pkg):
+    """Convert |pkg| to an atom the same way 'equery which' does."""
+    # A bare cpv refers to exactly that version.
+    if pkg[0] not in '<>=~!' and portage.versions.catpkgsplit(pkg):
+      pkg = '=' + pkg
+    return portage.dep_expand(pkg, mydb=portdb, settings=portdb.settings)
+
+  def FindBestVisible(self, pkgs, envvars, board=None):
+    """Returns best visible cpv for each of |pkgs|, as 'equery which' would.
+
+    Each item in |pkgs| can specify as much or as little of the full CPV
+    syntax as desired.  The portage tree is selected by |envvars|, in the
+    same way as when running portage tools with those envvars set.  If
+    |board| is given, queries run against that board as with equery-${BOARD}
+    (or plain equery for the host board), and are cached separately so that
+    they can be invalidated with Invalidate(board).
+
+    Returns a dict mapping each of |pkgs| to its best visible cpv, or to
+    None if no visible cpv matches.
+    """
+    key = (board, tuple(sorted(envvars.items())))
+    results = {}
+    for pkg in pkgs:
+      if (key, pkg) not in self._results:
+        portdb = self._GetPortDB(key)
+        try:
+          cpv = portdb.xmatch('bestmatch-visible',
+                              self._GetAtom(portdb, pkg))
+        except (portage.exception.PortageException, ValueError):
+          # Invalid or ambiguous package name; equery fails on these too.
+          cpv = None
+        self._results[(key, pkg)] = cpv or None
+      results[pkg] = self._results[(key, pkg)]
+
+    return results
+
+  def Invalidate(self, board):
+    """Forget all portage trees and results for |board|.
+
+    This must be called whenever ebuilds visible to |board| may have
+    changed.
+    """
+    for key in [k for k in self._portdbs if k[0] == board]:
+      self._portdbs.pop(key).close_caches()
+    for key in [k for k in self._results if k[0][0] == board]:
+      del self._results[key]
+
 class Upgrader(object):
   """A class to perform various tasks related to updating Portage packages."""
 
@@ -116,6 +212,7 @@ class Upgrader(object):
 
   __slots__ = ['_amend',        # Boolean to use --amend with upgrade commit
                '_args',         # Commandline arguments (all portage targets)
+               '_board_tables', # Dir of tables from parallel board runs
                '_curr_arch',    # Architecture for current board run
                '_curr_board',   # Board for current board run
                '_curr_table',   # Package status for current board run
@@ -133,6 +230,7 @@ class Upgrader(object):
                '_master_table', # Merged table from all board runs
                '_no_upstream_cache', # Boolean.  Delete upstream cache when done
                '_porttree',     # Reference to portage porttree object
+               '_portage_query',# PortageQuery shared by all board runs
                '_rdeps',        # Boolean, if True pass --root-deps=rdeps
                '_stable_repo',  # Path to portage-stable
                '_stable_repo_categories', # Categories from profiles/categories
@@ -156,6 +254,7 @@ class Upgrader(object):
     self._master_cnt = 0
     self._master_archs = set()
     self._upgrade_cnt = 0
+    self._board_tables = None
 
     self._stable_repo = os.path.join(options.srcroot, 'third_party',
                                      self.STABLE_OVERLAY_NAME)
@@ -172,6 +271,7 @@ class Upgrader(object):
       setattr(self, '_' + opt, getattr(options, opt, None))
 
     self._porttree = None
+    self._portage_query = PortageQuery(host_board=self.HOST_BOARD)
     self._emptydir = None
     self._deps_graph = None
 
@@ -447,18 +547,10 @@ class Upgrader(object):
                                       portdir=self._upstream_repo,
                                       portage_configroot=self._emptydir)
 
-    # Point equery to the upstream source to get latest version for keywords.
-    equery = ['equery', 'which', pkg]
-    cmd_result = cros_build_lib.RunCommand(
-        equery, extra_env=envvars, print_cmd=self._verbose,
-        error_code_ok=True, redirect_stdout=True, combine_stdout_stderr=True)
-
-    if cmd_result.returncode == 0:
-      ebuild_path = cmd_result.output.strip()
-      (_overlay, cat, _pn, pv) = self._SplitEBuildPath(ebuild_path)
-      return os.path.join(cat, pv)
-    else:
-      return None
+    # Point portage to the upstream source to get latest version for keywords.
+    # The upstream source never changes during a run, so results are shared
+    # across all boards with the same arch.
+    return self._portage_query.FindBestVisible([pkg], envvars)[pkg]
 
   def _GetBoardCmd(self, cmd):
     """Return the board-specific version of |cmd|, if applicable."""
@@ -492,18 +584,8 @@ class Upgrader(object):
     """Returns current cpv on |_curr_board| that matches |pkg|, or None."""
     envvars = self._GenPortageEnvvars(self._curr_arch, unstable_ok=False)
 
-    equery = self._GetBoardCmd(self.EQUERY_CMD)
-    cmd = [equery, 'which', pkg]
-    cmd_result = cros_build_lib.RunCommand(
-        cmd, error_code_ok=True, extra_env=envvars, print_cmd=False,
-        redirect_stdout=True, combine_stdout_stderr=True)
-
-    if cmd_result.returncode == 0:
-      ebuild_path = cmd_result.output.strip()
-      (_overlay, cat, _pn, pv) = self._SplitEBuildPath(ebuild_path)
-      return os.path.join(cat, pv)
-    else:
-      return None
+    return self._portage_query.FindBestVisible(
+        [pkg], envvars, board=self._curr_board)[pkg]
 
   def _SetUpgradedMaskBits(self, pinfo):
     """Set pinfo.upgraded_unmasked and pinfo.upgraded_stable."""
@@ -1704,6 +1786,8 @@ class Upgrader(object):
     self._deps_graph = None
 
     self._curr_board = board
+    # Earlier board runs may have upgraded ebuilds visible to this board.
+    self._portage_query.Invalidate(board)
     self._curr_arch = Upgrader._FindBoardArch(board)
     upgrade_mode = self._IsInUpgradeMode()
     self._curr_table = utable.UpgradeTable(self._curr_arch,
@@ -1764,6 +1848,70 @@ class Upgrader(object):
       self._master_table = self._curr_table
       self._master_table._arch = None
 
+  def _RunBoardInBackground(self, board):
+    """Run RunBoard for |board| and save the resulting table.
+
+    This runs in a child process started by RunBoardsInParallel.  The table
+    is written to a file in |self._board_tables| rather than sent back over
+    a pipe, so that a child never waits on its parent to read the result.
+    """
+    # Any stash belongs to the parent process, which will unstash it once
+    # all boards are done.
+    self._stable_repo_stashed = False
+    self.RunBoard(board)
+    osutils.WriteFile(os.path.join(self._board_tables, board),
+                      cPickle.dumps((self._curr_arch, self._curr_table),
+                                    cPickle.HIGHEST_PROTOCOL))
+
+  def RunBoardsInParallel(self, boards, jobs):
+    """Runs RunBoard for all |boards|, with up to |jobs| boards at a time.
+
+    Each board is analyzed in its own process, so that portage config for one
+    board cannot leak into another.  The table from each board is merged into
+    |self._master_table| once all boards are done, in the order of |boards|.
+
+    This is only supported in status report mode, as upgrades for one board
+    have to be visible to the boards that follow it.
+    """
+    assert not self._IsInUpgradeMode()
+
+    # Stash any staged changes once for all boards, rather than letting each
+    # board run stash and unstash them on its own.
+    self._SaveStatusOnStableRepo()
+    if self._AnyChangesStaged():
+      self._StashChanges()
+
+    board_tables = {}
+    with osutils.TempDirContextManager() as tempdir:
+      self._board_tables = tempdir
+      try:
+        oper.Notice('Running with boards %s, %d at a time.' %
+                    (' '.join(boards), jobs))
+        parallel.RunTasksInProcessPool(self._RunBoardInBackground,
+                                       [[board] for board in boards],
+                                       processes=min(jobs, len(boards)))
+      except parallel.BackgroundFailure as ex:
+        raise RuntimeError(str(ex))
+      finally:
+        self._board_tables = None
+        self._UnstashAnyChanges()
+
+      for board in boards:
+        with open(os.path.join(tempdir, board)) as f:
+          board_tables[board] = cPickle.load(f)
+
+    tables = []
+    for board in boards:
+      (arch, table) = board_tables[board]
+      self._master_cnt += 1
+      self._master_archs.add(arch)
+      tables.append(table)
+    if self._master_table:
+      tables.insert(0, self._master_table)
+
+    self._master_table = mps.MergeTables(tables)
+    self._master_table._arch = None
+
   def WriteTableFiles(self, csv=None):
     """Write |self._master_table| to |csv| file, if requested."""
 
@@ -1862,6 +2010,10 @@ def _CreateOptParser():
   parser.add_option('--host', dest='host', action='store_true',
                     default=False,
                     help='Host target pseudo-board')
+  parser.add_option('--jobs', dest='jobs', type='int', action='store',
+                    default=1,
+                    help='Number of boards to run in parallel, in status '
+                    'report mode only [default: %default]')
   parser.add_option('--no-upstream-cache', dest='no_upstream_cache',
                     action='store_true', default=False,
                     help='Do not preserve cached upstream for future runs')
@@ -1922,6 +2074,12 @@ def main(argv):
     oper.Die('The --upgrade and --upgrade-deep options ' +
              'are mutually exclusive.')
 
+  # Boards can only run in parallel when nothing is being upgraded.
+  if options.jobs > 1 and (options.upgrade or options.upgrade_deep):
+    parser.print_help()
+    oper.Die('The --jobs option cannot be used with --upgrade or '
+             '--upgrade-deep.')
+
   # The --force option only makes sense with --upgrade or --upgrade-deep.
   if options.force and not (options.upgrade or options.upgrade_deep):
     parser.print_help()
@@ -1985,9 +2143,12 @@ def main(argv):
   try:
     upgrader.PrepareToRun()
 
-    for board in boards:
-      oper.Notice('Running with board %s.' % board)
-      upgrader.RunBoard(board)
+    if options.jobs > 1 and len(boards) > 1:
+      upgrader.RunBoardsInParallel(boards, options.jobs)
+    else:
+      for board in boards:
+        oper.Notice('Running with board %s.' % board)
+        upgrader.RunBoard(board)
   except RuntimeError as ex:
     passed = False
     oper.Error(str(ex))
@@ -501,6 +501,9 @@ class CpuTestBase(cros_test_lib.MoxOutputTestCase):
       '_verbose':     False,
     }
 
+    upgrader_slot_defaults['_portage_query'] = cpu.PortageQuery(
+        host_board=cpu.Upgrader.HOST_BOARD)
+
     upgrader = self.mox.CreateMock(cpu.Upgrader)
 
     # Initialize each attribute with default value.
@@ -1762,11 +1765,6 @@ class TreeInspectTest(CpuTestBase):
                                        portdir=mocked_upgrader._upstream_repo,
                                        portage_configroot=portage_configroot,
                                        ).AndReturn(envvars)
-
-    if ebuild_expect:
-      ebuild_path = eroot + ebuild_expect
-      split_path = cpu.Upgrader._SplitEBuildPath(mocked_upgrader, ebuild_path)
-      mocked_upgrader._SplitEBuildPath(ebuild_path).AndReturn(split_path)
     self.mox.ReplayAll()
 
     # Verify
@@ -1827,7 +1825,6 @@ class TreeInspectTest(CpuTestBase):
 
     mocked_upgrader = self._MockUpgrader(_curr_board=None)
     self._SetUpPlayground()
-    eroot = self._GetPlaygroundRoot()
 
     # Add test-specific mocks/stubs
 
@@ -1837,18 +1834,12 @@ class TreeInspectTest(CpuTestBase):
                                               unstable_ok=False)
     mocked_upgrader._GenPortageEnvvars(mocked_upgrader._curr_arch,
                                        unstable_ok=False).AndReturn(envvars)
-    mocked_upgrader._GetBoardCmd('equery').AndReturn('equery')
-
-    if ebuild_expect:
-      ebuild_path = eroot + ebuild_expect
-      split_path = cpu.Upgrader._SplitEBuildPath(mocked_upgrader, ebuild_path)
-      mocked_upgrader._SplitEBuildPath(ebuild_path).AndReturn(split_path)
-
     self.mox.ReplayAll()
 
     # Verify
     result = cpu.Upgrader._FindCurrentCPV(mocked_upgrader, pkg_arg)
     self.mox.VerifyAll()
+    self.assertTrue(bool(ebuild_expect) == bool(result))
 
     return result
 
@@ -1884,6 +1875,45 @@ class TreeInspectTest(CpuTestBase):
     result = self._TestFindCurrentCPV(cp, ebuild)
     self.assertEquals(result, cpv)
 
+########################
+### PortageQueryTest ###
+########################
+
+class PortageQueryTest(CpuTestBase):
+  """Test PortageQuery."""
+
+  def setUp(self):
+    self._SetUpPlayground()
+    self.query = cpu.PortageQuery(host_board=cpu.Upgrader.HOST_BOARD)
+    self.envvars = {'ACCEPT_KEYWORDS': DEFAULT_ARCH}
+
+  def testFindBestVisible(self):
+    """Test that several packages are resolved at once."""
+    pkgs = ['dev-libs/A', 'dev-libs/F-1', 'chromeos-base/flimflam',
+            'dev-libs/AAA']
+    result = self.query.FindBestVisible(pkgs, self.envvars)
+    self.assertEquals(result, {'dev-libs/A': 'dev-libs/A-2',
+                               'dev-libs/F-1': 'dev-libs/F-1',
+                               'chromeos-base/flimflam':
+                               'chromeos-base/flimflam-0.0.1-r228',
+                               'dev-libs/AAA': None})
+
+  def testFindBestVisibleCached(self):
+    """Test that the portage tree is only loaded once."""
+    self.query.FindBestVisible(['dev-libs/A'], self.envvars)
+    self.query.FindBestVisible(['dev-libs/A', 'dev-libs/B'], self.envvars)
+    self.assertEquals(len(self.query._portdbs), 1)
+    self.assertEquals(len(self.query._results), 2)
+
+  def testInvalidate(self):
+    """Test that invalidating a board only drops results for that board."""
+    self.query.FindBestVisible(['dev-libs/A'], self.envvars)
+    self.query.FindBestVisible(['dev-libs/A'], self.envvars,
+                               board=cpu.Upgrader.HOST_BOARD)
+    self.query.Invalidate(cpu.Upgrader.HOST_BOARD)
+    self.assertEquals(len(self.query._portdbs), 1)
+    self.assertEquals(len(self.query._results), 1)
+
 ####################
 ### RunBoardTest ###
 ####################
@@ -2139,6 +2169,53 @@ class RunBoardTest(CpuTestBase):
                         mocked_upgrader, board)
     self.mox.VerifyAll()
 
+  def testRunBoardsInParallel(self):
+    """Test that tables from parallel board runs are merged in order."""
+    boards = ['board1', 'board2']
+    mocked_upgrader = self._MockUpgrader(cmdargs=['dev-libs/A'],
+                                         _curr_board=None)
+    tables = {}
+    for board in boards:
+      tables[board] = utable.UpgradeTable('x86', name=board)
+
+    def RunBoard(board):
+      mocked_upgrader._curr_arch = 'x86'
+      mocked_upgrader._curr_table = tables[board]
+
+    def RunTasks(task, inputs, processes):
+      self.assertEquals(processes, 2)
+      for x in inputs:
+        task(*x)
+
+    # Add test-specific mocks/stubs
+    self.mox.StubOutWithMock(cpu.parallel, 'RunTasksInProcessPool')
+    self.mox.StubOutWithMock(cpu.mps, 'MergeTables')
+
+    # Replay script
+    mocked_upgrader._IsInUpgradeMode().AndReturn(False)
+    mocked_upgrader._SaveStatusOnStableRepo()
+    mocked_upgrader._AnyChangesStaged().AndReturn(True)
+    mocked_upgrader._StashChanges()
+    cpu.parallel.RunTasksInProcessPool(
+        mocked_upgrader._RunBoardInBackground, [['board1'], ['board2']],
+        processes=2).WithSideEffects(RunTasks)
+    for board in boards:
+      mocked_upgrader._RunBoardInBackground(board).WithSideEffects(
+          lambda b: cpu.Upgrader._RunBoardInBackground(mocked_upgrader, b))
+      mocked_upgrader.RunBoard(board).WithSideEffects(RunBoard)
+    mocked_upgrader._UnstashAnyChanges()
+    cpu.mps.MergeTables([tables['board1'], tables['board2']]).AndReturn(
+        utable.UpgradeTable('x86'))
+    self.mox.ReplayAll()
+
+    # Verify
+    with self.OutputCapturer():
+      cpu.Upgrader.RunBoardsInParallel(mocked_upgrader, boards, 4)
+    self.mox.VerifyAll()
+    self.assertEquals(mocked_upgrader._master_cnt, 2)
+    self.assertEquals(mocked_upgrader._master_archs, set(['x86']))
+    self.assertEquals(mocked_upgrader._master_table.GetArch(), None)
+
 
 #############################
 ### GiveEmergeResultsTest ###
@@ -3690,6 +3767,29 @@ class MainTest(CpuTestBase):
                           expect_zero=True)
     self.mox.VerifyAll()
 
+  def testFlowStatusReportTwoBoardsParallel(self):
+    """Test main flow for two-board status report run in parallel."""
+    self.mox.StubOutWithMock(cpu.Upgrader, 'PreRunChecks')
+    self.mox.StubOutWithMock(cpu, '_BoardIsSetUp')
+    self.mox.StubOutWithMock(cpu.Upgrader, 'PrepareToRun')
+    self.mox.StubOutWithMock(cpu.Upgrader, 'RunBoardsInParallel')
+    self.mox.StubOutWithMock(cpu.Upgrader, 'RunCompleted')
+    self.mox.StubOutWithMock(cpu.Upgrader, 'WriteTableFiles')
+
+    cpu.Upgrader.PreRunChecks()
+    cpu._BoardIsSetUp('board1').AndReturn(True)
+    cpu._BoardIsSetUp('board2').AndReturn(True)
+    cpu.Upgrader.PrepareToRun()
+    cpu.Upgrader.RunBoardsInParallel(['board1', 'board2'], 2)
+    cpu.Upgrader.RunCompleted()
+    cpu.Upgrader.WriteTableFiles(csv=None)
+    self.mox.ReplayAll()
+
+    with self.OutputCapturer():
+      self._AssertCPUMain(['--board=board1:board2', '--jobs=2',
+                           'any-package'], expect_zero=True)
+    self.mox.VerifyAll()
+
   def testFlowUpgradeOneBoard(self):
     """Test main flow for basic one-board upgrade."""
     self.mox.StubOutWithMock(cpu.Upgrader, 'PreRunChecks')
@@ -56,6 +56,11 @@ CONFIG_TARGET_SUFFIXES = {
 # function as needed.
 target_version_map = {
 }
+# Global per-run cache of lddtree.ParseELF() results, filled in by _ParseELF().
+# CreatePackages() handles several targets in each of its processes, so the
+# cache is shared by the targets packaged by the same process.
+elf_cache = {
+}
 
 
 class Crossdev(object):
@@ -511,7 +516,11 @@ def UpdateToolchains(usepkg, getbinpkg, deleteold, hostonly, reconfig,
     if crossdev_targets:
       print 'The following targets need to be re-initialized:'
       print crossdev_targets
-      Crossdev.UpdateTargets(crossdev_targets, usepkg, getbinpkg=getbinpkg)
+      # With binary packages there is nothing to bootstrap, so crossdev only
+      # has to set up the new targets; their packages are then merged in the
+      # same emerge as those of all the other targets below.
+      Crossdev.UpdateTargets(crossdev_targets, usepkg, getbinpkg=getbinpkg,
+                             config_only=usepkg)
     # Those that were not initialized may need a config update.
     Crossdev.UpdateTargets(reconfig_targets, usepkg, getbinpkg=getbinpkg,
                            config_only=True)
@@ -709,6 +718,28 @@ def _GetFilesForTarget(target, root='/'):
   return paths, elfs
 
 
+def _ParseELF(elf, root, ldpaths):
+  """Like lddtree.ParseELF(), but reuses the results for the same file
+
+  Toolchain packages install most of their programs under several names
+  that are hardlinks to each other, so each file only needs to be parsed once
+  per directory (as rpaths may be relative to it).
+
+  Args:
+    elf: The ELF to parse
+    root: The root path to pull all packages/files from
+    ldpaths: A dict of static ldpath information
+  Returns:
+    See lddtree.ParseELF()
+  """
+  st = os.stat(elf)
+  key = (os.path.dirname(elf), st.st_dev, st.st_ino, root,
+         tuple((k, tuple(v)) for k, v in sorted(ldpaths.iteritems())))
+  if key not in elf_cache:
+    elf_cache[key] = lddtree.ParseELF(elf, root, ldpaths)
+  return elf_cache[key]
+
+
 def _BuildInitialPackageRoot(output_dir, paths, elfs, ldpaths,
                              path_rewrite_func=lambda x:x, root='/'):
   """Link in all packable files and their runtime dependencies
@@ -760,7 +791,7 @@ def _BuildInitialPackageRoot(output_dir, paths, elfs, ldpaths,
   osutils.SafeMakedirs(libdir)
   donelibs = set()
   for elf in elfs:
-    e = lddtree.ParseELF(elf, root, ldpaths)
+    e = _ParseELF(elf, root, ldpaths)
     interp = e['interp']
     if interp:
       # Generate a wrapper if it is executable.
@@ -901,6 +932,11 @@ def CreatePackagableRoot(target, output_dir, ldpaths, root='/'):
   _ProcessDistroCleanups(target, output_dir)
 
 
+def _TimedTask(log_msg, functor, *args):
+  """Run |functor| with |args| and log how long it took with |log_msg|"""
+  cros_build_lib.TimedCommand(functor, *args, timed_log_msg=log_msg)
+
+
 def CreatePackages(targets_wanted, output_dir, root='/'):
   """Create redistributable cross-compiler packages for the specified targets
 
@@ -922,16 +958,20 @@ def CreatePackages(targets_wanted, output_dir, root='/'):
     # because we hardlink in all the files (to avoid overhead of reading/writing
     # the copies multiple times).  But tar gets angry if a file's hardlink count
     # changes from when it starts reading a file to when it finishes.
-    with parallel.BackgroundTaskRunner(CreatePackagableRoot) as queue:
+    with parallel.BackgroundTaskRunner(_TimedTask) as queue:
       for target in targets:
         output_target_dir = os.path.join(tempdir, target)
-        queue.put([target, output_target_dir, ldpaths, root])
+        queue.put(['%s: building the root took %%s' % target,
+                   CreatePackagableRoot, target, output_target_dir, ldpaths,
+                   root])
 
     # Build the tarball.
-    with parallel.BackgroundTaskRunner(cros_build_lib.CreateTarball) as queue:
+    with parallel.BackgroundTaskRunner(_TimedTask) as queue:
       for target in targets:
         tar_file = os.path.join(output_dir, target + '.tar.xz')
-        queue.put([tar_file, os.path.join(tempdir, target)])
+        queue.put(['%s: creating the tarball took %%s' % target,
+                   cros_build_lib.CreateTarball, tar_file,
+                   os.path.join(tempdir, target)])
 
 
 def main(argv):
@@ -988,7 +1028,9 @@ def main(argv):
   elif options.create_packages:
     cros_build_lib.AssertInsideChroot()
     Crossdev.Load(False)
-    CreatePackages(targets, options.output_dir)
+    cros_build_lib.TimedCommand(
+        CreatePackages, targets, options.output_dir,
+        timed_log_msg='Creating all the packages took %s')
   else:
     cros_build_lib.AssertInsideChroot()
     # This has to be always run as root.
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for cros_setup_toolchains.py."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..'))
+from chromite.lib import cros_test_lib
+from chromite.lib import osutils
+from chromite.scripts import cros_setup_toolchains
+
+# Needs to be after chromite imports.
+import lddtree
+
+
+class ParseELFTest(cros_test_lib.MockTempDirTestCase):
+  """Tests for the cache of _ParseELF."""
+
+  LDPATHS = {'env': [], 'conf': ['/usr/lib'], 'interp': ['/lib']}
+
+  def setUp(self):
+    self.PatchObject(cros_setup_toolchains, 'elf_cache', {})
+    self.parse = self.PatchObject(lddtree, 'ParseELF',
+                                  side_effect=lambda *args: {'args': args})
+
+    # One file, with two names in bin/ and one in sbin/.
+    self.gcc = os.path.join(self.tempdir, 'bin', 'gcc')
+    self.cc = os.path.join(self.tempdir, 'bin', 'cc')
+    self.sbin_gcc = os.path.join(self.tempdir, 'sbin', 'gcc')
+    osutils.Touch(self.gcc, makedirs=True)
+    os.link(self.gcc, self.cc)
+    osutils.SafeMakedirs(os.path.dirname(self.sbin_gcc))
+    os.link(self.gcc, self.sbin_gcc)
+
+  def _Parse(self, elf, root='/', ldpaths=None):
+    if ldpaths is None:
+      ldpaths = self.LDPATHS
+    return cros_setup_toolchains._ParseELF(elf, root, ldpaths)
+
+  def testHardlinks(self):
+    """Test that hardlinks in the same directory are parsed once."""
+    result = self._Parse(self.gcc)
+    self.assertEqual(self._Parse(self.cc), result)
+    self.assertEqual(self._Parse(self.gcc), result)
+    self.parse.assert_called_once_with(self.gcc, '/', self.LDPATHS)
+
+  def testDifferentDirectories(self):
+    """Test that hardlinks in different directories are parsed separately."""
+    self._Parse(self.gcc)
+    result = self._Parse(self.sbin_gcc)
+    self.assertEqual(self.parse.call_count, 2)
+    self.assertEqual(result['args'][0], self.sbin_gcc)
+
+  def testDifferentSearchPaths(self):
+    """Test that different roots or ldpaths are not conflated."""
+    self._Parse(self.gcc)
+    ldpaths = dict(self.LDPATHS, conf=['/usr/lib64'])
+    result = self._Parse(self.gcc, ldpaths=ldpaths)
+    self.assertEqual(result['args'][2], ldpaths)
+    result = self._Parse(self.gcc, root=self.tempdir)
+    self.assertEqual(result['args'][1], self.tempdir)
+    self.assertEqual(self.parse.call_count, 3)
+    # Equal ldpaths in a new dict are still found in the cache.
+    self._Parse(self.gcc, ldpaths=dict(self.LDPATHS))
+    self.assertEqual(self.parse.call_count, 3)
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
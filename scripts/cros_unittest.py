@@ -0,0 +1,61 @@
+#!/usr/bin/python
+
+# Copyright (c) 2013 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unit tests for the cros program."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite import cros
+from chromite.cros import commands
+from chromite.lib import cros_test_lib
+from chromite.scripts import cros as cros_script
+
+
+class _FakeCommand(cros.CrosCommand):
+  """Fake command for testing."""
+
+  EPILOG = 'Fake epilog.'
+
+  @classmethod
+  def AddParser(cls, parser):
+    super(_FakeCommand, cls).AddParser(parser)
+    parser.add_argument('--fake-option')
+
+
+class GetOptionsTest(cros_test_lib.MockTempDirTestCase):
+  """Tests for the cros argument parser."""
+
+  def setUp(self):
+    self.import_mock = self.PatchObject(commands, 'ImportCommand',
+                                        return_value=_FakeCommand)
+    self.parser = cros_script.GetOptions(['fake', 'other'])
+
+  def testNoImportForHelp(self):
+    """Tests that listing the commands does not import any of them."""
+    self.assertTrue('{fake,other}' in self.parser.format_help())
+    self.assertFalse(self.import_mock.called)
+
+  def testImportSelected(self):
+    """Tests that only the selected command is imported and parsed."""
+    options = self.parser.parse_args(['--cache-dir', self.tempdir, 'fake',
+                                      '--fake-option', 'foo'])
+    self.import_mock.assert_called_once_with('fake')
+    self.assertEqual(options.cros_class, _FakeCommand)
+    self.assertEqual(options.fake_option, 'foo')
+
+  def testUnknownCommand(self):
+    """Tests that unknown commands are rejected without importing anything."""
+    with cros_test_lib.OutputCapturer():
+      self.assertRaises(SystemExit, self.parser.parse_args, ['bogus'])
+    self.assertFalse(self.import_mock.called)
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
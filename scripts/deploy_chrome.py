@@ -101,8 +101,10 @@ class DeployChrome(object):
     # Use --force to bypass the checks.
     cmd = ('/usr/share/vboot/bin/make_dev_ssd.sh --partitions %d '
            '--remove_rootfs_verification --force')
-    for partition in (KERNEL_A_PARTITION, KERNEL_B_PARTITION):
-      self.host.RemoteSh(cmd % partition, error_code_ok=True)
+    self.host.RemoteShBatch(
+        [cmd % partition for partition in (KERNEL_A_PARTITION,
+                                           KERNEL_B_PARTITION)],
+        error_code_ok=True)
 
     # A reboot in developer mode takes a while (and has delays), so the user
     # will have time to read and act on the USB boot instructions below.
@@ -197,15 +199,16 @@ class DeployChrome(object):
     # stop printing output at that point, and halt any running steps.
     steps = [self._PrepareStagingDir, self._CheckConnection,
              self._KillProcsIfNeeded, self._MountRootfsAsWritable]
-    parallel.RunParallelSteps(steps, halt_on_error=True)
+    with self.host:
+      parallel.RunParallelSteps(steps, halt_on_error=True)
 
-    # If we failed to mark the rootfs as writable, try disabling rootfs
-    # verification.
-    if self._rootfs_is_still_readonly.is_set():
-      self._DisableRootfsVerification()
+      # If we failed to mark the rootfs as writable, try disabling rootfs
+      # verification.
+      if self._rootfs_is_still_readonly.is_set():
+        self._DisableRootfsVerification()
 
-    # Actually deploy Chrome to the device.
-    self._Deploy()
+      # Actually deploy Chrome to the device.
+      self._Deploy()
 
 
 def ValidateGypDefines(_option, _opt, value):
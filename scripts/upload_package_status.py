@@ -5,12 +5,15 @@
 
 """Support uploading a csv file to a Google Docs spreadsheet."""
 
+import json
 import optparse
 import os
 
+from chromite.lib import commandline
 from chromite.lib import gdata_lib
 from chromite.lib import table
 from chromite.lib import operation
+from chromite.lib import osutils
 from chromite.lib import upgrade_table as utable
 from chromite.scripts import merge_package_status as mps
 
@@ -19,9 +22,56 @@ TEST_SS_KEY = '0AsXDKtaHikmcdDlQMjI3ZDdPVGc4Rkl3Yk5OLWxjR1E'
 PKGS_WS_NAME = 'Packages'
 DEPS_WS_NAME = 'Dependencies'
 
+# Directory in the cache dir for snapshots of what was last uploaded.
+SNAPSHOT_CACHE_DIR = 'package_status'
+
 oper = operation.Operation('upload_package_status')
 
 
+def _PrepNewRow(csv_row):
+  """Return |csv_row| as a dict keyed by spreadsheet column names."""
+  return dict((gdata_lib.PrepColNameForSS(key), csv_row[key])
+              for key in csv_row)
+
+
+def _IsChanged(old_val, new_val):
+  """Return True if a cell holding |old_val| needs to change to |new_val|."""
+  return bool((old_val or new_val) and old_val != new_val)
+
+
+class WorksheetSnapshot(object):
+  """On-disk record of what was last uploaded to one worksheet.
+
+  The snapshot maps each package to its spreadsheet row number and the values
+  uploaded for it, and remembers the last-updated timestamp of the worksheet
+  right after that upload.  As long as nobody else has touched the worksheet
+  since, the snapshot can stand in for downloading the whole worksheet.
+  """
+
+  def __init__(self, path):
+    """Initialize the snapshot, loading any existing one from |path|."""
+    self.path = path
+    self.updated = None
+    self.rows = {}
+    if os.path.exists(path):
+      try:
+        data = json.loads(osutils.ReadFile(path))
+        self.updated, self.rows = data['updated'], data['rows']
+      except (ValueError, KeyError, TypeError):
+        oper.Warning('Ignoring corrupt worksheet snapshot %s' % path)
+
+  def Save(self, updated, rows):
+    """Atomically replace the snapshot on disk.
+
+    Args:
+      updated: The last-updated timestamp of the worksheet.
+      rows: Dict mapping package to a [row number, row values dict] pair.
+    """
+    self.updated, self.rows = updated, rows
+    osutils.WriteFile(self.path, json.dumps(dict(updated=updated, rows=rows)),
+                      atomic=True, makedirs=True)
+
+
 class Uploader(object):
   """Uploads portage package status data from csv file to Google spreadsheet."""
 
@@ -29,17 +79,19 @@ class Uploader(object):
                '_scomm',          # gdata_lib.SpreadsheetComm object
                '_ss_row_cache',   # dict with key=pkg, val=SpreadsheetRow obj
                '_csv_table',      # table.Table of csv rows
+               '_snapshot_dir',   # Directory of WorksheetSnapshot files
                )
 
   ID_COL = utable.UpgradeTable.COL_PACKAGE
   SS_ID_COL = gdata_lib.PrepColNameForSS(ID_COL)
   SOURCE = 'Uploaded from CSV'
 
-  def __init__(self, creds, table_obj):
+  def __init__(self, creds, table_obj, snapshot_dir=None):
     self._creds = creds
     self._csv_table = table_obj
     self._scomm = None
     self._ss_row_cache = None
+    self._snapshot_dir = snapshot_dir
 
   def _GetSSRowForPackage(self, package):
     """Return the SpreadsheetRow corresponding to Package=|package|."""
@@ -68,15 +120,32 @@ class Uploader(object):
       self._scomm.Connect(self._creds, ss_key, ws_name,
                           source='Upload Package Status')
 
-    oper.Notice('Caching rows for worksheet %r.' % self._scomm.ws_name)
-    self._ss_row_cache = self._scomm.GetRowCacheByCol(self.SS_ID_COL)
+    snapshot = None
+    if self._snapshot_dir:
+      snapshot = WorksheetSnapshot(os.path.join(
+          self._snapshot_dir,
+          '%s-%s.json' % (self._scomm.ss_key, self._scomm.ws_name)))
+
+    rows_deleted, rows_with_owner_deleted = (0, 0)
+    counts = None
+    if snapshot:
+      counts = self._UploadFromSnapshot(snapshot)
+
+    if counts:
+      rows_unchanged, rows_updated, rows_inserted = counts
+    else:
+      oper.Notice('Caching rows for worksheet %r.' % self._scomm.ws_name)
+      self._ss_row_cache = self._scomm.GetRowCacheByCol(self.SS_ID_COL)
+
+      oper.Notice('Uploading changes to worksheet "%s" of spreadsheet "%s" '
+                  'now.' % (self._scomm.ws_name, self._scomm.ss_key))
 
-    oper.Notice('Uploading changes to worksheet "%s" of spreadsheet "%s" now.' %
-                (self._scomm.ws_name, self._scomm.ss_key))
+      oper.Info('Details by package: S=Same, C=Changed, A=Added, D=Deleted')
+      rows_unchanged, rows_updated, rows_inserted = self._UploadChangedRows()
+      rows_deleted, rows_with_owner_deleted = self._DeleteOldRows()
 
-    oper.Info('Details by package: S=Same, C=Changed, A=Added, D=Deleted')
-    rows_unchanged, rows_updated, rows_inserted = self._UploadChangedRows()
-    rows_deleted, rows_with_owner_deleted = self._DeleteOldRows()
+      if snapshot:
+        self._SaveSnapshot(snapshot)
 
     oper.Notice('Final row stats for worksheet "%s"'
                 ': %d changed, %d added, %d deleted, %d same.' %
@@ -88,6 +157,92 @@ class Uploader(object):
     else:
       oper.Notice('No rows with owner entry were deleted.')
 
+  def _UploadFromSnapshot(self, snapshot):
+    """Upload |_csv_table| by diffing it against |snapshot|.
+
+    This only works if the worksheet is unchanged since the snapshot was
+    taken and no rows need to be deleted, because deleting rows renumbers
+    the rows after them.
+
+    Returns:
+      A (rows_unchanged, rows_updated, rows_inserted) tuple, or None if the
+      snapshot could not be used.
+    """
+    if not snapshot.updated:
+      return None
+    if self._scomm.GetWorksheetUpdated() != snapshot.updated:
+      oper.Notice('Worksheet %r changed since last upload, comparing all rows.'
+                  % self._scomm.ws_name)
+      return None
+
+    csv_packages = [csv_row[self.ID_COL] for csv_row in self._csv_table]
+    if set(snapshot.rows).difference(csv_packages):
+      return None
+
+    oper.Notice('Uploading changes since last upload to worksheet "%s" of '
+                'spreadsheet "%s" now.' % (self._scomm.ws_name,
+                                           self._scomm.ss_key))
+    oper.Info('Details by package: S=Same, C=Changed, A=Added')
+
+    rows_unchanged, rows_updated, rows_inserted = (0, 0, 0)
+    rows = dict(snapshot.rows)
+    next_row_num = max([gdata_lib.SpreadsheetComm.ROW_NUMBER_OFFSET - 1] +
+                       [row_num for row_num, _ in rows.itervalues()]) + 1
+    for csv_row in self._csv_table:
+      csv_package = csv_row[self.ID_COL]
+      new_row = _PrepNewRow(csv_row)
+      if csv_package in rows:
+        row_num, old_row = rows[csv_package]
+        row_delta = dict((col, val) for col, val in new_row.iteritems()
+                         if _IsChanged(old_row.get(col), val))
+        if row_delta:
+          self._scomm.QueueRowUpdate(row_num,
+                                     gdata_lib.PrepRowForSS(row_delta))
+          rows_updated += 1
+          oper.Info('C %-30s: %s' % (csv_package, ', '.join(
+              '%s="%s"->"%s"' % (col, old_row.get(col), val)
+              for col, val in sorted(row_delta.iteritems()))))
+        else:
+          rows_unchanged += 1
+          oper.Info('S %-30s:' % csv_package)
+      else:
+        self._scomm.InsertRow(gdata_lib.PrepRowForSS(new_row))
+        rows_inserted += 1
+        oper.Info('A %-30s: %s' % (csv_package, ', '.join(
+            '%s="%s"' % (col, new_row[col]) for col in sorted(new_row)
+            if col != self.SS_ID_COL)))
+        row_num = next_row_num
+        next_row_num += 1
+      rows[csv_package] = [row_num, new_row]
+
+    if rows_updated or rows_inserted:
+      self._scomm.FlushCellUpdates()
+      snapshot.Save(self._scomm.GetWorksheetUpdated(), rows)
+
+    return (rows_unchanged, rows_updated, rows_inserted)
+
+  def _SaveSnapshot(self, snapshot):
+    """Save what a full upload left in the worksheet to |snapshot|.
+
+    After the upload the worksheet holds the rows that were already there and
+    are still in |_csv_table|, in their original order, followed by the
+    inserted rows in |_csv_table| order.
+    """
+    new_rows = dict((csv_row[self.ID_COL], _PrepNewRow(csv_row))
+                    for csv_row in self._csv_table)
+    kept = [package for _, package in sorted(
+        (row.ss_row_num, package)
+        for package, row in self._ss_row_cache.iteritems()
+        if package in new_rows and not isinstance(row, list))]
+    inserted = [csv_row[self.ID_COL] for csv_row in self._csv_table
+                if csv_row[self.ID_COL] not in self._ss_row_cache]
+
+    rows = {}
+    for row_num, package in enumerate(
+        kept + inserted, start=gdata_lib.SpreadsheetComm.ROW_NUMBER_OFFSET):
+      rows[package] = [row_num, new_rows[package]]
+    snapshot.Save(self._scomm.GetWorksheetUpdated(), rows)
+
   def _UploadChangedRows(self):
     """Upload all rows in table that need to be changed in spreadsheet."""
     rows_unchanged, rows_updated, rows_inserted = (0, 0, 0)
@@ -96,8 +251,7 @@ class Uploader(object):
     # column.  Either update existing row or create new one.
     for csv_row in self._csv_table:
       # Seed new row values from csv_row values, with column translation.
-      new_row = dict((gdata_lib.PrepColNameForSS(key),
-                      csv_row[key]) for key in csv_row)
+      new_row = _PrepNewRow(csv_row)
 
       # Retrieve row values already in spreadsheet, along with row index.
       csv_package = csv_row[self.ID_COL]
@@ -114,13 +268,13 @@ class Uploader(object):
           if col in ss_row:
             ss_val = ss_row[col]
             new_val = new_row[col]
-            if (ss_val or new_val) and ss_val != new_val:
+            if _IsChanged(ss_val, new_val):
               changed.append('%s="%s"->"%s"' % (col, ss_val, new_val))
               row_delta[col] = new_val
 
         if row_delta:
-          self._scomm.UpdateRowCellByCell(ss_row.ss_row_num,
-                                          gdata_lib.PrepRowForSS(row_delta))
+          self._scomm.QueueRowUpdate(ss_row.ss_row_num,
+                                     gdata_lib.PrepRowForSS(row_delta))
           rows_updated += 1
           oper.Info('C %-30s: %s' % (csv_package, ', '.join(changed)))
         else:
@@ -135,6 +289,10 @@ class Uploader(object):
             row_descr_list.append('%s="%s"' % (col, new_row[col]))
         oper.Info('A %-30s: %s' % (csv_package, ', '.join(row_descr_list)))
 
+    # Send all queued row changes now, before any rows are deleted and the
+    # queued row numbers become stale.
+    self._scomm.FlushCellUpdates()
+
     return (rows_unchanged, rows_updated, rows_inserted)
 
   def _DeleteOldRows(self):
@@ -226,6 +384,16 @@ def main(argv):
   parser.add_option('--password', dest='password', type='string',
                     action='store', default=None,
                     help='Password for Google Doc user')
+  parser.add_option('--no-snapshot', dest='snapshot_dir',
+                    action='store_const', const=None,
+                    help='Compare every row of the worksheet rather than '
+                    'the changes since the last upload.')
+  parser.add_option('--snapshot-dir', dest='snapshot_dir', type='string',
+                    action='store',
+                    default=os.path.join(commandline.GetCacheDir(),
+                                         SNAPSHOT_CACHE_DIR),
+                    help='Directory for snapshots of what was last uploaded '
+                    '[default: %default]')
   parser.add_option('--ss-key', dest='ss_key', type='string',
                     action='store', default=None,
                     help='Key of spreadsheet to upload to')
@@ -273,7 +441,7 @@ def main(argv):
   mps.FinalizeTable(csv_table)
 
   # Prepare the Google Doc client for uploading.
-  uploader = Uploader(creds, csv_table)
+  uploader = Uploader(creds, csv_table, snapshot_dir=options.snapshot_dir)
 
   ss_key = options.ss_key
   ws_names = [PKGS_WS_NAME, DEPS_WS_NAME]
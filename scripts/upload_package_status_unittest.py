@@ -7,6 +7,7 @@
 """Unit tests for cros_portage_upgrade.py."""
 
 import exceptions
+import os
 
 import mox
 
@@ -290,7 +291,7 @@ class UploaderTest(cros_test_lib.MoxOutputTestCase):
     g_col_set1 = set(row1_reverse_delta.keys())
     g_row1 = gdata_lib.PrepRowForSS(self.SS_ROW1)
     row1_verifier = lambda rdelta : RowVerifier(rdelta, g_col_set1, g_row1)
-    mocked_uploader._scomm.UpdateRowCellByCell(3, mox.Func(row1_verifier))
+    mocked_uploader._scomm.QueueRowUpdate(3, mox.Func(row1_verifier))
 
     # Third Row.
     # Pretend third row does already exist in online spreadsheet, and
@@ -309,7 +310,8 @@ class UploaderTest(cros_test_lib.MoxOutputTestCase):
     g_col_set2 = set(row2_reverse_delta.keys())
     g_row2 = gdata_lib.PrepRowForSS(self.SS_ROW2)
     row2_verifier = lambda rdelta : RowVerifier(rdelta, g_col_set2, g_row2)
-    mocked_uploader._scomm.UpdateRowCellByCell(4, mox.Func(row2_verifier))
+    mocked_uploader._scomm.QueueRowUpdate(4, mox.Func(row2_verifier))
+    mocked_uploader._scomm.FlushCellUpdates()
 
     self.mox.ReplayAll()
 
@@ -336,6 +338,118 @@ class UploaderTest(cros_test_lib.MoxOutputTestCase):
       ups.Uploader._DeleteOldRows(mocked_uploader)
     self.mox.VerifyAll()
 
+  def _CreateSnapshot(self, path, updated, rows):
+    """Create a WorksheetSnapshot at |path| holding |rows| in order."""
+    snapshot = ups.WorksheetSnapshot(path)
+    snapshot.Save(updated, dict(
+        (row[self.COL_PKG], [row_num, dict(row_ss)])
+        for row_num, (row, row_ss) in enumerate(rows, start=2)))
+    return ups.WorksheetSnapshot(path)
+
+  @osutils.TempDirDecorator
+  def testUploadFromSnapshotUnchanged(self):
+    """Test that an unchanged rerun only checks the worksheet timestamp."""
+    mocked_uploader = self._MockUploader()
+    snapshot = self._CreateSnapshot(
+        os.path.join(self.tempdir, 'snap.json'), 'T1',
+        [(self.ROW0, self.SS_ROW0), (self.ROW1, self.SS_ROW1)])
+
+    mocked_uploader._scomm.GetWorksheetUpdated().AndReturn('T1')
+    self.mox.ReplayAll()
+
+    with self.OutputCapturer():
+      result = ups.Uploader._UploadFromSnapshot(mocked_uploader, snapshot)
+    self.mox.VerifyAll()
+    self.assertEquals(result, (2, 0, 0))
+
+  @osutils.TempDirDecorator
+  def testUploadFromSnapshotChanged(self):
+    """Test that only changed and new rows are uploaded."""
+    table = self._CreateTableWithRows(self.COLS,
+                                      [self.ROW0, self.ROW1, self.ROW2])
+    mocked_uploader = self._MockUploader(table=table)
+    path = os.path.join(self.tempdir, 'snap.json')
+    old_ss_row1 = dict(self.SS_ROW1)
+    old_ss_row1[self.SS_COL_VER] = '1.2.2'
+    snapshot = self._CreateSnapshot(
+        path, 'T1', [(self.ROW0, self.SS_ROW0), (self.ROW1, old_ss_row1)])
+
+    mocked_uploader._scomm.GetWorksheetUpdated().AndReturn('T1')
+    mocked_uploader._scomm.QueueRowUpdate(
+        3, {self.SS_COL_VER: self.ROW1[self.COL_VER]})
+    mocked_uploader._scomm.InsertRow(gdata_lib.PrepRowForSS(self.SS_ROW2))
+    mocked_uploader._scomm.FlushCellUpdates()
+    mocked_uploader._scomm.GetWorksheetUpdated().AndReturn('T2')
+    self.mox.ReplayAll()
+
+    with self.OutputCapturer():
+      result = ups.Uploader._UploadFromSnapshot(mocked_uploader, snapshot)
+    self.mox.VerifyAll()
+    self.assertEquals(result, (1, 1, 1))
+
+    snapshot = ups.WorksheetSnapshot(path)
+    self.assertEquals(snapshot.updated, 'T2')
+    self.assertEquals(snapshot.rows[self.ROW1[self.COL_PKG]],
+                      [3, self.SS_ROW1])
+    self.assertEquals(snapshot.rows[self.ROW2[self.COL_PKG]],
+                      [4, self.SS_ROW2])
+
+  @osutils.TempDirDecorator
+  def testUploadFromSnapshotStale(self):
+    """Test that the snapshot is not used if the worksheet changed."""
+    mocked_uploader = self._MockUploader()
+    snapshot = self._CreateSnapshot(
+        os.path.join(self.tempdir, 'snap.json'), 'T1',
+        [(self.ROW0, self.SS_ROW0), (self.ROW1, self.SS_ROW1)])
+
+    mocked_uploader._scomm.GetWorksheetUpdated().AndReturn('T2')
+    self.mox.ReplayAll()
+
+    with self.OutputCapturer():
+      result = ups.Uploader._UploadFromSnapshot(mocked_uploader, snapshot)
+    self.mox.VerifyAll()
+    self.assertEquals(result, None)
+
+  @osutils.TempDirDecorator
+  def testUploadFromSnapshotDeletes(self):
+    """Test that the snapshot is not used if rows must be deleted."""
+    mocked_uploader = self._MockUploader()
+    snapshot = self._CreateSnapshot(
+        os.path.join(self.tempdir, 'snap.json'), 'T1',
+        [(self.ROW0, self.SS_ROW0), (self.ROW1, self.SS_ROW1),
+         (self.ROW2, self.SS_ROW2)])
+
+    mocked_uploader._scomm.GetWorksheetUpdated().AndReturn('T1')
+    self.mox.ReplayAll()
+
+    result = ups.Uploader._UploadFromSnapshot(mocked_uploader, snapshot)
+    self.mox.VerifyAll()
+    self.assertEquals(result, None)
+
+  @osutils.TempDirDecorator
+  def testSaveSnapshot(self):
+    """Test the row numbers recorded after a full upload."""
+    # The worksheet had ROW2 then ROW1; ROW2 was deleted and ROW0 added.
+    mocked_uploader = self._MockUploader()
+    mocked_uploader._ss_row_cache = {
+        self.ROW2[self.COL_PKG]: gdata_lib.SpreadsheetRow('Orig2', 2, {}),
+        self.ROW1[self.COL_PKG]: gdata_lib.SpreadsheetRow('Orig1', 3, {}),
+    }
+    path = os.path.join(self.tempdir, 'snap.json')
+
+    mocked_uploader._scomm.GetWorksheetUpdated().AndReturn('T3')
+    self.mox.ReplayAll()
+
+    ups.Uploader._SaveSnapshot(mocked_uploader, ups.WorksheetSnapshot(path))
+    self.mox.VerifyAll()
+
+    snapshot = ups.WorksheetSnapshot(path)
+    self.assertEquals(snapshot.updated, 'T3')
+    self.assertEquals(snapshot.rows, {
+        self.ROW1[self.COL_PKG]: [2, self.SS_ROW1],
+        self.ROW0[self.COL_PKG]: [3, self.SS_ROW0],
+    })
+
 
 class MainTest(cros_test_lib.MoxOutputTestCase):
   """Test argument handling at the main method level."""